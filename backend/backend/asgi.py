@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+# Under ASGI, serve the native async views (see ASYNC_VIEWS in settings.py)
+os.environ.setdefault('BACKEND_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
@@ -0,0 +1,107 @@
+"""
+A small base class for native async API views.
+
+DRF's APIView only dispatches synchronously, so under ASGI every DRF
+request is run on a worker thread. ``AsyncAPIView`` is a plain Django async
+view that keeps the parts of DRF the frontend relies on: session
+authentication with CSRF enforced for logged-in users, throttle classes,
+JSON or form request bodies, the same JSON rendering and the same error
+payloads for ``APIException`` and ``Http404``.
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, status
+from rest_framework.authentication import CSRFCheck
+from rest_framework.renderers import JSONRenderer
+
+
+def _csrf_failure(request):
+    """
+    The reason CSRF validation fails for ``request``, or None. Same check as
+    DRF's SessionAuthentication.
+    """
+    check = CSRFCheck(lambda request: None)
+    check.process_request(request)
+    return check.process_view(request, None, (), {})
+
+
+class AsyncAPIView(View):
+    require_authentication = False
+    throttle_classes = ()
+    renderer = JSONRenderer()
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # As with DRF, CSRF is checked in dispatch() for authenticated requests only
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        # Same name as on DRF's Request, so helpers shared with the DRF views work with both
+        request.query_params = request.GET
+        try:
+            # Before the session is read, so refused requests cost no queries
+            await self.check_throttles(request)
+            self.user = await request.auser()
+            if self.user.is_authenticated:
+                reason = await sync_to_async(_csrf_failure)(request)
+                if reason:
+                    raise exceptions.PermissionDenied(f'CSRF Failed: {reason}')
+            elif self.require_authentication:
+                raise exceptions.NotAuthenticated()
+            return await super().dispatch(request, *args, **kwargs)
+        except Exception as exc:
+            return self.handle_exception(exc)
+
+    async def check_throttles(self, request):
+        """
+        Raise Throttled if any of ``throttle_classes`` refuses the request,
+        as DRF's APIView.check_throttles does.
+        """
+        waits = []
+        for throttle_class in self.throttle_classes:
+            throttle = throttle_class()
+            if not await sync_to_async(throttle.allow_request)(request, self):
+                waits.append(throttle.wait())
+        if waits:
+            waits = [wait for wait in waits if wait is not None]
+            raise exceptions.Throttled(max(waits, default=None))
+
+    def handle_exception(self, exc):
+        """
+        Turn ``exc`` into an error response the way DRF's default handler does,
+        or re-raise it.
+        """
+        if isinstance(exc, Http404):
+            exc = exceptions.NotFound(*exc.args)
+        if not isinstance(exc, exceptions.APIException):
+            raise exc
+        if isinstance(exc.detail, (list, dict)):
+            data = exc.detail
+        else:
+            data = {'detail': exc.detail}
+        # Session auth has no WWW-Authenticate challenge, so DRF answers 403 here too
+        code = status.HTTP_403_FORBIDDEN if isinstance(exc, exceptions.NotAuthenticated) else exc.status_code
+        response = self.respond(data, status=code)
+        if getattr(exc, 'wait', None):
+            response['Retry-After'] = '%d' % exc.wait
+        return response
+
+    def get_data(self, request):
+        """
+        The parsed request body: JSON, or form data for anything else.
+        """
+        if request.content_type != 'application/json':
+            return request.POST
+        try:
+            return json.loads(request.body or b'{}')
+        except ValueError as e:
+            raise exceptions.ParseError(f'JSON parse error - {e}')
+
+    def respond(self, data, status=status.HTTP_200_OK):
+        if data is None:
+            return HttpResponse(status=status)
+        return HttpResponse(self.renderer.render(data), status=status, content_type='application/json')
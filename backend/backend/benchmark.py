@@ -0,0 +1,166 @@
+"""
+In-process benchmark harness for the API.
+
+Requests go through the full Django stack (middleware, DRF, the ORM and the
+configured database) via the test ``Client``, without a network server, so
+numbers are comparable between commits on the same machine. Run it with
+``manage.py benchmark`` against a database filled by ``manage.py
+seed_recipes``; point RECIPES_DB_PATH at a scratch file to keep benchmark
+data out of your development database.
+"""
+import contextlib
+import io
+import json
+import math
+import platform
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import django
+from django.test import Client
+
+
+def percentile(samples, pct):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not samples:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(samples)))
+    return samples[rank - 1]
+
+
+class Scenario:
+    """
+    One named request pattern. ``request(client, iteration)`` issues a single
+    request and returns the response.
+    """
+    def __init__(self, name, request, expected_status=200, login=True):
+        self.name = name
+        self.request = request
+        self.expected_status = expected_status
+        self.login = login
+
+
+def default_scenarios(recipe_ids):
+    """
+    The standard set: list, detail, create, login and /api/users/me/.
+    """
+    def list_recipes(client, i):
+        return client.get('/api/recipes/')
+
+    def recipe_detail(client, i):
+        return client.get(f'/api/recipes/{recipe_ids[i % len(recipe_ids)]}/')
+
+    def create_recipe(client, i):
+        return client.post('/api/recipes/', {
+            'title': f'Benchmark recipe {i}',
+            'ingredients': '2 eggs\n1 cup flour\n1 cup milk',
+            'instructions': 'Whisk everything together.\nFry in a hot pan.',
+            'cuisine_type': 'French',
+        }, content_type='application/json')
+
+    def current_user(client, i):
+        return client.get('/api/users/me/')
+
+    return [
+        Scenario('list', list_recipes),
+        Scenario('detail', recipe_detail),
+        Scenario('create', create_recipe, expected_status=201),
+        Scenario('login', None, login=False),
+        Scenario('me', current_user),
+    ]
+
+
+class Benchmark:
+    def __init__(self, username, password, iterations=200, warmup=10, concurrency=1):
+        self.username = username
+        self.password = password
+        self.iterations = iterations
+        self.warmup = warmup
+        self.concurrency = concurrency
+
+    def make_client(self, login=True):
+        client = Client()
+        if login and not client.login(username=self.username, password=self.password):
+            raise RuntimeError(f'Could not log in as {self.username!r}.')
+        return client
+
+    def login_request(self, client, i):
+        return client.post('/api/users/login/', {
+            'username': self.username, 'password': self.password,
+        }, content_type='application/json')
+
+    def run_scenario(self, scenario):
+        request = scenario.request or self.login_request
+        local = threading.local()
+
+        def one(i):
+            client = getattr(local, 'client', None)
+            if client is None:
+                client = local.client = self.make_client(login=scenario.login)
+            started = time.perf_counter()
+            response = request(client, i)
+            elapsed = time.perf_counter() - started
+            return elapsed, response.status_code == scenario.expected_status
+
+        for i in range(self.warmup):
+            one(i)
+
+        started = time.perf_counter()
+        if self.concurrency > 1:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+                results = list(pool.map(one, range(self.iterations)))
+        else:
+            results = [one(i) for i in range(self.iterations)]
+        wall = time.perf_counter() - started
+
+        latencies = sorted(elapsed * 1000 for elapsed, _ in results)
+        return {
+            'requests': len(results),
+            'errors': sum(1 for _, ok in results if not ok),
+            'mean_ms': round(sum(latencies) / len(latencies), 3),
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p95_ms': round(percentile(latencies, 95), 3),
+            'p99_ms': round(percentile(latencies, 99), 3),
+            'max_ms': round(latencies[-1], 3),
+            'throughput_rps': round(len(results) / wall, 2) if wall else None,
+        }
+
+    def run(self, scenarios, quiet=True):
+        results = {}
+        for scenario in scenarios:
+            # Keep stray prints from the views out of the report
+            with contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext():
+                results[scenario.name] = self.run_scenario(scenario)
+        return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_report(results, **context):
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'platform': platform.platform(),
+        **context,
+        'scenarios': results,
+    }
+
+
+def write_report(report, path):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+        f.write('\n')
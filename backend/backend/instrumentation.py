@@ -0,0 +1,251 @@
+"""
+Per-request SQL and timing instrumentation.
+
+``RequestStatsMiddleware`` counts the queries a request runs and the time
+spent in the database, serializing and rendering. The numbers
+go out in a ``Server-Timing`` header (visible in the browser's network tab)
+and in one structured log line per request on the ``backend.requests``
+logger.
+
+Views can declare a query budget, either a number or a dict keyed by
+viewset action::
+
+    class RecipeViewSet(viewsets.ModelViewSet):
+        query_budget = {'list': 3, 'retrieve': 3}
+
+The budget covers the queries run from the moment the view is called until
+it returns, including the session and user lookups that authentication
+triggers lazily. Going over it logs a warning, or raises when
+``settings.QUERY_BUDGET_STRICT`` is on. Tests can check a response against
+its view's budget with ``backend.testing.QueryBudgetMixin``.
+"""
+import contextvars
+import logging
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger('backend.requests')
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class RequestStats:
+    """
+    Query counter and timing accumulator attached to a request as ``request.stats``.
+    Also serves as the database execute wrapper.
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.timings = {}
+        self.view_name = None
+        self.budget = None
+        self.view_started = None
+        self.view_queries = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - start
+
+    def add_timing(self, name, seconds):
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    def end_view(self):
+        """
+        Close the view's query window (only the first call counts).
+        """
+        if self.view_started is not None and self.view_queries is None:
+            self.view_queries = self.queries - self.view_started
+
+    @property
+    def over_budget(self):
+        return (
+            self.budget is not None and self.view_queries is not None
+            and self.view_queries > self.budget
+        )
+
+
+def get_stats(request):
+    # DRF wraps the Django request; the stats live on the original
+    request = getattr(request, '_request', request)
+    return getattr(request, 'stats', None)
+
+
+@contextmanager
+def timer(request, name):
+    """
+    Time a block of work and report it under ``name`` for this request:
+
+        with instrumentation.timer(request, 'serialize'):
+            data = serializer.data
+    """
+    stats = get_stats(request)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if stats is not None:
+            stats.add_timing(name, time.perf_counter() - start)
+
+
+def get_query_budget(view_func, request):
+    """
+    Look up the budget declared by the view behind ``view_func``, if any.
+    """
+    cls = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+    budget = getattr(cls, 'query_budget', None)
+    if isinstance(budget, dict):
+        # ViewSet.as_view() keeps the method -> action mapping on the function;
+        # other class-based views key their budgets by method
+        actions = getattr(view_func, 'actions', None) or {}
+        method = request.method.lower()
+        budget = budget.get(actions.get(method, method))
+    return budget
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 2)
+
+
+_current_stats = contextvars.ContextVar('request_stats', default=None)
+
+
+def count_query(execute, sql, params, many, context):
+    """
+    Execute wrapper installed on every connection, counting into the
+    RequestStats of the request being served, if any.
+    """
+    stats = _current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats(execute, sql, params, many, context)
+
+
+def install_query_counter(connection, **kwargs):
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+def install_query_counters():
+    # Connections belong to a thread; this hooks every alias of the calling one
+    for connection in connections.all():
+        install_query_counter(connection)
+
+
+# Hook connections as they are opened in any thread, such as sync_to_async()'s
+connection_created.connect(install_query_counter)
+
+
+class RequestStatsMiddleware:
+    """
+    Keep this near the top of MIDDLEWARE so the numbers cover the whole stack.
+
+    Runs natively under both WSGI and ASGI. The stats are found through a
+    context variable, which sync_to_async() carries into the thread that
+    runs the ORM, and process_view() hooks that thread's connections.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = request.stats = RequestStats()
+        install_query_counters()
+        token = _current_stats.set(stats)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_stats.reset(token)
+        return self.finish(request, response, stats)
+
+    async def __acall__(self, request):
+        stats = request.stats = RequestStats()
+        token = _current_stats.set(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_stats.reset(token)
+        return self.finish(request, response, stats)
+
+    def finish(self, request, response, stats):
+        stats.end_view()
+        total = time.perf_counter() - stats.started
+
+        response['Server-Timing'] = self.server_timing(stats, total)
+        self.log(request, response, stats, total)
+        if stats.over_budget:
+            message = (
+                f'{stats.view_name} ran {stats.view_queries} queries, '
+                f'over its budget of {stats.budget}'
+            )
+            if getattr(settings, 'QUERY_BUDGET_STRICT', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Under ASGI Django runs this in the thread the view's queries will use
+        install_query_counters()
+        stats = request.stats
+        stats.view_name = f'{view_func.__module__}.{view_func.__qualname__}'
+        cls = getattr(view_func, 'cls', None)
+        if cls is not None:
+            stats.view_name = f'{cls.__module__}.{cls.__qualname__}'
+        stats.budget = get_query_budget(view_func, request)
+        stats.view_started = stats.queries
+        return None
+
+    def process_template_response(self, request, response):
+        # DRF responses render after this hook: stop counting view queries
+        # here and time the rendering separately.
+        stats = request.stats
+        stats.end_view()
+        render_started = time.perf_counter()
+
+        def record_render(rendered):
+            stats.add_timing('render', time.perf_counter() - render_started)
+
+        response.add_post_render_callback(record_render)
+        return response
+
+    def server_timing(self, stats, total):
+        parts = [f'db;dur={_ms(stats.db_time)};desc="{stats.queries} queries"']
+        parts.extend(f'{name};dur={_ms(seconds)}' for name, seconds in stats.timings.items())
+        parts.append(f'total;dur={_ms(total)}')
+        return ', '.join(parts)
+
+    def log(self, request, response, stats, total):
+        if not logger.isEnabledFor(logging.INFO):
+            return
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'view': stats.view_name,
+            'queries': stats.queries,
+            'view_queries': stats.view_queries,
+            'query_budget': stats.budget,
+            'db_ms': _ms(stats.db_time),
+            'total_ms': _ms(total),
+        }
+        record.update({f'{name}_ms': _ms(seconds) for name, seconds in stats.timings.items()})
+        # Serialized by the log formatter, off the request thread (see backend/log.py)
+        logger.info('%s %s %s', request.method, request.path, response.status_code, extra=record)
@@ -0,0 +1,263 @@
+"""
+Structured logging that stays off the request path.
+
+``BackgroundHandler`` hands records to a queue that a listener thread
+formats and writes, so a slow terminal or disk never holds up a response.
+Filters still run in the logging thread, before a record is queued:
+
+- ``RequestIdFilter`` stamps records with the id of the current request,
+  set by ``RequestIdMiddleware`` (from an incoming ``X-Request-ID`` or a
+  new one) and echoed back in the response header.
+- ``SamplingFilter`` keeps a share of a logger's records below WARNING.
+  The choice is made per request id, so a sampled request keeps all of
+  its lines.
+- ``RedactingFilter`` masks cookies, session keys, CSRF tokens and
+  passwords, in the message and in ``extra`` fields, so they never reach
+  the queue.
+
+``JsonFormatter`` writes one JSON object per line, with the fields passed
+through ``extra`` at the top level:
+
+    logger.info('Login succeeded', extra={'user_id': user.id})
+
+Values the client typed that can't be redacted by pattern, such as the
+username of a failed login (often a mistyped password or an email
+address), are logged as a ``pseudonym()``: enough to see the same value
+coming back, without the value itself.
+
+When the queue is full (``LOG_QUEUE_SIZE``) records are dropped and
+counted under ``logging.dropped`` rather than blocking the request.
+"""
+import contextvars
+import copy
+import functools
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import uuid
+import zlib
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.utils.crypto import salted_hmac
+
+from backend import metrics
+
+_request_id = contextvars.ContextVar('request_id', default=None)
+
+_REQUEST_ID_RE = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+
+def get_request_id():
+    return _request_id.get()
+
+
+def pseudonym(value):
+    """
+    A short keyed hash of ``value`` for log lines; keyed with SECRET_KEY so
+    it can't be reversed by hashing guesses.
+    """
+    if value is None:
+        return None
+    return salted_hmac('backend.log.pseudonym', str(value).strip().lower()).hexdigest()[:16]
+
+
+class RequestIdMiddleware:
+    """
+    Keep this first in MIDDLEWARE so every line logged for a request,
+    including the request log line itself, carries its id.
+    """
+    header = 'X-Request-ID'
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _set_id(self, request):
+        request_id = request.headers.get(self.header, '')
+        if not _REQUEST_ID_RE.match(request_id):
+            request_id = uuid.uuid4().hex
+        request.id = request_id
+        return _request_id.set(request_id)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = self._set_id(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_id.reset(token)
+        response[self.header] = request.id
+        return response
+
+    async def __acall__(self, request):
+        # Code run through sync_to_async() copies the context, so it sees the id too
+        token = self._set_id(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_id.reset(token)
+        response[self.header] = request.id
+        return response
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = _request_id.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Pass ``rate`` (0 to 1) of the records below ``level``.
+    """
+    def __init__(self, rate=1.0, level='WARNING'):
+        super().__init__()
+        self.rate = float(rate)
+        self.level = logging.getLevelName(level) if isinstance(level, str) else level
+
+    def filter(self, record):
+        if self.rate >= 1 or record.levelno >= self.level:
+            return True
+        request_id = _request_id.get()
+        if request_id is None:
+            return uuid.uuid4().int % 10000 < self.rate * 10000
+        return zlib.crc32(request_id.encode('ascii')) / 0xffffffff < self.rate
+
+
+REDACTED = '[redacted]'
+
+# Field names whose values are masked; matched as substrings, case-insensitively
+SENSITIVE_KEYS = ('cookie', 'session', 'csrf', 'password', 'token', 'secret', 'authorization')
+
+_SENSITIVE_PAIR_RE = re.compile(
+    r'''(?P<key>[\w-]*(?:%s)[\w-]*)(?P<sep>['"]?\s*[:=]\s*['"]?)(?P<value>[^'"\s;,&}]+)'''
+    % '|'.join(SENSITIVE_KEYS),
+    re.IGNORECASE,
+)
+
+# Attributes every LogRecord has; anything else came in through ``extra``
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+
+_SENSITIVE_KEY_RE = re.compile('|'.join(SENSITIVE_KEYS), re.IGNORECASE)
+
+
+@functools.lru_cache(maxsize=1024)
+def _is_sensitive(key):
+    # Cached: the same few extra and dict keys come up on every record
+    return _SENSITIVE_KEY_RE.search(str(key)) is not None
+
+
+def redact(value):
+    """
+    A copy of ``value`` with sensitive entries of dicts (at any depth) and
+    ``key=value`` pairs in strings masked.
+    """
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        return _SENSITIVE_PAIR_RE.sub(lambda m: f'{m["key"]}{m["sep"]}{REDACTED}', value)
+    if isinstance(value, dict):
+        return {key: REDACTED if _is_sensitive(key) else redact(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(redact(item) for item in value)
+    return value
+
+
+class RedactingFilter(logging.Filter):
+    def filter(self, record):
+        # Render the message here: its arguments may be live objects such as request.COOKIES
+        record.msg = redact(record.getMessage())
+        record.args = None
+        for key in vars(record).keys() - _RECORD_ATTRS:
+            setattr(record, key, REDACTED if _is_sensitive(key) else redact(getattr(record, key)))
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                data[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data['exc'] = record.exc_text
+        return json.dumps(data, default=str)
+
+
+class BackgroundHandler(QueueHandler):
+    """
+    Queue records for a listener thread that formats them with this
+    handler's formatter and writes them to ``stream`` (stderr by default).
+    """
+    def __init__(self, stream=None, maxsize=10000):
+        super().__init__(queue.Queue(maxsize))
+        self.target = logging.StreamHandler(stream)
+        self._listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def setFormatter(self, fmt):
+        super().setFormatter(fmt)
+        self.target.setFormatter(fmt)
+
+    def _ensure_listener(self):
+        # Started lazily, and again in a forked child, which has no copy of the thread
+        if self._pid != os.getpid():
+            with self._start_lock:
+                if self._pid != os.getpid():
+                    self._listener = QueueListener(self.queue, self.target)
+                    self._listener.start()
+                    self._pid = os.getpid()
+
+    def prepare(self, record):
+        # Unlike QueueHandler.prepare(), leave the formatting to the listener thread;
+        # only freeze what could change or hold on to frames once queued
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.incr('logging.dropped')
+
+    def emit(self, record):
+        self._ensure_listener()
+        super().emit(record)
+
+    def flush(self):
+        """
+        Wait until every queued record has been written.
+        """
+        if self._listener is not None and self._pid == os.getpid():
+            self._listener.stop()
+            self._listener = None
+            self._pid = None
+        self.target.flush()
+
+    def close(self):
+        self.flush()
+        self.target.close()
+        super().close()
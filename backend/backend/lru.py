@@ -0,0 +1,86 @@
+"""
+A small thread-safe LRU map with optional per-entry time-to-live.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class LRUCache:
+    def __init__(self, max_entries, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def get(self, key, default=None):
+        """
+        Return the live value for ``key`` and mark it most recently used.
+        """
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            value, stored_at = entry
+            if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def replace(self, key, value):
+        """
+        Replace the value of a live entry but keep its age, so updating an
+        entry doesn't extend how long it is trusted. Returns False, and
+        stores nothing, when there is no live entry for ``key``.
+        """
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return False
+            if self.ttl is not None and time.monotonic() - entry[1] > self.ttl:
+                del self._data[key]
+                return False
+            self._data[key] = (value, entry[1])
+            self._data.move_to_end(key)
+            return True
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+        return default if entry is _MISSING else entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def prune(self, predicate=None):
+        """
+        Drop entries past their TTL, and those for which ``predicate(key, value)``
+        is true. Returns the number of entries removed.
+        """
+        now = time.monotonic()
+        with self._lock:
+            doomed = [
+                key for key, (value, stored_at) in self._data.items()
+                if (self.ttl is not None and now - stored_at > self.ttl)
+                or (predicate is not None and predicate(key, value))
+            ]
+            for key in doomed:
+                del self._data[key]
+        return len(doomed)
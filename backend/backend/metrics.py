@@ -0,0 +1,46 @@
+"""
+In-process counters for cache hits, rejections and other cheap events.
+
+Counters live in process memory, so each worker reports its own numbers;
+they are meant for spotting whether a mechanism works at all, not for
+long-term monitoring.
+"""
+import threading
+from collections import Counter
+
+from rest_framework import permissions
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+_lock = threading.Lock()
+_counters = Counter()
+
+
+def incr(name, value=1):
+    with _lock:
+        _counters[name] += value
+
+
+def get(name):
+    with _lock:
+        return _counters[name]
+
+
+def snapshot():
+    with _lock:
+        return dict(sorted(_counters.items()))
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+
+
+class MetricsView(APIView):
+    """
+    Dump this process's counters. Staff only.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(snapshot())
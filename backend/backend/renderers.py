@@ -0,0 +1,69 @@
+"""
+A faster drop-in for DRF's JSONRenderer.
+
+``FastJSONRenderer`` produces exactly the bytes JSONRenderer does, with
+the default UNICODE_JSON and COMPACT_JSON settings, but encodes with
+orjson when it is installed. Without orjson it reuses one stdlib encoder
+instead of building one per response. Pretty-printed output (``indent=``
+in the Accept header, or the browsable API) is left to JSONRenderer.
+
+orjson escapes strings the way the json module does with
+``ensure_ascii=False``, and \\u2028/\\u2029 are escaped afterwards as
+JSONRenderer does. Data orjson can't encode the same way (integers over
+64 bits, non-string keys) falls back to the json module. Floats are the
+exception: orjson writes some of them differently ('1e-5' for '1e-05'),
+so only use this renderer for views whose payloads hold none, such as the
+recipe list and detail responses.
+"""
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Give datetimes and dataclasses to DRF's encoder, which formats them differently from orjson
+_ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS if orjson else 0
+_default = encoders.JSONEncoder().default
+
+_LINE_SEPARATOR = '\u2028'.encode('utf-8')
+_PARAGRAPH_SEPARATOR = '\u2029'.encode('utf-8')
+
+
+def escape_separators(content):
+    """
+    Escape U+2028 and U+2029 in encoded JSON, which JavaScript string literals can't hold.
+    """
+    # Both start with these bytes; most responses have neither
+    if b'\xe2\x80' not in content:
+        return content
+    return content.replace(_LINE_SEPARATOR, b'\\u2028').replace(_PARAGRAPH_SEPARATOR, b'\\u2029')
+
+
+class FastJSONRenderer(JSONRenderer):
+    _encoder = None
+
+    def get_encoder(self):
+        if self._encoder is None:
+            # check_circular only changes how a cycle fails
+            type(self)._encoder = self.encoder_class(
+                ensure_ascii=False, allow_nan=not self.strict, separators=(',', ':'), check_circular=False,
+            )
+        return self._encoder
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if (
+            self.ensure_ascii or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        if orjson is not None:
+            try:
+                return escape_separators(orjson.dumps(data, default=_default, option=_ORJSON_OPTIONS))
+            except TypeError:
+                # orjson.JSONEncodeError: let the json module encode it, or fail as JSONRenderer would
+                pass
+        return escape_separators(self.get_encoder().encode(data).encode('utf-8'))
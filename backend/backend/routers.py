@@ -0,0 +1,59 @@
+"""
+Database router that sends reads to a read-only connection.
+
+With SQLite in WAL mode, readers and the writer no longer block each other,
+but only if they use separate connections: a connection with an open write
+transaction still serializes everything that goes through it. Reads of the
+apps in ``READ_ROUTED_APPS`` (recipes, users and sessions by default) go
+to the ``READ_DATABASE_ALIAS`` connection, a second connection to the same
+file opened with ``PRAGMA query_only``. Everything else, and every write,
+uses 'default'.
+
+Both aliases open the same file, so there is no replication lag: a read
+sees everything committed before it started. Inside a transaction on
+'default', reads stay on 'default' so they see that transaction's own
+uncommitted writes. An in-memory database (as the test runner uses) can
+only be shared through SQLite's table-locked shared cache, so with one
+everything stays on 'default'.
+"""
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class ReadReplicaRouter:
+    def _read_alias(self):
+        alias = getattr(settings, 'READ_DATABASE_ALIAS', None)
+        return alias if alias in settings.DATABASES else None
+
+    def _routes_reads(self):
+        default = connections[DEFAULT_DB_ALIAS]
+        if default.vendor == 'sqlite' and default.is_in_memory_db():
+            return False
+        return not default.in_atomic_block
+
+    def db_for_read(self, model, **hints):
+        alias = self._read_alias()
+        if alias is None or model._meta.app_label not in getattr(settings, 'READ_ROUTED_APPS', ()):
+            return None
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # Follow relations on the connection the instance came from
+            return instance._state.db
+        if not self._routes_reads():
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases are the same database
+        aliases = {DEFAULT_DB_ALIAS, self._read_alias()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == self._read_alias():
+            return False
+        return None
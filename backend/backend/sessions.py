@@ -0,0 +1,228 @@
+"""
+Database-backed sessions with an in-process read-through cache.
+
+Use with ``SESSION_ENGINE = 'backend.sessions'``. Compared with
+``django.contrib.sessions.backends.db``:
+
+* Reads are served from a per-process LRU (``SESSION_CACHE_MAX_ENTRIES``
+  entries, each trusted for ``SESSION_CACHE_TTL`` seconds) and only fall
+  through to the ``django_session`` table on a miss.
+* A save whose data is unchanged only moves the expiry date forward. With
+  ``CSRF_USE_SESSIONS`` that is what most requests do, so instead of an
+  UPDATE per request the new expiry is queued and written in one batch
+  every ``SESSION_WRITE_FLUSH_INTERVAL`` seconds. Losing a queued expiry
+  only means the session ends at its previous, still valid, expiry date.
+* A background thread flushes those writes and deletes expired sessions
+  every ``SESSION_SWEEP_INTERVAL`` seconds.
+
+Deleting a session (logout, flush, cycle_key, ChangePasswordView's logout)
+writes to the database immediately, drops the cached copy and leaves a
+revocation marker in the ``SESSION_REVOCATION_CACHE_ALIAS`` cache. Other
+processes check that marker before trusting their cached copy, so a
+revoked session is refused everywhere at once. That needs a cache every
+process sees (the file-based 'shared' cache in settings); when the alias
+is unset or names a per-process cache, the read cache is off and every
+load reads the table. Expiry-only saves update a cached copy without
+resetting its age, so a copy is never trusted for more than
+SESSION_CACHE_TTL seconds after it was read from the table.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore as DBStore
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from backend import metrics
+from backend.lru import LRUCache
+
+logger = logging.getLogger(__name__)
+
+REVOKED_KEY_PREFIX = 'session:revoked:'
+
+_cache = LRUCache(
+    getattr(settings, 'SESSION_CACHE_MAX_ENTRIES', 10000),
+    ttl=getattr(settings, 'SESSION_CACHE_TTL', 60),
+)
+_pending_expiry = {}
+_pending_lock = threading.Lock()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def _revocations():
+    alias = getattr(settings, 'SESSION_REVOCATION_CACHE_ALIAS', None)
+    return caches[alias] if alias else None
+
+
+def _read_cache_enabled():
+    # A marker only this process can see would leave other processes trusting their copies
+    revocations = _revocations()
+    return revocations is not None and not isinstance(revocations, (LocMemCache, DummyCache))
+
+
+def _is_revoked(session_key):
+    revocations = _revocations()
+    return revocations is not None and revocations.get(REVOKED_KEY_PREFIX + session_key) is not None
+
+
+def _revoke(session_key):
+    _cache.pop(session_key)
+    with _pending_lock:
+        _pending_expiry.pop(session_key, None)
+    revocations = _revocations()
+    if revocations is not None:
+        # Long enough for every process's cached copy to have expired
+        revocations.set(REVOKED_KEY_PREFIX + session_key, 1, timeout=_cache.ttl or 300)
+
+
+def flush_pending_writes():
+    """
+    Write the queued expiry-only updates. Returns how many were written.
+    """
+    from django.contrib.sessions.models import Session
+
+    with _pending_lock:
+        pending = dict(_pending_expiry)
+        _pending_expiry.clear()
+    if not pending:
+        return 0
+    using = router.db_for_write(Session)
+    with transaction.atomic(using=using):
+        for session_key, expire_date in pending.items():
+            # Only ever move the expiry forward, never resurrect a deleted row
+            Session.objects.using(using).filter(
+                session_key=session_key, expire_date__lt=expire_date,
+            ).update(expire_date=expire_date)
+    metrics.incr('session_cache.flushed_writes', len(pending))
+    return len(pending)
+
+
+def sweep():
+    """
+    Flush queued writes, then delete expired sessions from the table and the cache.
+    """
+    flush_pending_writes()
+    SessionStore.clear_expired()
+    now = timezone.now()
+    _cache.prune(lambda key, entry: entry[1] <= now)
+
+
+def _run_worker():
+    flush_interval = getattr(settings, 'SESSION_WRITE_FLUSH_INTERVAL', 30)
+    sweep_interval = getattr(settings, 'SESSION_SWEEP_INTERVAL', 3600)
+    last_sweep = time.monotonic()
+    while True:
+        time.sleep(flush_interval)
+        try:
+            if sweep_interval and time.monotonic() - last_sweep >= sweep_interval:
+                sweep()
+                last_sweep = time.monotonic()
+            else:
+                flush_pending_writes()
+        except Exception:
+            logger.exception('Session maintenance failed')
+        finally:
+            # This thread owns its own connections; don't let them go stale
+            connections.close_all()
+
+
+def _coalescing():
+    return bool(getattr(settings, 'SESSION_WRITE_FLUSH_INTERVAL', 30))
+
+
+def _ensure_worker():
+    global _worker
+    if _worker is not None or not _coalescing():
+        return
+    with _worker_lock:
+        if _worker is None:
+            _worker = threading.Thread(target=_run_worker, name='session-maintenance', daemon=True)
+            _worker.start()
+
+
+def _flush_at_exit():
+    try:
+        flush_pending_writes()
+    except Exception:
+        logger.exception('Could not flush pending session writes at exit')
+
+
+atexit.register(_flush_at_exit)
+
+
+class SessionStore(DBStore):
+    """
+    Database session store with a process-local read cache and coalesced
+    expiry-only writes.
+    """
+
+    def load(self):
+        if not _read_cache_enabled():
+            return super().load()
+        session_key = self.session_key
+        entry = _cache.get(session_key) if session_key else None
+        if entry is not None:
+            data, expire_date = entry
+            if expire_date > timezone.now() and not _is_revoked(session_key):
+                metrics.incr('session_cache.hits')
+                # Hand out a copy so in-request changes don't leak into the cache
+                return dict(data)
+            _cache.pop(session_key)
+
+        metrics.incr('session_cache.misses')
+        s = self._get_session_from_db()
+        if s is None:
+            return {}
+        data = self.decode(s.session_data)
+        _cache.set(s.session_key, (dict(data), s.expire_date))
+        return data
+
+    def save(self, must_create=False):
+        if self.session_key is None:
+            return self.create()
+        _ensure_worker()
+        data = self._get_session(no_load=must_create)
+        expire_date = self.get_expiry_date()
+
+        if not must_create and _coalescing() and _read_cache_enabled():
+            entry = _cache.get(self.session_key)
+            # Keeps the entry's age: the copy is trusted no longer than if it hadn't been touched
+            if entry is not None and entry[0] == data and _cache.replace(self.session_key, (entry[0], expire_date)):
+                # Nothing but the expiry changed: queue it instead of writing now
+                with _pending_lock:
+                    _pending_expiry[self.session_key] = expire_date
+                metrics.incr('session_cache.coalesced_writes')
+                return
+
+        super().save(must_create=must_create)
+        with _pending_lock:
+            _pending_expiry.pop(self.session_key, None)
+        if _read_cache_enabled():
+            _cache.set(self.session_key, (dict(data), expire_date))
+
+    def delete(self, session_key=None):
+        if session_key is None:
+            if self.session_key is None:
+                return
+            session_key = self.session_key
+        # Revoke before touching the table, so no process re-caches it meanwhile
+        _revoke(session_key)
+        super().delete(session_key)
+
+    # The async API goes through the same cache, so sync and async views agree
+    async def aload(self):
+        return await sync_to_async(self.load)()
+
+    async def asave(self, must_create=False):
+        return await sync_to_async(self.save)(must_create=must_create)
+
+    async def adelete(self, session_key=None):
+        return await sync_to_async(self.delete)(session_key)
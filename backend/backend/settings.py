@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/X.Y/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -40,10 +41,14 @@ INSTALLED_APPS = [
     'rest_framework', # Required for Django REST Framework
     'corsheaders',    # Required for handling CORS if frontend and backend are on different origins
     'backend.users',  # Your Django app for user management (nested under the inner 'backend' project folder)
+    'backend.tasks',  # Database-backed background task queue; run workers with `manage.py run_tasks`
     'recipes',        # Your new Django app for recipes (at the same level as manage.py)
 ]
 
 MIDDLEWARE = [
+    'backend.log.RequestIdMiddleware',  # X-Request-ID, stamped on every log line of the request
+    'backend.instrumentation.RequestStatsMiddleware',  # Query counts, Server-Timing and per-view query budgets
+    'backend.content_encoding.CompressionMiddleware',  # Brotli/gzip per Accept-Encoding
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',  # If using django-cors-headers
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -78,13 +83,142 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/X.Y/ref/settings/#databases
 
+# Run on every new SQLite connection
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',               # readers and the writer stop blocking each other
+    'synchronous': 'normal',             # durable with WAL, without an fsync per commit
+    'busy_timeout': 5000,                # ms to wait for a lock before "database is locked"
+    'mmap_size': 256 * 1024 * 1024,      # bytes of the file read through memory mapping
+    'cache_size': -20000,                # page cache per connection; negative is KiB
+}
+SQLITE_INIT_COMMAND = ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items())
+
+# Seconds to keep a connection open between requests (0 closes it after each request)
+DB_CONN_MAX_AGE = int(os.environ.get('RECIPES_DB_CONN_MAX_AGE', 60))
+
+# RECIPES_DB_PATH lets benchmarks and load tests use a scratch database
+DB_PATH = os.environ.get('RECIPES_DB_PATH', BASE_DIR / 'db.sqlite3')
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'NAME': DB_PATH,
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': SQLITE_INIT_COMMAND,
+            # Take the write lock at BEGIN, so busy_timeout applies instead of
+            # failing when a read transaction later tries to write
+            'transaction_mode': 'IMMEDIATE',
+        },
+    },
+    # Second connection to the same file for reads (see backend/routers.py)
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': DB_PATH,
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': SQLITE_INIT_COMMAND + ';PRAGMA query_only=1',
+        },
+        'TEST': {
+            'MIRROR': 'default',
+        },
+    },
 }
 
+DATABASE_ROUTERS = ['backend.routers.ReadReplicaRouter']
+# Alias and apps whose reads the router sends to it; set the alias to None to read from 'default'
+READ_DATABASE_ALIAS = 'replica'
+READ_ROUTED_APPS = ('recipes', 'auth', 'sessions')
+
+
+# Caches
+# https://docs.djangoproject.com/en/X.Y/topics/cache/
+# The 'recipes' cache holds per-user recipe list/detail responses. Local memory
+# is per-process, which is fine: the generations that retire entries after a
+# write are kept in 'shared'.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'recipes': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'recipes',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    # Seen by every worker process on the host, for what must reach all of them at
+    # once: session revocations and recipe cache generations. Across hosts,
+    # point it at Memcached or Redis.
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('BACKEND_SHARED_CACHE_DIR', BASE_DIR / 'shared_cache'),
+        # Culling drops entries at random; keep it from dropping live markers
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+}
+
+# Cache alias used for recipe responses (None disables the response cache)
+RECIPE_CACHE_ALIAS = 'recipes'
+# Cache alias holding each user's cache generation; every process must see it, so
+# None or a per-process cache turns the response cache off instead
+RECIPE_CACHE_GENERATION_ALIAS = 'shared'
+# Seconds a cached recipe response may live even without a write
+RECIPE_CACHE_TIMEOUT = 300
+
+# Neighbours precomputed per recipe for /api/recipes/<pk>/similar/
+SIMILAR_RECIPES_K = 10
+
+# Near-duplicate check on create (see recipes/duplicates.py): 'flag' adds the
+# matches to the response, 'reject' answers 409 unless ?allow_duplicate=true,
+# None skips the check
+DUPLICATE_RECIPE_ACTION = 'flag'
+# Estimated Jaccard similarity of ingredients + instructions that counts as a duplicate
+DUPLICATE_RECIPE_THRESHOLD = 0.8
+
+# Delta sync (see recipes/sync.py): seconds of recent changes every sync sends again, to
+# catch writes that committed late, and seconds deleted recipes are remembered. Clients
+# that haven't synced for longer start over; run `manage.py prune_recipe_tombstones` daily.
+RECIPE_SYNC_OVERLAP = 10
+RECIPE_TOMBSTONE_TTL = 30 * 24 * 3600
+
+# Users whose title autocomplete index each process keeps in memory (least recently used go first)
+AUTOCOMPLETE_MAX_USERS = 1000
+# Seconds before the global cuisine vocabulary is re-read from the facet counters
+AUTOCOMPLETE_VOCABULARY_TTL = 300
+
+# Recipe ingredients/instructions are stored deflated, optionally with a preset
+# dictionary (see recipes/compression.py). New writes use this dictionary; keep
+# every recipes/zdicts/<id>.zdict that rows may still refer to. 0 compresses
+# without one. 1.zdict was trained on seeded sample data: train one on real
+# recipes with manage.py train_text_dictionary before switching to it.
+TEXT_COMPRESSION_DICTIONARY = 0
+TEXT_COMPRESSION_LEVEL = 9           # zlib level, 1 (fastest) to 9 (smallest)
+TEXT_COMPRESSION_MIN_SIZE = 64       # bytes; shorter texts are stored as is
+TEXT_COMPRESSION_DICTIONARY_DIR = None   # None: recipes/zdicts
+
+
+# Background tasks (see backend/tasks/queue.py)
+# Run tasks inline when queued instead of in a worker. Off by default, so requests only
+# enqueue: run `manage.py run_tasks` next to `runserver`, or set BACKEND_TASKS_EAGER=1 to
+# run tasks inside the request in development. Tests turn it on with override_settings.
+TASKS_EAGER = os.environ.get('BACKEND_TASKS_EAGER', '0') == '1'
+TASKS_EXECUTOR = 'thread'            # or 'process' for CPU-heavy tasks
+TASKS_CONCURRENCY = 4                # tasks one worker runs at once
+TASKS_POLL_INTERVAL = 1.0            # seconds between checks for due tasks
+TASKS_MAX_ATTEMPTS = 3
+TASKS_RETRY_BACKOFF = 10             # seconds before the first retry; doubles each time
+TASKS_RETRY_BACKOFF_MAX = 3600
+TASKS_LOCK_TIMEOUT = 600             # seconds before a task stuck in 'running' is requeued
+TASKS_KEEP_DONE = 24 * 3600          # seconds finished tasks are kept
+
+# Outgoing email; the console backend prints messages in the worker's output
+EMAIL_BACKEND = os.environ.get('BACKEND_EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+DEFAULT_FROM_EMAIL = os.environ.get('BACKEND_DEFAULT_FROM_EMAIL', 'Recipes <no-reply@localhost>')
+# Where the React app lives, for links in emails
+FRONTEND_URL = os.environ.get('BACKEND_FRONTEND_URL', 'http://localhost:3000')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/X.Y/ref/settings/#auth-password-validators
@@ -162,8 +296,16 @@ CSRF_TRUSTED_ORIGINS = [
 # Explicitly tell Django to use sessions for CSRF token storage (it's often default, but good to be explicit)
 CSRF_USE_SESSIONS = True 
 
-# Explicitly define the session engine
-SESSION_ENGINE = 'django.contrib.sessions.backends.db' 
+# Explicitly define the session engine: database-backed, with a per-process read
+# cache and batched expiry-only writes (see backend/sessions.py)
+SESSION_ENGINE = 'backend.sessions'
+SESSION_CACHE_TTL = 60                  # seconds a cached session is trusted
+SESSION_CACHE_MAX_ENTRIES = 10000
+SESSION_WRITE_FLUSH_INTERVAL = 30       # seconds between batched expiry writes; 0 writes at once
+SESSION_SWEEP_INTERVAL = 3600           # seconds between expired-session cleanups; None disables
+# Cache holding logout revocation markers. It must be shared by every process: with
+# None or a per-process cache the session read cache is turned off instead
+SESSION_REVOCATION_CACHE_ALIAS = 'shared'
 
 # Django REST Framework settings (optional, but good practice)
 REST_FRAMEWORK = {
@@ -175,3 +317,107 @@ REST_FRAMEWORK = {
     ),
 }
 
+
+# Serve the async views (users/async_views.py) instead of the sync DRF ones.
+# backend/asgi.py turns this on by default; set BACKEND_ASYNC_VIEWS=0 to opt out.
+ASYNC_VIEWS = os.environ.get('BACKEND_ASYNC_VIEWS', '0') == '1'
+
+# Password hashing pool used by the async views
+PASSWORD_HASHING_WORKERS = None       # None: one per CPU
+PASSWORD_HASHING_QUEUE_DEPTH = 32     # jobs allowed to wait before answering 503
+PASSWORD_HASHING_RETRY_AFTER = 1      # seconds, sent in Retry-After with the 503
+
+# Rate limits on the auth endpoints (see backend/throttling.py): token buckets per client IP
+# and per submitted field, 'N/period' meaning a burst of N refilled at N per period.
+# Remove a scope, or set RATE_LIMITS = {}, to turn its limits off. The client IP is REMOTE_ADDR;
+# behind reverse proxies, set REST_FRAMEWORK['NUM_PROXIES'] to their number to use X-Forwarded-For.
+RATE_LIMITS = {
+    'login': {'ip': '30/min', 'username': '10/min'},
+    'register': {'ip': '10/hour'},
+    'password_reset': {'ip': '10/hour', 'email': '3/hour'},
+    'password_reset_confirm': {'ip': '20/hour', 'uidb64': '10/hour'},
+}
+# Where buckets are kept: LocalMemoryStore (per process), FileStore (a SQLite file shared by
+# the processes on one host; options: path) or CacheStore (a Django cache; options: alias)
+RATE_LIMIT_STORE = 'backend.throttling.LocalMemoryStore'
+RATE_LIMIT_STORE_OPTIONS = {}
+
+# Recipe image proxy (see recipes/images.py); resized and WebP variants need Pillow
+IMAGE_CACHE_DIR = os.environ.get('RECIPES_IMAGE_CACHE_DIR', BASE_DIR / 'image_cache')
+IMAGE_FETCHER = 'recipes.images.UrllibFetcher'   # any class with fetch(url) -> (bytes, content type)
+IMAGE_FETCH_CONCURRENCY = 4                      # upstream fetches in flight per process
+IMAGE_FETCH_TIMEOUT = 10                         # seconds
+IMAGE_MAX_BYTES = 10 * 1024 * 1024
+IMAGE_FETCH_ALLOW_PRIVATE = False                # True only for local stand-in servers
+IMAGE_VARIANT_WIDTHS = {'thumb': 320, 'medium': 800}
+IMAGE_WORKERS = 2                                # resizing processes
+IMAGE_CACHE_MAX_AGE = 365 * 24 * 3600
+
+# Response compression (see backend/content_encoding.py); Brotli needs the brotli package
+RESPONSE_COMPRESSION_MIN_SIZE = 512      # bytes; smaller responses are sent as is
+RESPONSE_COMPRESSION_BROTLI = True
+RESPONSE_COMPRESSION_BROTLI_QUALITY = 5  # 0-11; higher is smaller but slower
+
+# Raise instead of logging a warning when a view runs more queries than its query_budget
+QUERY_BUDGET_STRICT = False
+
+# Logging
+# https://docs.djangoproject.com/en/X.Y/topics/logging/
+# Records are written as JSON lines by a background thread (see backend/log.py)
+LOG_QUEUE_SIZE = 10000                # records waiting to be written before new ones are dropped
+# Share of requests whose INFO lines are kept on backend.requests; warnings are always kept
+LOG_REQUEST_SAMPLE_RATE = float(os.environ.get('BACKEND_LOG_REQUEST_SAMPLE_RATE', '1.0'))
+
+# Keeps log lines out of `manage.py test` output and gives each run its own shared cache
+TEST_RUNNER = 'backend.testing.TestRunner'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {
+            '()': 'backend.log.JsonFormatter',
+        },
+    },
+    'filters': {
+        'request_id': {
+            '()': 'backend.log.RequestIdFilter',
+        },
+        'redact': {
+            '()': 'backend.log.RedactingFilter',
+        },
+        'sample_requests': {
+            '()': 'backend.log.SamplingFilter',
+            'rate': LOG_REQUEST_SAMPLE_RATE,
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'backend.log.BackgroundHandler',
+            'maxsize': LOG_QUEUE_SIZE,
+            'formatter': 'json',
+            'filters': ['request_id', 'redact'],
+        },
+    },
+    'loggers': {
+        # One line per request from backend.instrumentation
+        'backend.requests': {
+            'handlers': ['console'],
+            'filters': ['sample_requests'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        # Logins and password resets
+        'backend.auth': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        # Retries and failures from the task worker
+        'backend.tasks': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from backend.tasks.worker import Worker
+
+
+class Command(BaseCommand):
+    help = (
+        'Run queued background tasks (password reset emails, index updates) until stopped '
+        'with Ctrl-C or SIGTERM. Start one or more of these next to the web server.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=None,
+                            help='Tasks run at once (default: TASKS_CONCURRENCY).')
+        parser.add_argument('--executor', choices=['thread', 'process'], default=None,
+                            help='Run tasks in a thread or a process pool (default: TASKS_EXECUTOR).')
+        parser.add_argument('--poll-interval', type=float, default=None,
+                            help='Seconds between checks for due tasks (default: TASKS_POLL_INTERVAL).')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once no task is due, e.g. when run from cron.')
+
+    def handle(self, *args, **options):
+        worker = Worker(
+            concurrency=options['concurrency'], executor=options['executor'],
+            poll_interval=options['poll_interval'], stdout=self.stdout,
+        )
+        processed = worker.run(once=options['once'])
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} tasks.'))
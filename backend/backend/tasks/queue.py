@@ -0,0 +1,130 @@
+"""
+A small task queue kept in the database, for side effects that shouldn't
+run inside a request: sending email, refreshing derived indexes.
+
+Register a function with ``@task`` and call ``.delay()`` to queue it:
+
+    @task(max_attempts=5)
+    def send_welcome_email(user_id):
+        ...
+
+    send_welcome_email.delay(user.pk)
+    send_welcome_email.schedule(args=(user.pk,), countdown=3600)
+
+Arguments must be JSON-serializable; pass ids rather than model instances.
+The task row is written in the caller's transaction, so work queued by a
+request that rolls back is never run, and a worker only sees it once the
+request commits. ``manage.py run_tasks`` runs the worker (worker.py).
+
+With ``TASKS_EAGER`` on, ``delay()`` and ``schedule()`` run the function
+right away in the calling thread instead, and exceptions propagate; tests
+use it through override_settings.
+"""
+import random
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from backend import metrics
+
+
+def is_eager():
+    return getattr(settings, 'TASKS_EAGER', False)
+
+
+class TaskFunction:
+    """
+    A function registered as a task. Calling it runs it directly.
+    """
+    def __init__(self, func, max_attempts=None, retry_backoff=None):
+        self.func = func
+        self.name = f'{func.__module__}.{func.__qualname__}'
+        self.max_attempts = max_attempts or getattr(settings, 'TASKS_MAX_ATTEMPTS', 3)
+        self.retry_backoff = retry_backoff or getattr(settings, 'TASKS_RETRY_BACKOFF', 10)
+        self.__doc__ = func.__doc__
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def __repr__(self):
+        return f'<task {self.name}>'
+
+    def delay(self, *args, **kwargs):
+        return self.schedule(args=args, kwargs=kwargs)
+
+    def schedule(self, args=(), kwargs=None, run_at=None, countdown=None):
+        """
+        Queue a call to run at ``run_at``, or ``countdown`` seconds from now.
+        Returns the Task row, or None in eager mode.
+        """
+        from .models import Task
+
+        kwargs = kwargs or {}
+        if is_eager():
+            self.func(*args, **kwargs)
+            return None
+        if run_at is None:
+            run_at = timezone.now() + timedelta(seconds=countdown or 0)
+        metrics.incr('tasks.enqueued')
+        return Task.objects.create(
+            name=self.name, args=list(args), kwargs=kwargs, run_at=run_at, max_attempts=self.max_attempts,
+        )
+
+    def retry_delay(self, attempts):
+        """
+        Seconds to wait after the ``attempts``-th failure: exponential,
+        capped at TASKS_RETRY_BACKOFF_MAX, with jitter so that tasks that
+        failed together don't all retry together.
+        """
+        delay = min(self.retry_backoff * 2 ** (attempts - 1), getattr(settings, 'TASKS_RETRY_BACKOFF_MAX', 3600))
+        return delay * random.uniform(0.5, 1.0)
+
+
+def task(func=None, *, max_attempts=None, retry_backoff=None):
+    """
+    Register ``func`` as a task. ``max_attempts`` and ``retry_backoff``
+    (seconds before the first retry) default to TASKS_MAX_ATTEMPTS and
+    TASKS_RETRY_BACKOFF.
+    """
+    def register(func):
+        return TaskFunction(func, max_attempts=max_attempts, retry_backoff=retry_backoff)
+
+    if func is not None:
+        return register(func)
+    return register
+
+
+def get_task(name):
+    task_function = import_string(name)
+    if not isinstance(task_function, TaskFunction):
+        raise TypeError(f'{name} is not a registered task.')
+    return task_function
+
+
+def setup_process():
+    """
+    Initializer for the worker's process pool: spawned processes start
+    without Django configured. Lives here rather than in worker.py, which
+    imports models and so can't be loaded before setup.
+    """
+    import django
+    django.setup()
+
+
+def execute(name, args, kwargs):
+    """
+    Run one task in a pool thread or process. Closes the database
+    connections the task opened, since pool threads outlive requests.
+    """
+    try:
+        get_task(name)(*args, **kwargs)
+    finally:
+        connections.close_all()
+
+
+def format_error(exc):
+    return ''.join(traceback.format_exception(type(exc), exc, exc.__traceback__))
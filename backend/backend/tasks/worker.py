@@ -0,0 +1,178 @@
+"""
+The worker behind ``manage.py run_tasks``.
+
+The main thread claims due tasks and hands them to a thread or process
+pool, never more than the pool has free slots, so unclaimed tasks stay
+available to other workers. Claiming marks the rows running in one short
+write transaction; on backends with SKIP LOCKED, concurrent workers also
+skip each other's rows instead of waiting on them. Results are written
+back from the main thread.
+
+A task whose worker died while running it is requeued once it has been
+locked for ``TASKS_LOCK_TIMEOUT`` seconds. Finished tasks are deleted after
+``TASKS_KEEP_DONE`` seconds; failed ones are kept for inspection.
+"""
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from backend import metrics
+from .models import Task
+from .queue import execute, format_error, get_task, setup_process
+
+logger = logging.getLogger('backend.tasks')
+
+# Seconds between requeueing stuck tasks and purging finished ones
+MAINTENANCE_INTERVAL = 60
+
+
+class Worker:
+    def __init__(self, concurrency=None, executor=None, poll_interval=None, name=None, stdout=None):
+        self.concurrency = concurrency or getattr(settings, 'TASKS_CONCURRENCY', 4)
+        self.executor = executor or getattr(settings, 'TASKS_EXECUTOR', 'thread')
+        if self.executor not in ('thread', 'process'):
+            raise ValueError("executor must be 'thread' or 'process'.")
+        self.poll_interval = poll_interval or getattr(settings, 'TASKS_POLL_INTERVAL', 1.0)
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}'
+        self.stdout = stdout
+        self._stopping = threading.Event()
+
+    def log(self, message):
+        if self.stdout is not None:
+            self.stdout.write(message)
+
+    def stop(self, *args):
+        self._stopping.set()
+
+    def _make_pool(self):
+        if self.executor == 'process':
+            # spawn: don't fork a process holding DB connections and threads
+            return ProcessPoolExecutor(
+                max_workers=self.concurrency,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=setup_process,
+            )
+        return ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='task')
+
+    def claim(self, limit):
+        """
+        Mark up to ``limit`` due tasks as running by this worker and return them.
+        """
+        now = timezone.now()
+        due = Task.objects.filter(status=Task.PENDING, run_at__lte=now).order_by('run_at', 'id')
+        # Look before taking the write lock; most polls find nothing
+        if not due.exists():
+            return []
+        with transaction.atomic():
+            if connection.features.has_select_for_update_skip_locked:
+                due = due.select_for_update(skip_locked=True)
+            ids = list(due.values_list('id', flat=True)[:limit])
+            if not ids:
+                return []
+            Task.objects.filter(id__in=ids, status=Task.PENDING).update(
+                status=Task.RUNNING, locked_by=self.name, locked_at=now, attempts=F('attempts') + 1,
+            )
+            return list(Task.objects.filter(id__in=ids, locked_by=self.name, status=Task.RUNNING))
+
+    def finish(self, task, error=None):
+        now = timezone.now()
+        if error is None:
+            Task.objects.filter(pk=task.pk).update(status=Task.DONE, finished_at=now, last_error='')
+            metrics.incr('tasks.succeeded')
+            return
+        if task.attempts < task.max_attempts:
+            try:
+                delay = get_task(task.name).retry_delay(task.attempts)
+            except (ImportError, TypeError):
+                delay = getattr(settings, 'TASKS_RETRY_BACKOFF', 10)
+            Task.objects.filter(pk=task.pk).update(
+                status=Task.PENDING, run_at=now + timedelta(seconds=delay), last_error=error,
+                locked_by='', locked_at=None,
+            )
+            metrics.incr('tasks.retried')
+            logger.warning('Task %s #%s failed (attempt %s of %s); retrying in %.0fs',
+                           task.name, task.pk, task.attempts, task.max_attempts, delay)
+        else:
+            Task.objects.filter(pk=task.pk).update(status=Task.FAILED, finished_at=now, last_error=error)
+            metrics.incr('tasks.failed')
+            logger.error('Task %s #%s failed after %s attempts:\n%s', task.name, task.pk, task.attempts, error)
+
+    def requeue_stale(self):
+        """
+        Give tasks stuck in 'running' past TASKS_LOCK_TIMEOUT back to the queue,
+        counting the lost run as an attempt.
+        """
+        cutoff = timezone.now() - timedelta(seconds=getattr(settings, 'TASKS_LOCK_TIMEOUT', 600))
+        stale = Task.objects.filter(status=Task.RUNNING, locked_at__lt=cutoff)
+        failed = stale.filter(attempts__gte=F('max_attempts')).update(
+            status=Task.FAILED, finished_at=timezone.now(), last_error='Worker lost while running the task.',
+        )
+        requeued = stale.update(status=Task.PENDING, locked_by='', locked_at=None)
+        return requeued, failed
+
+    def purge_done(self):
+        cutoff = timezone.now() - timedelta(seconds=getattr(settings, 'TASKS_KEEP_DONE', 24 * 3600))
+        deleted, _ = Task.objects.filter(status=Task.DONE, finished_at__lt=cutoff).delete()
+        return deleted
+
+    def maintain(self):
+        requeued, failed = self.requeue_stale()
+        if requeued or failed:
+            logger.warning('Requeued %s stuck tasks, gave up on %s', requeued, failed)
+        self.purge_done()
+
+    def run(self, once=False):
+        """
+        Process tasks until stopped (SIGINT/SIGTERM), or with ``once`` until
+        no task is due. Running tasks are finished before returning.
+        """
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, self.stop)
+            signal.signal(signal.SIGINT, self.stop)
+
+        self.log(f'Worker {self.name}: {self.executor} pool of {self.concurrency}')
+        processed = 0
+        running = {}
+        last_maintenance = 0
+        with self._make_pool() as pool:
+            while True:
+                # Like the request cycle does: drop connections past CONN_MAX_AGE or broken
+                close_old_connections()
+                if time.monotonic() - last_maintenance > MAINTENANCE_INTERVAL:
+                    self.maintain()
+                    last_maintenance = time.monotonic()
+
+                claimed = []
+                if not self._stopping.is_set():
+                    free = self.concurrency - len(running)
+                    if free > 0:
+                        claimed = self.claim(free)
+                    for task in claimed:
+                        running[pool.submit(execute, task.name, task.args, task.kwargs)] = task
+
+                if not running:
+                    if self._stopping.is_set() or (once and not claimed):
+                        break
+                    self._stopping.wait(self.poll_interval)
+                    continue
+
+                done, _ = wait(
+                    running, timeout=0 if claimed else self.poll_interval, return_when=FIRST_COMPLETED,
+                )
+                for future in done:
+                    task = running.pop(future)
+                    error = future.exception()
+                    self.finish(task, None if error is None else format_error(error))
+                    processed += 1
+        return processed
@@ -0,0 +1,80 @@
+"""
+Test helpers for the request instrumentation in backend.instrumentation.
+"""
+import logging
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext, override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """
+    The default runner, plus:
+
+    * no INFO lines from the app's loggers: every test request would
+      otherwise print its request log line to stderr. Tests that check log
+      output use assertLogs, which sets its own level.
+    * a fresh directory for the file-based 'shared' cache, so test runs
+      neither read what the last one left nor leave files in the project.
+    """
+    quiet_loggers = ('backend.requests', 'backend.auth', 'backend.tasks')
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._saved_levels = {}
+        for name in self.quiet_loggers:
+            logger = logging.getLogger(name)
+            self._saved_levels[name] = logger.level
+            logger.setLevel(logging.WARNING)
+
+        self._shared_cache_dir = tempfile.mkdtemp(prefix='backend-shared-cache-')
+        self._caches = override_settings(CACHES={
+            **settings.CACHES, 'shared': {**settings.CACHES['shared'], 'LOCATION': self._shared_cache_dir},
+        })
+        self._caches.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._caches.disable()
+        shutil.rmtree(self._shared_cache_dir, ignore_errors=True)
+        for name, level in self._saved_levels.items():
+            logging.getLogger(name).setLevel(level)
+        super().teardown_test_environment(**kwargs)
+
+
+class QueryBudgetMixin:
+    """
+    Mix into a TestCase to check responses against their view's query budget:
+
+        response = self.client.get('/api/recipes/')
+        self.assertWithinQueryBudget(response)
+
+    RequestStatsMiddleware records the numbers on the request; the test
+    client hands that request back as ``response.wsgi_request``.
+    """
+    def assertWithinQueryBudget(self, response, budget=None):
+        stats = getattr(response.wsgi_request, 'stats', None)
+        if stats is None:
+            self.fail('No request stats recorded; is RequestStatsMiddleware installed?')
+        budget = stats.budget if budget is None else budget
+        if budget is None:
+            self.fail(f'{stats.view_name} declares no query_budget.')
+        if stats.view_queries > budget:
+            self.fail(
+                f'{stats.view_name} ran {stats.view_queries} queries, over its budget of {budget}.'
+            )
+
+    @contextmanager
+    def assertMaxQueries(self, budget, using='default'):
+        """
+        Like assertNumQueries, but passes for any count up to ``budget``.
+        """
+        with CaptureQueriesContext(connections[using]) as context:
+            yield context
+        if len(context) > budget:
+            queries = '\n'.join(query['sql'] for query in context.captured_queries)
+            self.fail(f'{len(context)} queries executed, budget is {budget}:\n{queries}')
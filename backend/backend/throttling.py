@@ -0,0 +1,247 @@
+"""
+Token-bucket rate limiting for the unauthenticated auth endpoints.
+
+Login, registration and password reset hash passwords or look users up by
+email, so a burst of credential-stuffing requests can use up the CPU of
+every worker. Views opt in with ``throttle_classes = [TokenBucketThrottle]``
+and a ``throttle_scope``, and ``RATE_LIMITS`` sets the limits per scope:
+
+    RATE_LIMITS = {
+        'login': {'ip': '30/min', 'username': '10/min'},
+    }
+
+Each entry is a bucket keyed by the client IP ('ip') or by a field of the
+request body. The IP is REMOTE_ADDR; behind a reverse proxy, set
+``REST_FRAMEWORK['NUM_PROXIES']`` to read it from X-Forwarded-For instead. A rate of '10/min' is a bucket of 10 tokens refilled at 10
+per minute, so a client can burst up to 10 requests and then keeps going
+at the refill rate. Buckets are checked in order, and a request is refused
+with 429 and ``Retry-After`` at the first empty one. Scopes without limits
+are not limited.
+
+Buckets live in the store named by ``RATE_LIMIT_STORE``, created with
+``RATE_LIMIT_STORE_OPTIONS`` as keyword arguments:
+
+- ``LocalMemoryStore``: this process only; with several worker processes
+  each enforces the limits separately.
+- ``FileStore``: a SQLite file shared by all processes on one host.
+- ``CacheStore``: a Django cache; shared across hosts with Redis or
+  Memcached, but concurrent requests may both take the last token.
+
+Views using ``ThrottleFirstMixin`` (and every AsyncAPIView) check throttles
+before authentication, so a refused request costs no database query.
+"""
+import hashlib
+import math
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from backend import metrics
+from backend.lru import LRUCache
+
+_DURATIONS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """
+    '10/min' -> (capacity 10, refill rate in tokens per second). Like DRF,
+    only the first letter of the period counts.
+    """
+    num, period = rate.split('/')
+    capacity = int(num)
+    return capacity, capacity / _DURATIONS[period.strip()[0].lower()]
+
+
+def take_token(state, capacity, rate, now):
+    """
+    Refill the bucket ``state`` (tokens, timestamp) up to ``now`` and take a
+    token. Returns the new state and the seconds until a token is
+    available, or 0 when one was taken.
+    """
+    if state is None:
+        tokens = capacity
+    else:
+        tokens = min(capacity, state[0] + max(0, now - state[1]) * rate)
+    if tokens >= 1:
+        return (tokens - 1, now), 0
+    return (tokens, now), (1 - tokens) / rate
+
+
+def refill_time(state, capacity, rate):
+    # Seconds until the bucket is full again, after which its state can be forgotten
+    return (capacity - state[0]) / rate
+
+
+class LocalMemoryStore:
+    def __init__(self, max_keys=100000):
+        # An evicted bucket starts full again; the least recently used ones mostly are
+        self._buckets = LRUCache(max_keys)
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate):
+        with self._lock:
+            state, wait = take_token(self._buckets.get(key), capacity, rate, time.time())
+            self._buckets.set(key, state)
+        return wait
+
+
+class FileStore:
+    """
+    Buckets in a SQLite file, updated in one write transaction per request.
+    """
+    # Expired buckets are deleted every this many takes
+    PRUNE_EVERY = 1000
+
+    def __init__(self, path=None, timeout=5):
+        self.path = str(path or Path(tempfile.gettempdir()) / 'recipes-ratelimit.sqlite3')
+        self.timeout = timeout
+        self._local = threading.local()
+        self._takes = 0
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS buckets '
+                '(key TEXT PRIMARY KEY, tokens REAL, updated REAL, expires REAL) WITHOUT ROWID'
+            )
+            self._local.connection = connection
+        return connection
+
+    def take(self, key, capacity, rate):
+        connection = self._connection()
+        now = time.time()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute('SELECT tokens, updated FROM buckets WHERE key = ?', (key,)).fetchone()
+            state, wait = take_token(row, capacity, rate, now)
+            connection.execute(
+                'INSERT OR REPLACE INTO buckets (key, tokens, updated, expires) VALUES (?, ?, ?, ?)',
+                (key, state[0], state[1], now + refill_time(state, capacity, rate)),
+            )
+            self._takes += 1
+            if self._takes % self.PRUNE_EVERY == 0:
+                connection.execute('DELETE FROM buckets WHERE expires < ?', (now,))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return wait
+
+
+class CacheStore:
+    def __init__(self, alias='default'):
+        self.alias = alias
+
+    def take(self, key, capacity, rate):
+        cache = caches[self.alias]
+        state, wait = take_token(cache.get(key), capacity, rate, time.time())
+        cache.set(key, state, timeout=math.ceil(refill_time(state, capacity, rate)) + 1)
+        return wait
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store():
+    path = getattr(settings, 'RATE_LIMIT_STORE', 'backend.throttling.LocalMemoryStore')
+    options = getattr(settings, 'RATE_LIMIT_STORE_OPTIONS', {})
+    key = (path, tuple(sorted(options.items())))
+    store = _stores.get(key)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(key)
+            if store is None:
+                store = _stores[key] = import_string(path)(**options)
+    return store
+
+
+def get_limits(scope):
+    if scope is None:
+        return {}
+    return getattr(settings, 'RATE_LIMITS', {}).get(scope) or {}
+
+
+def bucket_key(scope, field, value):
+    # Hashed so that submitted values are safe as cache keys and aren't stored as is
+    digest = hashlib.sha256(str(value).strip().lower().encode('utf-8')).hexdigest()[:32]
+    return f'ratelimit:{scope}:{field}:{digest}'
+
+
+def _request_data(request, view):
+    # AsyncAPIView parses the body itself; DRF requests have .data
+    data = view.get_data(request) if hasattr(view, 'get_data') else request.data
+    return data if hasattr(data, 'get') else {}
+
+
+class TokenBucketThrottle(BaseThrottle):
+    def __init__(self):
+        self._wait = None
+
+    def get_ident(self, request):
+        """
+        The client address for the 'ip' buckets. X-Forwarded-For is only
+        read when REST_FRAMEWORK['NUM_PROXIES'] says how many proxies in
+        front of us append to it; without that, any client could name a
+        new address on every request and never run out of tokens.
+        """
+        if api_settings.NUM_PROXIES is None:
+            return request.META.get('REMOTE_ADDR')
+        return super().get_ident(request)
+
+    def allow_request(self, request, view):
+        scope = getattr(view, 'throttle_scope', None)
+        limits = get_limits(scope)
+        if not limits:
+            return True
+        store = get_store()
+        data = None
+        for field, rate in limits.items():
+            if field == 'ip':
+                value = self.get_ident(request)
+            else:
+                if data is None:
+                    data = _request_data(request, view)
+                value = data.get(field)
+            if not value:
+                continue
+            capacity, refill = parse_rate(rate)
+            wait = store.take(bucket_key(scope, field, value), capacity, refill)
+            if wait:
+                self._wait = wait
+                metrics.incr('rate_limit.rejected')
+                metrics.incr(f'rate_limit.rejected.{scope}.{field}')
+                return False
+        return True
+
+    def wait(self):
+        return self._wait
+
+
+class ThrottleFirstMixin:
+    """
+    For DRF views: check throttles before authentication, which reads the
+    session and user from the database when a session cookie is sent.
+    """
+    def initial(self, request, *args, **kwargs):
+        self.check_throttles(request)
+        super().initial(request, *args, **kwargs)
+
+    def check_throttles(self, request):
+        # initial() runs them again after authentication; once is enough
+        if getattr(request, '_throttles_checked', False):
+            return
+        request._throttles_checked = True
+        super().check_throttles(request)
@@ -14,17 +14,39 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 from backend.users.views import CSRFTokenView
-from recipes.views import RecipeViewSet
+from backend.metrics import MetricsView
+from recipes.views import ImageProxyView, RecipeViewSet
+
+if settings.ASYNC_VIEWS:
+    # Native async CRUD (see recipes/async_views.py); the other recipe endpoints stay on the viewset
+    from recipes.async_views import AsyncRecipeListView, AsyncRecipeDetailView
+    recipe_list_view = AsyncRecipeListView.as_view()
+    recipe_detail_view = AsyncRecipeDetailView.as_view()
+else:
+    recipe_list_view = RecipeViewSet.as_view({'get': 'list', 'post': 'create'})
+    recipe_detail_view = RecipeViewSet.as_view({'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'})
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/users/', include('backend.users.urls')),
     path('api/csrf/', CSRFTokenView.as_view(), name='csrf_token'), # Endpoint to get CSRF token
+    path('api/metrics/', MetricsView.as_view(), name='metrics'), # Per-process counters (staff only)
+    path('api/images/', ImageProxyView.as_view(), name='image-proxy'), # Cached, resized recipe images
     # path('csrf-token/', views.get_csrf_token, name='csrf_token'),
     # path('api/recipes/', include('recipes.urls')),
-    path('api/recipes/', RecipeViewSet.as_view({'get': 'list', 'post': 'create'}), name='recipe-list-create'),
-    path('api/recipes/<int:pk>/', RecipeViewSet.as_view({'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}), name='recipe-detail'),
+    path('api/recipes/', recipe_list_view, name='recipe-list-create'),
+    path('api/recipes/search/', RecipeViewSet.as_view({'get': 'search'}), name='recipe-search'),
+    path('api/recipes/changes/', RecipeViewSet.as_view({'get': 'changes'}), name='recipe-changes'),
+    path('api/recipes/autocomplete/', RecipeViewSet.as_view({'get': 'autocomplete'}), name='recipe-autocomplete'),
+    path('api/recipes/facets/', RecipeViewSet.as_view({'get': 'facets'}), name='recipe-facets'),
+    path('api/recipes/pantry/', RecipeViewSet.as_view({'get': 'pantry'}), name='recipe-pantry'),
+    path('api/recipes/bulk/', RecipeViewSet.as_view({'get': 'bulk', 'post': 'bulk', 'put': 'bulk', 'patch': 'bulk', 'delete': 'bulk'}), name='recipe-bulk'),
+    path('api/recipes/export/', RecipeViewSet.as_view({'get': 'export'}), name='recipe-export'),
+    path('api/recipes/import/', RecipeViewSet.as_view({'post': 'import_recipes'}), name='recipe-import'),
+    path('api/recipes/<int:pk>/', recipe_detail_view, name='recipe-detail'),
+    path('api/recipes/<int:pk>/similar/', RecipeViewSet.as_view({'get': 'similar'}), name='recipe-similar'),
 ]
@@ -0,0 +1,160 @@
+"""
+Async versions of the views that hash passwords, for ASGI deployments.
+
+They behave like their counterparts in views.py (same payloads, status
+codes and session handling) but never hash on the event loop: validation
+and saving run on the bounded pool from ``hashing.py``, and when that pool
+is saturated the request gets a 503 with ``Retry-After`` straight away.
+
+``users/urls.py`` routes to these instead of the DRF views when
+``settings.ASYNC_VIEWS`` is on, which ``backend/asgi.py`` does by default.
+"""
+import logging
+
+from django.conf import settings
+from django.contrib.auth import alogin, alogout
+from rest_framework import status
+
+from backend.async_api import AsyncAPIView
+from backend.log import pseudonym
+from backend.throttling import TokenBucketThrottle
+from .hashing import HashingPoolFull, get_pool
+from .serializers import (
+    UserRegisterSerializer,
+    UserLoginSerializer,
+    ChangePasswordSerializer,
+    PasswordResetConfirmSerializer
+)
+
+logger = logging.getLogger('backend.auth')
+
+
+def _set_session_cookie(response, request):
+    response.set_cookie(
+        settings.SESSION_COOKIE_NAME,
+        request.session.session_key,
+        max_age=settings.SESSION_COOKIE_AGE,
+        domain=settings.SESSION_COOKIE_DOMAIN,
+        path=settings.SESSION_COOKIE_PATH,
+        secure=settings.SESSION_COOKIE_SECURE,
+        httponly=settings.SESSION_COOKIE_HTTPONLY,
+        samesite=settings.SESSION_COOKIE_SAMESITE,
+    )
+
+
+class PasswordHashingView(AsyncAPIView):
+    """
+    Answers 503 with Retry-After when the hashing pool is saturated.
+    """
+    http_method_names = ['post', 'options']
+    # Refused before any hashing, with limits per throttle_scope in settings.RATE_LIMITS
+    throttle_classes = [TokenBucketThrottle]
+
+    def handle_exception(self, exc):
+        if isinstance(exc, HashingPoolFull):
+            response = self.respond(
+                {'error': 'The server is busy. Please try again shortly.'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+            response['Retry-After'] = str(getattr(settings, 'PASSWORD_HASHING_RETRY_AFTER', 1))
+            return response
+        return super().handle_exception(exc)
+
+
+# Register View
+class AsyncRegisterView(PasswordHashingView):
+    throttle_scope = 'register'
+    query_budget = 10
+
+    async def post(self, request):
+        serializer = UserRegisterSerializer(data=self.get_data(request))
+        pool = get_pool()
+        if not await pool.run(serializer.is_valid):
+            return self.respond(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        user = await pool.run(serializer.save)
+        await alogin(request, user)  # Log the user in immediately after registration
+        response = self.respond({
+            'message': 'Registration successful',
+            'username': user.username
+        }, status=status.HTTP_201_CREATED)
+        _set_session_cookie(response, request)
+        return response
+
+
+# Login View
+class AsyncLoginView(PasswordHashingView):
+    throttle_scope = 'login'
+    query_budget = 7
+
+    async def post(self, request):
+        serializer = UserLoginSerializer(data=self.get_data(request))
+        # validate() calls authenticate(), which does the hashing
+        if not await get_pool().run(serializer.is_valid):
+            username = serializer.initial_data.get('username') if hasattr(serializer.initial_data, 'get') else None
+            # Never the username itself: it often holds a password typed into the wrong field
+            logger.info('Login failed', extra={'username_hash': pseudonym(username)})
+            return self.respond(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        user = serializer.validated_data['user']
+        await alogin(request, user)
+        logger.info('Login succeeded', extra={'user_id': user.id})
+        response = self.respond({
+            'message': 'Login successful',
+            'username': user.username,
+            'user_id': user.id,
+            'session_key': request.session.session_key
+        }, status=status.HTTP_200_OK)
+        _set_session_cookie(response, request)
+        return response
+
+
+# Change Password View
+class AsyncChangePasswordView(PasswordHashingView):
+    require_authentication = True
+    query_budget = 5
+
+    async def post(self, request):
+        request.user = self.user
+        serializer = ChangePasswordSerializer(data=self.get_data(request), context={'request': request})
+        pool = get_pool()
+        if not await pool.run(serializer.is_valid):
+            return self.respond(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            await pool.run(serializer.save)
+            # Log out the user for security (since they changed their password while logged in)
+            await alogout(request)
+        except HashingPoolFull:
+            raise
+        except Exception:
+            return self.respond({
+                'error': 'Failed to change password'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return self.respond({
+            'message': 'Password changed successfully. Please log in again with your new password.'
+        }, status=status.HTTP_200_OK)
+
+
+# Password Reset Confirm View
+class AsyncPasswordResetConfirmView(PasswordHashingView):
+    throttle_scope = 'password_reset_confirm'
+    query_budget = 4
+
+    async def post(self, request):
+        serializer = PasswordResetConfirmSerializer(data=self.get_data(request))
+        pool = get_pool()
+        if not await pool.run(serializer.is_valid):
+            return self.respond(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            await pool.run(serializer.save)
+        except HashingPoolFull:
+            raise
+        except Exception:
+            return self.respond({
+                'error': 'Failed to reset password'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return self.respond({
+            'message': 'Password has been reset successfully. You can now log in with your new password.'
+        }, status=status.HTTP_200_OK)
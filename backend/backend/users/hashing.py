@@ -0,0 +1,82 @@
+"""
+A bounded thread pool for password hashing.
+
+PBKDF2 is deliberately slow (hundreds of milliseconds per hash), so running
+it on the event loop, or through ``sync_to_async``'s single shared thread,
+stalls every other request. The async auth views hand that work to this
+pool instead. At most ``PASSWORD_HASHING_WORKERS`` jobs run at once and at
+most ``PASSWORD_HASHING_QUEUE_DEPTH`` more wait for a worker; beyond that
+``run()`` raises ``HashingPoolFull`` immediately, and the views turn that
+into a 503 with ``Retry-After`` rather than letting latency grow without
+bound.
+
+Jobs may touch the database (``authenticate``, ``user.save()``). Each one
+is wrapped like a request, closing stale connections before and after, so
+pool threads don't hold connections past CONN_MAX_AGE.
+"""
+import asyncio
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from backend import metrics
+
+
+class HashingPoolFull(Exception):
+    """
+    Every worker is busy and the queue is at its configured depth.
+    """
+
+
+class HashingPool:
+    def __init__(self, workers, queue_depth):
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hashing')
+        self._slots = threading.BoundedSemaphore(workers + queue_depth)
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Run ``func(*args, **kwargs)`` on the pool and return its result.
+        """
+        if not self._slots.acquire(blocking=False):
+            metrics.incr('hashing_pool.rejected')
+            raise HashingPoolFull()
+        try:
+            # In the request's context, so its log lines and query counts include the job's
+            future = self._executor.submit(contextvars.copy_context().run, self._call, func, args, kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        # Released when the job ends, even if the awaiting request goes away
+        future.add_done_callback(lambda f: self._slots.release())
+        metrics.incr('hashing_pool.jobs')
+        return await asyncio.wrap_future(future)
+
+    @staticmethod
+    def _call(func, args, kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = HashingPool(
+                    getattr(settings, 'PASSWORD_HASHING_WORKERS', None) or os.cpu_count() or 1,
+                    getattr(settings, 'PASSWORD_HASHING_QUEUE_DEPTH', 32),
+                )
+    return _pool
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.auth.tokens import default_token_generator
+from django.core.mail import send_mail
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from backend.tasks.queue import task
+
+
+@task(max_attempts=5)
+def send_password_reset_email(user_id):
+    """
+    Email a password reset link. The token is made here rather than in the
+    request, so it never sits in the task table.
+    """
+    user = User.objects.filter(pk=user_id, is_active=True).first()
+    if user is None or not user.email:
+        return
+    uid = urlsafe_base64_encode(force_bytes(user.pk))
+    token = default_token_generator.make_token(user)
+    frontend_url = getattr(settings, 'FRONTEND_URL', 'http://localhost:3000').rstrip('/')
+    reset_url = f'{frontend_url}/reset-password-confirm/{uid}/{token}/'
+    send_mail(
+        'Reset your password',
+        f'Hi {user.username},\n\n'
+        f'Someone asked to reset the password of your account. To choose a new one, open:\n\n'
+        f'{reset_url}\n\n'
+        f"If it wasn't you, you can ignore this email.\n",
+        None,
+        [user.email],
+    )
@@ -0,0 +1,322 @@
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.contrib.auth.tokens import default_token_generator
+from django.core import mail
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.urls import include, path
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from rest_framework.test import APIClient
+
+from backend import metrics, sessions, throttling
+from backend.lru import LRUCache
+from backend.log import pseudonym
+from backend.tasks.models import Task
+from backend.tasks.queue import get_task
+from backend.testing import QueryBudgetMixin
+
+from .async_views import AsyncLoginView
+from .hashing import HashingPool
+
+
+class LoginThrottleTests(TransactionTestCase):
+    # Not TestCase: with BACKEND_ASYNC_VIEWS=1 logins run on the hashing pool's threads,
+    # which can't read rows from a transaction still open in the test's thread
+    url = '/api/users/login/'
+
+    def setUp(self):
+        # Start every test with full buckets
+        throttling._stores.clear()
+        self.client = APIClient()
+
+    def login(self, forwarded_for, username='cook'):
+        return self.client.post(
+            self.url, {'username': username, 'password': 'wrong'}, format='json',
+            HTTP_X_FORWARDED_FOR=forwarded_for,
+        )
+
+    @override_settings(RATE_LIMITS={'login': {'ip': '3/min'}})
+    def test_ip_bucket_ignores_forwarded_for(self):
+        for i in range(3):
+            self.assertEqual(self.login(f'203.0.113.{i}').status_code, 400)
+        response = self.login('203.0.113.99')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+    @override_settings(
+        RATE_LIMITS={'login': {'ip': '3/min'}},
+        REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'NUM_PROXIES': 1},
+    )
+    def test_ip_bucket_uses_forwarded_for_behind_a_proxy(self):
+        for _ in range(3):
+            self.assertEqual(self.login('198.51.100.7, 203.0.113.1').status_code, 400)
+        self.assertEqual(self.login('198.51.100.7, 203.0.113.1').status_code, 429)
+        # The address the proxy saw, not what the client put in front of it
+        self.assertEqual(self.login('203.0.113.1').status_code, 429)
+        self.assertEqual(self.login('203.0.113.2').status_code, 400)
+
+    @override_settings(RATE_LIMITS={'login': {'username': '2/min'}})
+    def test_username_bucket(self):
+        User.objects.create_user('cook', password='a-long-test-password')
+        for i in range(2):
+            self.assertEqual(self.login(f'203.0.113.{i}', username='Cook ').status_code, 400)
+        self.assertEqual(self.login('203.0.113.9', username='cook').status_code, 429)
+        self.assertEqual(self.login('203.0.113.9', username='someone-else').status_code, 400)
+
+
+class LoginLoggingTests(TestCase):
+    def setUp(self):
+        throttling._stores.clear()
+
+    def test_failed_login_does_not_log_the_username(self):
+        with self.assertLogs('backend.auth', 'INFO') as logs:
+            response = APIClient().post(
+                '/api/users/login/', {'username': 'hunter2-secret', 'password': 'wrong'}, format='json',
+            )
+        self.assertEqual(response.status_code, 400)
+        [record] = logs.records
+        self.assertEqual(record.getMessage(), 'Login failed')
+        self.assertFalse(hasattr(record, 'username'))
+        self.assertNotIn('hunter2', record.username_hash)
+        self.assertEqual(record.username_hash, pseudonym('Hunter2-Secret '))
+
+
+class SessionRevocationTests(TransactionTestCase):
+    # TransactionTestCase for the same reason as LoginThrottleTests
+    password = 'a-long-test-password'
+
+    def setUp(self):
+        throttling._stores.clear()
+        self.user = User.objects.create_user('cook', password=self.password)
+
+    def signed_in_client(self, session_key=None):
+        client = APIClient()
+        if session_key is None:
+            client.force_login(self.user)
+        else:
+            client.cookies[settings.SESSION_COOKIE_NAME] = session_key
+        return client
+
+    def test_logout_is_honoured_over_other_processes_cached_copies(self):
+        client = self.signed_in_client()
+        session_key = client.cookies[settings.SESSION_COOKIE_NAME].value
+        elsewhere = self.signed_in_client(session_key)
+        self.assertEqual(elsewhere.get('/api/users/me/').status_code, 200)
+        cached = sessions._cache.get(session_key)
+
+        self.assertEqual(client.post('/api/users/logout/').status_code, 200)
+        self.assertFalse(Session.objects.filter(session_key=session_key).exists())
+        # Put back the copy another process would still hold; the revocation marker overrides it
+        sessions._cache.set(session_key, cached)
+        self.assertEqual(elsewhere.get('/api/users/me/').status_code, 403)
+
+    def test_logout_reaches_another_process_at_once(self):
+        client = self.signed_in_client()
+        session_key = client.cookies[settings.SESSION_COOKIE_NAME].value
+        # Another worker: its own session read cache, the same shared revocation cache
+        other_process = LRUCache(100, ttl=3600)
+        with mock.patch.object(sessions, '_cache', other_process):
+            self.assertEqual(sessions.SessionStore(session_key).load()['_auth_user_id'], str(self.user.pk))
+        self.assertIn(session_key, other_process)
+
+        self.assertEqual(client.post('/api/users/logout/').status_code, 200)
+        with mock.patch.object(sessions, '_cache', other_process), self.assertNumQueries(1):
+            # The cached copy is refused and the table no longer has the row
+            self.assertEqual(sessions.SessionStore(session_key).load(), {})
+
+    @override_settings(
+        CACHES={**settings.CACHES, 'local': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+        SESSION_REVOCATION_CACHE_ALIAS='local',
+    )
+    def test_no_read_cache_without_a_shared_revocation_cache(self):
+        client = self.signed_in_client()
+        session_key = client.cookies[settings.SESSION_COOKIE_NAME].value
+        sessions._cache.clear()
+        self.assertEqual(client.get('/api/users/me/').status_code, 200)
+        self.assertNotIn(session_key, sessions._cache)
+        Session.objects.filter(session_key=session_key).delete()
+        self.assertEqual(client.get('/api/users/me/').status_code, 403)
+
+    def test_changing_the_password_ends_every_session(self):
+        client, other = self.signed_in_client(), self.signed_in_client()
+        self.assertEqual(other.get('/api/users/me/').status_code, 200)
+        response = client.post('/api/users/change-password/', {
+            'old_password': self.password,
+            'new_password': 'another-long-password', 'new_password2': 'another-long-password',
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(client.get('/api/users/me/').status_code, 403)
+        # The other session is only found stale once loaded, and deleting it goes over the budget
+        with self.assertLogs('backend.requests', 'WARNING'):
+            self.assertEqual(other.get('/api/users/me/').status_code, 403)
+
+    def test_expiry_only_saves_are_coalesced(self):
+        store = sessions.SessionStore()
+        store['cart'] = 'soup'
+        store.create()
+        stored_expiry = Session.objects.get(session_key=store.session_key).expire_date
+
+        store = sessions.SessionStore(store.session_key)
+        self.assertEqual(store['cart'], 'soup')
+        store.modified = True
+        with self.assertNumQueries(0):
+            store.save()
+        self.assertEqual(Session.objects.get(session_key=store.session_key).expire_date, stored_expiry)
+        self.assertEqual(sessions.flush_pending_writes(), 1)
+        self.assertGreater(Session.objects.get(session_key=store.session_key).expire_date, stored_expiry)
+
+    def test_expiry_only_saves_do_not_extend_trust_in_the_cached_copy(self):
+        store = sessions.SessionStore()
+        store['cart'] = 'soup'
+        store.create()
+        with mock.patch('backend.lru.time.monotonic', return_value=time.monotonic() + sessions._cache.ttl - 1):
+            store.modified = True
+            store.save()
+        # Past the TTL of the first read, however many saves came in between
+        with mock.patch('backend.lru.time.monotonic', return_value=time.monotonic() + sessions._cache.ttl + 1):
+            self.assertIsNone(sessions._cache.get(store.session_key))
+
+    def test_queued_expiry_does_not_resurrect_a_deleted_session(self):
+        store = sessions.SessionStore()
+        store['cart'] = 'soup'
+        store.create()
+        store.modified = True
+        store.save()
+        # Deleted by another process, which can't see this one's queue
+        Session.objects.filter(session_key=store.session_key).delete()
+        sessions.flush_pending_writes()
+        self.assertFalse(Session.objects.filter(session_key=store.session_key).exists())
+
+
+class PasswordResetTests(TestCase):
+    url = '/api/users/password-reset-request/'
+
+    def setUp(self):
+        throttling._stores.clear()
+        User.objects.create_user('cook', email='cook@example.com', password='a-long-test-password')
+
+    def test_request_queues_the_email(self):
+        response = APIClient().post(self.url, {'email': 'cook@example.com'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mail.outbox, [])
+        [task] = Task.objects.all()
+
+        get_task(task.name)(*task.args, **task.kwargs)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['cook@example.com'])
+        self.assertIn('/reset-password-confirm/', mail.outbox[0].body)
+
+    @override_settings(TASKS_EAGER=True)
+    def test_eager_mode_sends_during_the_request(self):
+        response = APIClient().post(self.url, {'email': 'cook@example.com'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertFalse(Task.objects.exists())
+
+    def test_unknown_email_queues_nothing(self):
+        response = APIClient().post(self.url, {'email': 'nobody@example.com'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Task.objects.exists())
+
+
+class QueryBudgetTests(QueryBudgetMixin, TransactionTestCase):
+    # TransactionTestCase for the same reason as LoginThrottleTests
+    password = 'a-long-test-password'
+
+    def setUp(self):
+        throttling._stores.clear()
+        self.user = User.objects.create_user('cook', email='cook@example.com', password=self.password)
+        self.client = APIClient()
+
+    def assertRequestsWithinBudget(self, method, url, data=None, status=200):
+        response = getattr(self.client, method)(url, data, format='json')
+        self.assertEqual(response.status_code, status, response.content)
+        self.assertWithinQueryBudget(response)
+        return response
+
+    def test_anonymous_endpoints(self):
+        self.assertRequestsWithinBudget('get', '/api/csrf/')
+        self.assertRequestsWithinBudget('post', '/api/users/register/', {
+            'username': 'baker', 'email': 'baker@example.com',
+            'password': self.password, 'password2': self.password,
+        }, status=201)
+        self.client.logout()
+        self.assertRequestsWithinBudget('post', '/api/users/login/', {'username': 'cook', 'password': self.password})
+        self.client.logout()
+        self.assertRequestsWithinBudget('post', '/api/users/login/', {'username': 'cook', 'password': 'wrong'}, status=400)
+        self.assertRequestsWithinBudget('post', '/api/users/password-reset-request/', {'email': 'cook@example.com'})
+        # The token covers last_login, which the login above moved
+        self.user.refresh_from_db()
+        self.assertRequestsWithinBudget('post', '/api/users/password-reset-confirm/', {
+            'uidb64': urlsafe_base64_encode(force_bytes(self.user.pk)),
+            'token': default_token_generator.make_token(self.user),
+            'new_password': 'another-long-password', 'new_password2': 'another-long-password',
+        })
+
+    def test_signed_in_endpoints(self):
+        self.client.force_login(self.user)
+        self.assertRequestsWithinBudget('get', '/api/users/me/')
+        self.assertRequestsWithinBudget('get', '/api/users/cook/')
+        self.assertRequestsWithinBudget('post', '/api/users/logout/')
+        # Changing the password ends the session too
+        self.client.force_login(self.user)
+        self.assertRequestsWithinBudget('post', '/api/users/change-password/', {
+            'old_password': self.password,
+            'new_password': 'another-long-password', 'new_password2': 'another-long-password',
+        })
+
+
+# The async auth views, whatever settings.ASYNC_VIEWS picked for the main URLconf
+urlpatterns = [
+    path('async/login/', AsyncLoginView.as_view()),
+    path('', include('backend.urls')),
+]
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncAuthViewTests(TransactionTestCase):
+    # TransactionTestCase for the same reason as LoginThrottleTests
+    url = '/async/login/'
+    password = 'a-long-test-password'
+
+    def setUp(self):
+        throttling._stores.clear()
+        metrics.reset()
+        self.user = User.objects.create_user('cook', password=self.password)
+        self.client = Client(enforce_csrf_checks=True)
+
+    def login(self, **extra):
+        return self.client.post(
+            self.url, {'username': 'cook', 'password': self.password}, content_type='application/json', **extra,
+        )
+
+    @override_settings(PASSWORD_HASHING_RETRY_AFTER=7)
+    def test_full_hashing_pool_answers_503(self):
+        pool = HashingPool(workers=1, queue_depth=0)
+        # Every slot taken, as by a job still hashing
+        pool._slots.acquire()
+        with mock.patch('backend.users.async_views.get_pool', return_value=pool):
+            response = self.login()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '7')
+        self.assertEqual(response.json(), {'error': 'The server is busy. Please try again shortly.'})
+        self.assertEqual(metrics.get('hashing_pool.rejected'), 1)
+
+        pool._slots.release()
+        with mock.patch('backend.users.async_views.get_pool', return_value=pool):
+            self.assertEqual(self.login().status_code, 200)
+
+    def test_csrf_is_enforced_for_signed_in_users(self):
+        # Anonymous logins need no token, as with DRF's SessionAuthentication
+        self.assertEqual(self.login().status_code, 200)
+
+        response = self.login()
+        self.assertEqual(response.status_code, 403)
+        self.assertTrue(response.json()['detail'].startswith('CSRF Failed'))
+
+        token = self.client.get('/api/csrf/').json()['csrfToken']
+        self.assertEqual(self.login(HTTP_X_CSRFTOKEN=token).status_code, 200)
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 from .views import (
     RegisterView, 
@@ -11,6 +12,15 @@ from .views import (
     CSRFTokenView  # Don't forget to add this if you're using it
 )
 
+if settings.ASYNC_VIEWS:
+    # Hash passwords on a bounded pool instead of the request thread (see async_views.py)
+    from .async_views import (
+        AsyncRegisterView as RegisterView,
+        AsyncLoginView as LoginView,
+        AsyncChangePasswordView as ChangePasswordView,
+        AsyncPasswordResetConfirmView as PasswordResetConfirmView
+    )
+
 urlpatterns = [
     path('register/', RegisterView.as_view(), name='register'),
     path('login/', LoginView.as_view(), name='login'),
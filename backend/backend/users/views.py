@@ -1,3 +1,5 @@
+import logging
+
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
@@ -22,11 +24,17 @@ from .serializers import (
 from django.contrib.auth.tokens import default_token_generator
 from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
 from django.utils.encoding import force_bytes, force_str
+from .tasks import send_password_reset_email
+from backend.log import pseudonym
+from backend.throttling import ThrottleFirstMixin, TokenBucketThrottle
+
+logger = logging.getLogger('backend.auth')
 
 # CSRF Token View
 @method_decorator(ensure_csrf_cookie, name='dispatch')
 class CSRFTokenView(APIView):
     permission_classes = [AllowAny]
+    query_budget = 3  # Max queries per request (see backend.instrumentation); a first visit creates the session
     
     def get(self, request):
         csrf_token = get_token(request)
@@ -47,8 +55,11 @@ class CSRFTokenView(APIView):
         return response
 
 # Register View
-class RegisterView(APIView):
+class RegisterView(ThrottleFirstMixin, APIView):
     permission_classes = [AllowAny]
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'register'  # limits in settings.RATE_LIMITS
+    query_budget = 8
 
     def post(self, request):
         serializer = UserRegisterSerializer(data=request.data)
@@ -78,22 +89,18 @@ class RegisterView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 # Login View
-class LoginView(APIView):
+class LoginView(ThrottleFirstMixin, APIView):
     permission_classes = [AllowAny]
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'login'
+    query_budget = 6
 
     def post(self, request):
-        print(f"Login attempt - Session key before: {request.session.session_key}")
-        print(f"Request headers: {dict(request.headers)}")
-        print(f"Request cookies: {request.COOKIES}")
-        
         serializer = UserLoginSerializer(data=request.data)
         if serializer.is_valid():
             user = serializer.validated_data['user']
             login(request, user)
-            
-            print(f"Login successful - Session key after: {request.session.session_key}")
-            print(f"User authenticated: {request.user.is_authenticated}")
-            print(f"Session data: {dict(request.session)}")
+            logger.info('Login succeeded', extra={'user_id': user.id})
             
             response_data = {
                 'message': 'Login successful', 
@@ -116,15 +123,18 @@ class LoginView(APIView):
                 samesite=settings.SESSION_COOKIE_SAMESITE,
             )
             
-            print(f"Response cookies being set: {response.cookies}")
             return response
             
+        username = request.data.get('username') if hasattr(request.data, 'get') else None
+        # Never the username itself: it often holds a password typed into the wrong field
+        logger.info('Login failed', extra={'username_hash': pseudonym(username)})
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 # Logout View
 class LogoutView(APIView):
     authentication_classes = [SessionAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = 3
 
     def post(self, request):
         try:
@@ -137,6 +147,7 @@ class LogoutView(APIView):
 class UserDetailView(RetrieveAPIView):
     authentication_classes = [SessionAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = 2
     queryset = User.objects.all()
     serializer_class = UserSerializer
     lookup_field = 'username'
@@ -145,6 +156,7 @@ class UserDetailView(RetrieveAPIView):
 class ChangePasswordView(APIView):
     authentication_classes = [SessionAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = 5
 
     def post(self, request):
         serializer = ChangePasswordSerializer(
@@ -171,14 +183,18 @@ class ChangePasswordView(APIView):
 class CurrentUserView(APIView):
     authentication_classes = [SessionAuthentication]
     permission_classes = [IsAuthenticated]
+    query_budget = 2
 
     def get(self, request):
         serializer = UserSerializer(request.user)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 # Password Reset Request View
-class PasswordResetRequestView(APIView):
+class PasswordResetRequestView(ThrottleFirstMixin, APIView):
     permission_classes = [AllowAny]
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'password_reset'
+    query_budget = 3
 
     def post(self, request):
         serializer = PasswordResetRequestSerializer(data=request.data)
@@ -186,11 +202,9 @@ class PasswordResetRequestView(APIView):
             email = serializer.validated_data['email']
             
             if hasattr(serializer, 'user') and serializer.user:
-                user = serializer.user
-                uid = urlsafe_base64_encode(force_bytes(user.pk))
-                token = default_token_generator.make_token(user)
-                reset_url = f"http://localhost:3000/reset-password-confirm/{uid}/{token}/"
-                print(f"Password reset link for {user.email}: {reset_url}")
+                # Sent by the task worker, so the response time doesn't depend on the mail server
+                send_password_reset_email.delay(serializer.user.pk)
+                logger.info('Password reset requested', extra={'user_id': serializer.user.pk})
             
             return Response({
                 'message': 'If an account with that email exists, a password reset link has been sent.'
@@ -199,8 +213,11 @@ class PasswordResetRequestView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 # Password Reset Confirm View
-class PasswordResetConfirmView(APIView):
+class PasswordResetConfirmView(ThrottleFirstMixin, APIView):
     permission_classes = [AllowAny]
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'password_reset_confirm'
+    query_budget = 4
 
     def post(self, request):
         serializer = PasswordResetConfirmSerializer(data=request.data)
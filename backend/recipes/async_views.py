@@ -0,0 +1,132 @@
+"""
+Native async versions of the recipe CRUD endpoints, for ASGI deployments.
+
+``AsyncRecipeListView`` and ``AsyncRecipeDetailView`` serve the same URLs,
+payloads and status codes as the list/create and retrieve/update/destroy
+actions of ``RecipeViewSet``, including cursor pagination, ?fields=/?omit=
+and the per-user response cache, but read and write through Django's async
+ORM, so a slow client holds a coroutine rather than a worker thread. The
+saves still go through Recipe.save(), so the search and ingredient indexes
+and cache invalidation in signals.py apply unchanged.
+
+``backend/urls.py`` routes to these when ``settings.ASYNC_VIEWS`` is on.
+The bulk, search, pantry, export and import endpoints stay on the viewset.
+"""
+from asgiref.sync import sync_to_async
+from django.http import Http404
+from rest_framework import status
+
+from backend import instrumentation
+from backend.async_api import AsyncAPIView
+from backend.renderers import FastJSONRenderer
+from .models import Recipe
+from .pagination import RecipeCursorPagination
+from .serializers import RecipeSerializer
+from .views import filter_by_cuisine, get_columns, get_field_names, get_representation
+from . import cache, duplicates, rows
+
+
+class AsyncRecipeView(AsyncAPIView):
+    require_authentication = True
+    # Recipes have no float fields, so the fast encoder writes what JSONRenderer would
+    renderer = FastJSONRenderer()
+
+    def get_queryset(self, field_names=None):
+        # Ensure only recipes belonging to the current user are returned
+        queryset = Recipe.objects.filter(user=self.user).order_by('-created_at', '-id')
+        if field_names is None:
+            return queryset.select_related('user')
+        # Only read the columns the response will contain. Nothing can be
+        # lazily loaded from async code, so this must cover every field.
+        queryset = queryset.only(*get_columns(field_names))
+        if 'username' in field_names:
+            queryset = queryset.select_related('user')
+        return queryset
+
+    async def get_object(self, pk, field_names=None):
+        try:
+            return await self.get_queryset(field_names).aget(pk=pk)
+        except Recipe.DoesNotExist:
+            raise Http404('No Recipe matches the given query.')
+
+    def serialize(self, request, instance, serializer_class=RecipeSerializer, **kwargs):
+        with instrumentation.timer(request, 'serialize'):
+            return serializer_class(instance, **kwargs).data
+
+    def respond_cached(self, data, x_cache):
+        response = self.respond(data)
+        if x_cache:
+            response['X-Cache'] = x_cache
+        return response
+
+
+class AsyncRecipeListView(AsyncRecipeView):
+    http_method_names = ['get', 'post', 'options']
+    query_budget = {'get': 3, 'post': 14}
+
+    async def get(self, request):
+        serializer_class = get_representation(request.query_params, 'list')
+        field_names = get_field_names(request.query_params, serializer_class)
+
+        async def render():
+            paginator = RecipeCursorPagination()
+            queryset = filter_by_cuisine(self.get_queryset(field_names), request.query_params)
+            row_renderer = rows.get_row_renderer(serializer_class, field_names)
+            if row_renderer is not None:
+                # Straight from values_list() rows, without model instances or serializer fields
+                page = await paginator.apaginate_queryset(row_renderer.rows(queryset), request)
+                with instrumentation.timer(request, 'serialize'):
+                    data = row_renderer.render(page)
+            else:
+                page = await paginator.apaginate_queryset(queryset, request)
+                data = self.serialize(request, page, serializer_class, many=True, fields=field_names)
+            return paginator.get_paginated_data(data)
+
+        # Served from the per-user response cache until one of the user's recipes changes
+        return self.respond_cached(*await cache.acached_data(request, self.user.pk, render))
+
+    async def post(self, request):
+        serializer = RecipeSerializer(data=self.get_data(request))
+        serializer.is_valid(raise_exception=True)
+        matches = await sync_to_async(duplicates.check_new_recipe)(
+            self.user, serializer.validated_data, allow=duplicates.allow_duplicate(request.query_params),
+        )
+        recipe = await Recipe.objects.acreate(user=self.user, **serializer.validated_data)
+        data = self.serialize(request, recipe)
+        if matches:
+            data['possible_duplicates'] = matches
+        return self.respond(data, status=status.HTTP_201_CREATED)
+
+
+class AsyncRecipeDetailView(AsyncRecipeView):
+    http_method_names = ['get', 'put', 'patch', 'delete', 'options']
+    query_budget = {'get': 3, 'put': 20, 'patch': 20, 'delete': 16}
+
+    async def get(self, request, pk):
+        field_names = get_field_names(request.query_params, RecipeSerializer)
+
+        async def render():
+            recipe = await self.get_object(pk, field_names)
+            return self.serialize(request, recipe, fields=field_names)
+
+        return self.respond_cached(*await cache.acached_data(request, self.user.pk, render))
+
+    async def put(self, request, pk):
+        return await self.update(request, pk, partial=False)
+
+    async def patch(self, request, pk):
+        return await self.update(request, pk, partial=True)
+
+    async def update(self, request, pk, partial):
+        recipe = await self.get_object(pk)
+        serializer = RecipeSerializer(recipe, data=self.get_data(request), partial=partial)
+        serializer.is_valid(raise_exception=True)
+        for attr, value in serializer.validated_data.items():
+            setattr(recipe, attr, value)
+        await recipe.asave()
+        return self.respond(self.serialize(request, recipe))
+
+    async def delete(self, request, pk):
+        recipe = await self.get_object(pk)
+        await recipe.adelete()
+        return self.respond(None, status=status.HTTP_204_NO_CONTENT)
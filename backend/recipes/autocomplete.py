@@ -0,0 +1,289 @@
+"""
+Typeahead suggestions for the search box, served from memory.
+
+Each user's recipe titles are kept in a ``TitleIndex``: a sorted array of
+(normalized text from each word of the title onwards, recipe id), so a
+prefix is found with two bisects instead of a ``LIKE 'abc%'`` scan, and
+"cur" matches both "Curry Puffs" and "Thai Green Curry". Indexes are built
+lazily on a user's first request and kept in an LRU of
+``AUTOCOMPLETE_MAX_USERS`` users per process.
+
+Cuisine suggestions come from a global vocabulary of cuisine names with
+their recipe counts, built from the CuisineFacet counters and refreshed
+every ``AUTOCOMPLETE_VOCABULARY_TTL`` seconds.
+
+Recipe changes are applied to an index in place once they commit. Each
+index remembers the response-cache generation (recipes/cache.py) it
+reflects: an index that missed a change, such as one made by another
+process, sees a newer generation on its next lookup and is rebuilt.
+"""
+import bisect
+import re
+import threading
+import unicodedata
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+
+from backend import metrics
+from backend.lru import LRUCache
+from . import cache
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+# Index entries looked at per query before ranking; bounds the work for one-letter prefixes
+MAX_SCAN = 200
+
+_indexes = LRUCache(getattr(settings, 'AUTOCOMPLETE_MAX_USERS', 1000))
+_build_lock = threading.Lock()
+
+
+def normalize(text):
+    """
+    Lowercase, accent-free words of ``text``, so "Crème" matches "creme".
+    """
+    text = unicodedata.normalize('NFKD', (text or '').lower())
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return _WORD_RE.findall(text)
+
+
+def _prefix_range(entries, prefix):
+    start = bisect.bisect_left(entries, (prefix,))
+    end = bisect.bisect_left(entries, (prefix + '\U0010ffff',), lo=start)
+    return start, end
+
+
+class TitleIndex:
+    """
+    Prefix index over one user's recipe titles.
+    """
+    def __init__(self, titles, generation=None):
+        self.generation = generation
+        self._titles = {}
+        self._entries = []
+        self._lock = threading.Lock()
+        for pk, title in titles:
+            self._titles[pk] = title
+            self._entries.extend(self._entries_for(pk, title))
+        self._entries.sort()
+
+    def __len__(self):
+        return len(self._titles)
+
+    @staticmethod
+    def _entries_for(pk, title):
+        words = normalize(title)
+        return [(' '.join(words[position:]), position, pk) for position in range(len(words))]
+
+    def set(self, pk, title):
+        with self._lock:
+            self._remove(pk)
+            self._titles[pk] = title
+            for entry in self._entries_for(pk, title):
+                bisect.insort(self._entries, entry)
+
+    def remove(self, pk):
+        with self._lock:
+            self._remove(pk)
+
+    def _remove(self, pk):
+        title = self._titles.pop(pk, None)
+        if title is None:
+            return
+        for entry in self._entries_for(pk, title):
+            index = bisect.bisect_left(self._entries, entry)
+            if index < len(self._entries) and self._entries[index] == entry:
+                del self._entries[index]
+
+    def search(self, query, limit=8):
+        """
+        Recipes with a title word starting with ``query``: titles that start
+        with it first, then alphabetically.
+        """
+        prefix = ' '.join(normalize(query))
+        if not prefix:
+            return []
+        with self._lock:
+            start, end = _prefix_range(self._entries, prefix)
+            candidates = {}
+            for _, position, pk in self._entries[start:min(end, start + MAX_SCAN)]:
+                if position < candidates.get(pk, position + 1):
+                    candidates[pk] = position
+            ranked = sorted(candidates, key=lambda pk: (candidates[pk] > 0, self._titles[pk].lower(), pk))
+            return [{'id': pk, 'title': self._titles[pk]} for pk in ranked[:limit]]
+
+
+class CuisineVocabulary:
+    """
+    Every cuisine in use, with its number of recipes across all users.
+    Spellings that differ only in case or accents are merged under the
+    most common one.
+    """
+    def __init__(self, counts):
+        merged = {}
+        for cuisine, count in counts:
+            key = ' '.join(normalize(cuisine))
+            if not key:
+                continue
+            spellings = merged.setdefault(key, {})
+            spellings[cuisine] = spellings.get(cuisine, 0) + count
+        self._entries = sorted(
+            (key, max(spellings, key=spellings.get), sum(spellings.values()))
+            for key, spellings in merged.items()
+        )
+        self._lock = threading.Lock()
+
+    def add(self, cuisine):
+        """
+        Make a newly used cuisine suggestible before the next refresh.
+        """
+        key = ' '.join(normalize(cuisine))
+        if not key:
+            return
+        with self._lock:
+            start, end = _prefix_range(self._entries, key)
+            if not any(entry[0] == key for entry in self._entries[start:end]):
+                bisect.insort(self._entries, (key, cuisine, 1))
+
+    def search(self, query, limit=5):
+        prefix = ' '.join(normalize(query))
+        if not prefix:
+            return []
+        with self._lock:
+            start, end = _prefix_range(self._entries, prefix)
+            matches = self._entries[start:min(end, start + MAX_SCAN)]
+        matches = sorted(matches, key=lambda entry: (-entry[2], entry[0]))
+        return [{'cuisine': cuisine, 'count': count} for _, cuisine, count in matches[:limit]]
+
+
+_vocabulary = LRUCache(1, ttl=getattr(settings, 'AUTOCOMPLETE_VOCABULARY_TTL', 300))
+
+
+def get_vocabulary():
+    from django.db.models import Sum
+    from .models import CuisineFacet
+
+    vocabulary = _vocabulary.get('cuisines')
+    if vocabulary is None:
+        vocabulary = CuisineVocabulary(
+            CuisineFacet.objects.exclude(cuisine='').order_by()
+            .values('cuisine').annotate(total=Sum('count')).values_list('cuisine', 'total')
+        )
+        _vocabulary.set('cuisines', vocabulary)
+    return vocabulary
+
+
+def get_index(user_id):
+    """
+    The user's title index, built on first use or when it fell behind.
+    """
+    from .models import Recipe
+
+    generation = cache.get_generation(user_id)
+    index = _indexes.get(user_id)
+    if index is not None and index.generation == generation:
+        metrics.incr('autocomplete.hits')
+        return index
+
+    metrics.incr('autocomplete.builds')
+    with _build_lock:
+        index = _indexes.get(user_id)
+        if index is None or index.generation != generation:
+            index = TitleIndex(Recipe.objects.filter(user_id=user_id).values_list('id', 'title'), generation)
+            _indexes.set(user_id, index)
+    return index
+
+
+def suggest(user, query, limit=8):
+    return {
+        'titles': get_index(user.pk).search(query, limit=limit),
+        'cuisines': get_vocabulary().search(query, limit=min(limit, 5)),
+    }
+
+
+def _apply(user_id, change):
+    """
+    Apply ``change`` to the user's index if it was current just before the
+    write; otherwise drop it, to be rebuilt on the next lookup.
+    """
+    index = _indexes.get(user_id)
+    if index is None:
+        return
+    # invalidate_user() bumps the generation before this runs; anything bumped
+    # in between, here or in another process, means the index missed a change
+    bump = cache.last_bump(user_id)
+    if bump is not None:
+        previous, generation = bump
+        if index.generation != previous or cache.get_generation(user_id) != generation:
+            _indexes.pop(user_id)
+            return
+        index.generation = generation
+    change(index)
+
+
+def _set_titles(titles):
+    def change(index):
+        for pk, title in titles:
+            index.set(pk, title)
+    return change
+
+
+def recipes_saved(recipes):
+    """
+    Apply saved titles and cuisines once the transaction commits. Call
+    after cache.invalidate_user() so the generation bump lands first.
+    """
+    titles = defaultdict(list)
+    cuisines = set()
+    stale = set()
+    for recipe in recipes:
+        if 'title' not in recipe.__dict__:
+            # Can't tell the title without a query; rebuild instead
+            stale.add(recipe.user_id)
+            continue
+        titles[recipe.user_id].append((recipe.pk, recipe.title))
+        if recipe.__dict__.get('cuisine_type'):
+            cuisines.add(recipe.cuisine_type)
+
+    def after_commit():
+        for user_id in stale:
+            _indexes.pop(user_id)
+        for user_id, user_titles in titles.items():
+            if user_id not in stale:
+                _apply(user_id, _set_titles(user_titles))
+        vocabulary = _vocabulary.get('cuisines')
+        if vocabulary is not None:
+            for cuisine in cuisines:
+                vocabulary.add(cuisine)
+
+    transaction.on_commit(after_commit)
+
+
+def recipe_deleted(recipe):
+    """
+    Drop the title once the delete commits; call after cache.invalidate_user().
+    """
+    recipes_deleted([recipe])
+
+
+def recipes_deleted(recipes):
+    """
+    Drop the titles once the delete commits; call after cache.invalidate_user()
+    has been called once for each of their users.
+    """
+    removed = defaultdict(list)
+    for recipe in recipes:
+        removed[recipe.user_id].append(recipe.pk)
+
+    def remove(pks):
+        def change(index):
+            for pk in pks:
+                index.remove(pk)
+        return change
+
+    def after_commit():
+        for user_id, pks in removed.items():
+            _apply(user_id, remove(pks))
+
+    transaction.on_commit(after_commit)
@@ -0,0 +1,206 @@
+"""
+Batch create / update / delete / read of a user's recipes.
+
+Every item is validated with the same RecipeSerializer rules as the single
+recipe endpoints. Valid items are then written with one bulk_create or
+bulk_update inside a single transaction. With ``all_or_nothing`` any
+invalid item aborts the whole batch; otherwise the valid items are written
+and the invalid ones are reported by their position in the request; a
+batch with no valid item writes nothing and answers 400.
+"""
+from django.db import models, transaction
+from django.db.models.deletion import get_candidate_relations_to_delete
+from django.utils import timezone
+
+from . import similarity
+from .models import CONTENT_HASH_FIELDS, Recipe
+from .serializers import RecipeSerializer
+from .signals import recipes_bulk_deleted, recipes_bulk_saved
+
+MAX_BATCH_SIZE = 500
+
+
+class BatchError(Exception):
+    """
+    The batch as a whole is unusable (wrong shape, too large, bad ids).
+    """
+
+
+def parse_ids(value):
+    """
+    Parse "1,2,3" (or a list of ints/strings) into a de-duplicated list of ids.
+    """
+    if isinstance(value, str):
+        value = [part for part in value.split(',') if part.strip()]
+    try:
+        ids = [int(part) for part in value]
+    except (TypeError, ValueError):
+        raise BatchError('ids must be a comma-separated list of integers.')
+    if len(ids) > MAX_BATCH_SIZE:
+        raise BatchError(f'At most {MAX_BATCH_SIZE} ids per request.')
+    return list(dict.fromkeys(ids))
+
+
+def _check_items(items):
+    if not isinstance(items, list):
+        raise BatchError('Expected a list of recipes.')
+    if not items:
+        raise BatchError('The list of recipes is empty.')
+    if len(items) > MAX_BATCH_SIZE:
+        raise BatchError(f'At most {MAX_BATCH_SIZE} recipes per request.')
+
+
+def _result(saved, errors):
+    return {
+        'results': RecipeSerializer(saved, many=True).data,
+        'errors': errors,
+    }
+
+
+def read_recipes(user, ids):
+    """
+    Fetch several recipes in one query, in the order the ids were given.
+    """
+    recipes = Recipe.objects.filter(user=user, pk__in=ids).select_related('user').in_bulk()
+    found = [recipes[pk] for pk in ids if pk in recipes]
+    return {
+        'results': RecipeSerializer(found, many=True).data,
+        'not_found': [pk for pk in ids if pk not in recipes],
+    }
+
+
+def create_recipes(user, items, all_or_nothing=False):
+    """
+    Validate and insert a list of recipes for ``user``.
+    Returns ``(payload, written)``; ``written`` is False when nothing was saved
+    because of validation errors: any in all-or-nothing mode, or in every item.
+    """
+    _check_items(items)
+    serializer = RecipeSerializer(data=items, many=True)
+    errors = []
+    if serializer.is_valid():
+        valid = serializer.validated_data
+    else:
+        # Depending on the DRF version, ListSerializer reports errors either as
+        # a list with one (possibly empty) dict per item or keyed by index
+        item_errors = serializer.errors
+        if isinstance(item_errors, dict):
+            item_errors = item_errors.items()
+        else:
+            item_errors = enumerate(item_errors)
+        errors = [
+            {'index': index, 'errors': errors_for_item}
+            for index, errors_for_item in sorted(item_errors) if errors_for_item
+        ]
+        invalid = {error['index'] for error in errors}
+        if all_or_nothing or len(invalid) == len(items):
+            return _result([], errors), False
+        serializer = RecipeSerializer(
+            data=[item for index, item in enumerate(items) if index not in invalid], many=True,
+        )
+        serializer.is_valid(raise_exception=True)
+        valid = serializer.validated_data
+
+    recipes = [Recipe(user=user, **attrs) for attrs in valid]
+    for recipe in recipes:
+        recipe.refresh_content_hash()
+    with transaction.atomic():
+        created = Recipe.objects.bulk_create(recipes)
+        recipes_bulk_saved.send(sender=Recipe, recipes=created, created=True)
+    return _result(created, errors), True
+
+
+def update_recipes(user, items, partial=True, all_or_nothing=False):
+    """
+    Validate and apply a list of changes, each carrying the recipe ``id``.
+    Returns ``(payload, written)`` like create_recipes.
+    """
+    _check_items(items)
+    ids = []
+    for item in items:
+        if not isinstance(item, dict) or 'id' not in item:
+            raise BatchError('Every recipe to update needs an "id".')
+        ids.append(item['id'])
+    ids = parse_ids(ids)
+    instances = Recipe.objects.filter(user=user, pk__in=ids).select_related('user').in_bulk()
+
+    errors = []
+    changed = []
+    fields = set()
+    seen = set()
+    for index, item in enumerate(items):
+        pk = int(item['id'])
+        if pk in seen:
+            # Applying both would save the recipe twice in one batch
+            errors.append({'index': index, 'errors': {'id': ['Listed more than once.']}})
+            continue
+        seen.add(pk)
+        instance = instances.get(pk)
+        if instance is None:
+            errors.append({'index': index, 'errors': {'id': ['Not found.']}})
+            continue
+        item_serializer = RecipeSerializer(instance, data=item, partial=partial)
+        if not item_serializer.is_valid():
+            errors.append({'index': index, 'errors': item_serializer.errors})
+            continue
+        for attr, value in item_serializer.validated_data.items():
+            setattr(instance, attr, value)
+            fields.add(attr)
+        changed.append(instance)
+
+    if errors and (all_or_nothing or not changed):
+        return _result([], errors), False
+
+    if changed:
+        # bulk_update() skips auto_now, so stamp updated_at ourselves
+        now = timezone.now()
+        for instance in changed:
+            instance.updated_at = now
+        fields.add('updated_at')
+        if fields & set(CONTENT_HASH_FIELDS):
+            for instance in changed:
+                instance.refresh_content_hash()
+            fields.add('content_hash')
+        with transaction.atomic():
+            Recipe.objects.bulk_update(changed, sorted(fields))
+            recipes_bulk_saved.send(sender=Recipe, recipes=changed, created=False)
+    return _result(changed, errors), True
+
+
+def _delete_rows(recipe_ids):
+    """
+    Delete the recipes and the rows that cascade from them, one statement
+    per table. QuerySet.delete() would send pre_delete and post_delete for
+    every recipe; the caller sends recipes_bulk_deleted instead.
+    """
+    for relation in get_candidate_relations_to_delete(Recipe._meta):
+        if relation.on_delete is not models.CASCADE:
+            raise NotImplementedError(f'{relation} does not cascade.')
+        relation.related_model._base_manager.filter(**{f'{relation.field.name}__in': recipe_ids}).delete()
+    Recipe.objects.filter(pk__in=recipe_ids)._raw_delete(Recipe.objects.db)
+
+
+def delete_recipes(user, ids, all_or_nothing=False):
+    """
+    Delete several of ``user``'s recipes in one transaction.
+    Returns ``(payload, written)`` like create_recipes.
+    """
+    ids = parse_ids(ids)
+    if not ids:
+        raise BatchError('No ids given.')
+
+    with transaction.atomic():
+        recipes = list(Recipe.objects.filter(user=user, pk__in=ids).only('id', 'user', 'cuisine_type'))
+        existing = {recipe.pk for recipe in recipes}
+        errors = [
+            {'index': index, 'errors': {'id': ['Not found.']}}
+            for index, pk in enumerate(ids) if pk not in existing
+        ]
+        if errors and (all_or_nothing or not existing):
+            return {'deleted': [], 'errors': errors}, False
+        # The neighbour rows pointing at them go with the cascade
+        similarity.note_referrers(recipes)
+        _delete_rows(list(existing))
+        recipes_bulk_deleted.send(sender=Recipe, recipes=recipes)
+    return {'deleted': [pk for pk in ids if pk in existing], 'errors': errors}, True
+
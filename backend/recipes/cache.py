@@ -0,0 +1,171 @@
+"""
+Per-user response cache for the recipe list and detail endpoints.
+
+Entries are stored in the Django cache named by ``RECIPE_CACHE_ALIAS``
+(local memory by default). Every key embeds the user's current
+*generation*; any write to one of the user's recipes bumps the generation
+once the transaction commits, so older entries simply stop being addressed
+and are never served again.
+
+Generations live in ``RECIPE_CACHE_GENERATION_ALIAS``, which every worker
+process must see: a write handled by one process has to retire the entries
+all the others hold. With no such alias, or one naming a per-process cache,
+response caching is turned off.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from rest_framework.response import Response
+
+from backend import metrics
+from backend.lru import LRUCache
+
+KEY_PREFIX = 'recipes'
+
+_last_bumps = LRUCache(10000)
+
+
+def get_cache():
+    """
+    Return the configured cache, or None when response caching is disabled.
+    """
+    alias = getattr(settings, 'RECIPE_CACHE_ALIAS', None)
+    if not alias or get_generation_cache() is None:
+        return None
+    return caches[alias]
+
+
+def get_generation_cache():
+    """
+    Return the cache holding the generations, or None when there's no cache
+    all processes share.
+    """
+    alias = getattr(settings, 'RECIPE_CACHE_GENERATION_ALIAS', None)
+    if not alias:
+        return None
+    generations = caches[alias]
+    # A bump only this process can see would leave the others serving old entries
+    if isinstance(generations, (LocMemCache, DummyCache)):
+        return None
+    return generations
+
+
+def _generation_key(user_id):
+    return f'{KEY_PREFIX}:gen:{user_id}'
+
+
+def get_generation(user_id):
+    """
+    The user's current generation, or None when response caching is disabled.
+    """
+    generations = get_generation_cache()
+    if generations is None:
+        return None
+    key = _generation_key(user_id)
+    generation = generations.get(key)
+    if generation is None:
+        # Seed from the clock rather than 1 so that a generation counter
+        # evicted from the cache can never line up with entries written
+        # under its earlier life.
+        generations.add(key, time.time_ns(), timeout=None)
+        generation = generations.get(key)
+    return generation
+
+
+def bump_generation(user_id):
+    generations = get_generation_cache()
+    if generations is None:
+        return
+    key = _generation_key(user_id)
+    previous = generations.get(key)
+    # A fresh value rather than incr(): incr() is a read and a write on most
+    # shared backends, and two processes bumping at once would both land on
+    # the same number, one that a reader may already have filed entries under.
+    generation = time.time_ns()
+    generations.set(key, generation, timeout=None)
+    _last_bumps.set(user_id, (previous, generation))
+    metrics.incr('recipe_cache.invalidations')
+
+
+def last_bump(user_id):
+    """
+    ``(previous, new)`` generations of this process's latest bump for the
+    user, or None.
+    """
+    return _last_bumps.get(user_id)
+
+
+def invalidate_user(user_id):
+    """
+    Invalidate all cached responses of a user once the current transaction
+    commits (immediately in autocommit mode), so a reader can't re-cache
+    the pre-write rows under the new generation.
+    """
+    transaction.on_commit(lambda: bump_generation(user_id))
+
+
+def _entry_key(user_id, generation, request):
+    return f'{KEY_PREFIX}:{user_id}:{generation}:{request.get_full_path()}'
+
+
+def _lookup(cache, request, user_id):
+    """
+    The cache key for ``request`` and the data stored under it, or None.
+    """
+    # Read the generation before rendering: if a write lands while we
+    # render, our entry is filed under the old generation and never read.
+    key = _entry_key(user_id, get_generation(user_id), request)
+    data = cache.get(key)
+    metrics.incr('recipe_cache.misses' if data is None else 'recipe_cache.hits')
+    return key, data
+
+
+def _store(cache, key, data):
+    cache.set(key, data, timeout=getattr(settings, 'RECIPE_CACHE_TIMEOUT', 300))
+
+
+def cached_response(request, render):
+    """
+    Serve ``request`` from the cache when the user's current generation has
+    an entry for it; otherwise call ``render()`` (returning a DRF Response)
+    and store its data if it was a 200. Marks the response with X-Cache.
+    """
+    cache = get_cache()
+    if cache is None:
+        return render()
+
+    key, data = _lookup(cache, request, request.user.pk)
+    if data is not None:
+        response = Response(data)
+        response['X-Cache'] = 'HIT'
+        return response
+
+    response = render()
+    if response.status_code == 200:
+        _store(cache, key, response.data)
+    response['X-Cache'] = 'MISS'
+    return response
+
+
+async def acached_data(request, user_id, render):
+    """
+    Async counterpart of cached_response() for views that build plain data:
+    awaits ``render()`` on a miss. Returns ``(data, x_cache)``, where
+    x_cache is 'HIT', 'MISS' or None when caching is disabled.
+    """
+    cache = get_cache()
+    if cache is None:
+        return await render(), None
+
+    # Called directly: entries are in memory and a generation is one small
+    # read, cheaper than the thread hop the async cache API costs per call.
+    key, data = _lookup(cache, request, user_id)
+    if data is not None:
+        return data, 'HIT'
+    data = await render()
+    _store(cache, key, data)
+    return data, 'MISS'
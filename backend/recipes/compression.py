@@ -0,0 +1,296 @@
+"""
+Compressed storage for the large recipe text columns.
+
+``CompressedTextField`` is a TextField to Django, forms and DRF, but the
+column holds a small frame instead of the text:
+
+    0x00 <utf-8 text>                      short texts, stored as is
+    0x01 <dictionary id: u16> <deflate>    raw deflate primed with a preset dictionary
+
+Recipes are short, so plain zlib finds little to refer back to. A preset
+dictionary of phrases common in recipes ("preheat the oven to", "finely
+chopped", "tablespoons") gives every recipe that history up front. The
+dictionaries live in ``recipes/zdicts/<id>.zdict``; ``TEXT_COMPRESSION_DICTIONARY``
+picks the one new writes use, and older ones must be kept for as long as
+rows refer to them. ``manage.py train_text_dictionary`` builds a new one
+from the recipes in the database and measures it on recipes held out of
+training.
+
+New writes use plain deflate (dictionary 0) by default. The shipped
+``1.zdict`` was trained on the development recipes plus seed_recipes
+output, whose text comes from a few fixed phrases; on real recipes it
+hasn't seen it only takes them from about 48% of their size to 45%, and
+every row written with it needs the file for good. It is kept so rows
+already written with it still read back. Switch to a dictionary only once
+one has been trained on production recipes.
+
+Loaded values are decompressed on first attribute access, not when the
+row is read, so list pages and index maintenance that never look at the
+text don't pay for it, and saving a recipe whose text wasn't changed
+writes the stored frame back instead of compressing the text again. ``values()`` and ``values_list()`` on
+Recipe decode as usual (see ``CompressedTextQuerySet``).
+
+Columns that still hold plain text, such as rows not yet converted by the
+data migration, read back unchanged. Full-text search keeps its own,
+uncompressed copy of the text in the FTS index (search.py), so the
+database file shrinks by much less than these columns do.
+
+Breaking change: the text can't be searched in SQL. Only ``isnull``
+lookups are allowed on ``ingredients`` and ``instructions``; any other,
+such as ``ingredients__icontains``, raises FieldError. Search through the
+FTS index or the ingredient index (ingredients.py) instead.
+"""
+import functools
+import re
+import struct
+import zlib
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.db import models
+from django.db.models.query_utils import DeferredAttribute
+
+RAW = 0x00
+DEFLATE = 0x01
+_HEADER = struct.Struct('<BH')
+
+DICTIONARY_DIR = Path(__file__).resolve().parent / 'zdicts'
+# zlib only looks back 32 KB, so a larger dictionary is never used
+MAX_DICTIONARY_SIZE = 32 * 1024
+
+_dictionaries = {}
+
+
+def get_dictionary(dictionary_id):
+    """
+    The preset dictionary stored as ``<dictionary_id>.zdict``; id 0 is none.
+    """
+    if dictionary_id == 0:
+        return b''
+    dictionary = _dictionaries.get(dictionary_id)
+    if dictionary is None:
+        directory = Path(getattr(settings, 'TEXT_COMPRESSION_DICTIONARY_DIR', None) or DICTIONARY_DIR)
+        dictionary = _dictionaries[dictionary_id] = (directory / f'{dictionary_id}.zdict').read_bytes()
+    return dictionary
+
+
+def _compressor(dictionary_id, level):
+    dictionary = get_dictionary(dictionary_id)
+    if dictionary:
+        return zlib.compressobj(level, zlib.DEFLATED, -15, 9, zlib.Z_DEFAULT_STRATEGY, dictionary)
+    return zlib.compressobj(level, zlib.DEFLATED, -15, 9)
+
+
+def encode(text, dictionary_id=None, level=None):
+    """
+    Frame ``text`` for storage: compressed when that makes it smaller.
+    """
+    if dictionary_id is None:
+        dictionary_id = getattr(settings, 'TEXT_COMPRESSION_DICTIONARY', 0)
+    if level is None:
+        level = getattr(settings, 'TEXT_COMPRESSION_LEVEL', 9)
+    data = text.encode('utf-8')
+    if len(data) >= getattr(settings, 'TEXT_COMPRESSION_MIN_SIZE', 64):
+        compressor = _compressor(dictionary_id, level)
+        compressed = compressor.compress(data) + compressor.flush()
+        if len(compressed) + _HEADER.size < len(data) + 1:
+            return _HEADER.pack(DEFLATE, dictionary_id) + compressed
+    return bytes([RAW]) + data
+
+
+def is_encoded(value):
+    return isinstance(value, (bytes, bytearray, memoryview)) and len(value) > 0 and value[0] in (RAW, DEFLATE)
+
+
+def decode(frame):
+    """
+    The text in ``frame``. Anything that isn't a frame is taken to be text
+    stored before the column was compressed.
+    """
+    if isinstance(frame, str):
+        return frame
+    frame = bytes(frame)
+    if not is_encoded(frame):
+        return frame.decode('utf-8')
+    if frame[0] == RAW:
+        return frame[1:].decode('utf-8')
+    _, dictionary_id = _HEADER.unpack_from(frame)
+    dictionary = get_dictionary(dictionary_id)
+    if dictionary:
+        decompressor = zlib.decompressobj(-15, zdict=dictionary)
+    else:
+        decompressor = zlib.decompressobj(-15)
+    return (decompressor.decompress(frame[_HEADER.size:]) + decompressor.flush()).decode('utf-8')
+
+
+class StoredText:
+    """
+    A loaded column value, decompressed the first time it is asked for.
+    """
+    __slots__ = ('frame', '_text')
+
+    def __init__(self, frame):
+        self.frame = frame
+        self._text = None
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = decode(self.frame)
+        return self._text
+
+    def __str__(self):
+        return self.text
+
+    def __repr__(self):
+        return f'<StoredText {len(self.frame)} bytes>'
+
+
+def resolve(value):
+    return value.text if isinstance(value, StoredText) else value
+
+
+class CompressedTextDescriptor(DeferredAttribute):
+    # A data descriptor (unlike DeferredAttribute), so reads of a loaded value still come here
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        return resolve(super().__get__(instance, cls))
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.field.attname] = value
+
+
+class CompressedTextField(models.TextField):
+    descriptor_class = CompressedTextDescriptor
+
+    def get_internal_type(self):
+        # Stored in a binary column; to forms and serializers it is still a TextField
+        return 'BinaryField'
+
+    def get_lookup(self, lookup_name):
+        # The column holds compressed bytes, so text lookups can't work in SQL
+        if lookup_name != 'isnull':
+            return None
+        return super().get_lookup(lookup_name)
+
+    def from_db_value(self, value, expression, connection):
+        if value is None or isinstance(value, str):
+            return value
+        if is_encoded(value):
+            return StoredText(bytes(value))
+        return bytes(value).decode('utf-8')
+
+    def to_python(self, value):
+        return super().to_python(resolve(value))
+
+    def pre_save(self, model_instance, add):
+        # The raw value, so that an unchanged StoredText keeps its frame
+        if self.attname in model_instance.__dict__:
+            return model_instance.__dict__[self.attname]
+        return super().pre_save(model_instance, add)
+
+    def get_prep_value(self, value):
+        if value is None or isinstance(value, StoredText):
+            return value
+        return str(value)
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if not prepared:
+            value = self.get_prep_value(value)
+        if value is None:
+            return None
+        # Unchanged since it was loaded: write the stored frame back as is
+        frame = value.frame if isinstance(value, StoredText) else encode(value)
+        return connection.Database.Binary(frame)
+
+    def value_to_string(self, obj):
+        return resolve(self.value_from_object(obj))
+
+
+@functools.lru_cache(maxsize=None)
+def _decoding(iterable_class):
+    class DecodingIterable(iterable_class):
+        def __iter__(self):
+            for row in super().__iter__():
+                if isinstance(row, StoredText):
+                    yield row.text
+                elif isinstance(row, dict):
+                    yield {key: resolve(value) for key, value in row.items()}
+                elif isinstance(row, tuple) and any(isinstance(value, StoredText) for value in row):
+                    values = [resolve(value) for value in row]
+                    # Named rows from values_list(named=True) are namedtuples
+                    yield type(row)(*values) if hasattr(row, '_fields') else tuple(values)
+                else:
+                    yield row
+
+    DecodingIterable.__name__ = f'Decoding{iterable_class.__name__}'
+    return DecodingIterable
+
+
+class CompressedTextQuerySet(models.QuerySet):
+    """
+    Decodes compressed columns in ``values()`` and ``values_list()`` rows,
+    which have no model instance to decompress them lazily.
+    """
+    def values(self, *fields, **expressions):
+        clone = super().values(*fields, **expressions)
+        clone._iterable_class = _decoding(clone._iterable_class)
+        return clone
+
+    def values_list(self, *fields, flat=False, named=False):
+        clone = super().values_list(*fields, flat=flat, named=named)
+        clone._iterable_class = _decoding(clone._iterable_class)
+        return clone
+
+
+# Dictionary training
+
+_SEGMENT_RE = re.compile(r'\S+\s*')
+MAX_SEGMENT_WORDS = 6
+
+
+def train_dictionary(texts, size=MAX_DICTIONARY_SIZE, min_documents=2):
+    """
+    Build a preset dictionary from sample ``texts``.
+
+    Candidates are runs of up to MAX_SEGMENT_WORDS words, scored by the
+    number of texts they appear in times the bytes a match saves. The best
+    are packed until ``size``, best last, since deflate encodes nearer
+    matches in fewer bits.
+    """
+    documents = Counter()
+    for text in texts:
+        segments = set()
+        # Within lines: runs across them are mostly chance pairings of steps
+        for line in text.splitlines(keepends=True):
+            words = _SEGMENT_RE.findall(line)
+            for start in range(len(words)):
+                for end in range(start + 1, min(start + MAX_SEGMENT_WORDS, len(words)) + 1):
+                    segments.add(''.join(words[start:end]))
+        documents.update(segments)
+
+    candidates = sorted(
+        (
+            (count * (len(segment.encode('utf-8')) - 3), segment)
+            for segment, count in documents.items()
+            if count >= min_documents and len(segment) > 3
+        ),
+        reverse=True,
+    )
+    chosen = []
+    used = 0
+    packed = ''
+    for _, segment in candidates:
+        if segment in packed:
+            continue
+        length = len(segment.encode('utf-8'))
+        if used + length > size:
+            continue
+        chosen.append(segment)
+        packed += segment
+        used += length
+        if used >= size - 8:
+            break
+    return ''.join(reversed(chosen)).encode('utf-8')
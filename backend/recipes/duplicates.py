@@ -0,0 +1,341 @@
+"""
+Near-duplicate detection with MinHash signatures and an LSH band index.
+
+A recipe's ``ingredients`` and ``instructions`` are reduced to overlapping
+word ``SHINGLE_SIZE``-grams. Its signature holds, for each of ``NUM_PERM``
+hash permutations, the smallest permuted shingle hash; the share of
+positions where two signatures agree estimates the Jaccard similarity of
+the two shingle sets.
+
+The signature is cut into ``BANDS`` bands of ``ROWS`` values, and each band
+is hashed to a bucket key stored in ``RecipeBand``. Two recipes become
+candidates when they share any bucket, which with 16 bands of 4 rows
+catches a pair at 0.8 similarity with probability 0.9998 and one at 0.3
+with about 0.12. Finding the candidates of a new recipe is one lookup of
+its 16 keys in the (key, user, recipe) index, however many recipes there
+are; only those candidates' signatures are compared.
+
+Shingle hashes come from BLAKE2b and the permutations from a fixed seed,
+so signatures are stable across processes and releases. Changing any of
+the constants below requires re-running ``find_duplicate_recipes --reindex``.
+"""
+import hashlib
+import random
+import re
+import struct
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from backend.lru import LRUCache
+
+SHINGLE_SIZE = 3
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+
+# Mersenne prime for the (a * x + b) mod p permutations
+_PRIME = (1 << 61) - 1
+_MAX_KEY = (1 << 63) - 1
+_SEED = 1
+_rng = random.Random(_SEED)
+PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+_SIGNATURE_FORMAT = f'<{NUM_PERM}Q'
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+# Creating a recipe computes its signature for the check and again when
+# the save is indexed; remember the last few
+_signatures = LRUCache(256)
+
+
+class DuplicateRecipe(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'This looks like a recipe you already have.'
+    default_code = 'duplicate'
+
+    def __init__(self, matches):
+        super().__init__()
+        # Set after __init__, which would turn the ids and scores into strings
+        self.detail = {'detail': self.default_detail, 'possible_duplicates': matches}
+
+
+def get_threshold():
+    return getattr(settings, 'DUPLICATE_RECIPE_THRESHOLD', 0.8)
+
+
+def source_text(ingredients, instructions):
+    return ' '.join(_WORD_RE.findall(f'{ingredients or ""}\n{instructions or ""}'.lower()))
+
+
+def source_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def shingles(text):
+    words = text.split()
+    if len(words) <= SHINGLE_SIZE:
+        return {text} if text else set()
+    return {' '.join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def compute_signature(text):
+    """
+    MinHash signature of normalized ``text`` as a tuple of NUM_PERM ints,
+    or None when there is nothing to shingle.
+    """
+    hashes = [
+        int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'little') % _PRIME
+        for shingle in shingles(text)
+    ]
+    if not hashes:
+        return None
+    return tuple(min((a * x + b) % _PRIME for x in hashes) for a, b in PERMUTATIONS)
+
+
+def signature_for(ingredients, instructions):
+    """
+    ``(source_hash, signature)`` for a recipe's text.
+    """
+    text = source_text(ingredients, instructions)
+    digest = source_hash(text)
+    signature = _signatures.get(digest)
+    if signature is None:
+        signature = compute_signature(text)
+        _signatures.set(digest, signature)
+    return digest, signature
+
+
+def pack(signature):
+    return struct.pack(_SIGNATURE_FORMAT, *signature)
+
+
+def unpack(data):
+    return struct.unpack(_SIGNATURE_FORMAT, bytes(data))
+
+
+def band_keys(signature):
+    """
+    One bucket key per band; the band number is hashed in, so equal values
+    in different bands don't collide.
+    """
+    keys = []
+    for band in range(BANDS):
+        values = signature[band * ROWS:(band + 1) * ROWS]
+        digest = hashlib.blake2b(struct.pack(f'<B{ROWS}Q', band, *values), digest_size=8).digest()
+        keys.append(int.from_bytes(digest, 'little') & _MAX_KEY)
+    return keys
+
+
+def similarity(signature1, signature2):
+    """
+    Estimated Jaccard similarity of the two shingle sets.
+    """
+    return sum(1 for a, b in zip(signature1, signature2) if a == b) / NUM_PERM
+
+
+def find_duplicates(user_id, signature, exclude=None, threshold=None):
+    """
+    The user's recipes whose text is at least ``threshold`` similar to
+    ``signature``, most similar first.
+    """
+    from .models import RecipeBand, RecipeSignature
+
+    if signature is None:
+        return []
+    threshold = get_threshold() if threshold is None else threshold
+    candidates = RecipeBand.objects.filter(key__in=band_keys(signature), user_id=user_id)
+    if exclude is not None:
+        candidates = candidates.exclude(recipe_id=exclude)
+    matches = []
+    for recipe_id, title, data in RecipeSignature.objects.filter(
+        recipe_id__in=candidates.values('recipe_id'),
+    ).values_list('recipe_id', 'recipe__title', 'signature'):
+        score = similarity(signature, unpack(data))
+        if score >= threshold:
+            matches.append({'id': recipe_id, 'title': title, 'similarity': round(score, 4)})
+    matches.sort(key=lambda match: (-match['similarity'], -match['id']))
+    return matches
+
+
+def check_new_recipe(user, attrs, allow=False):
+    """
+    Look for recipes of ``user`` like the one about to be created from
+    ``attrs``. Depending on DUPLICATE_RECIPE_ACTION, matches are returned
+    ('flag'), refused with DuplicateRecipe unless ``allow`` ('reject'), or
+    not looked for at all (None).
+    """
+    action = getattr(settings, 'DUPLICATE_RECIPE_ACTION', 'flag')
+    if action is None:
+        return []
+    _, signature = signature_for(attrs.get('ingredients'), attrs.get('instructions'))
+    matches = find_duplicates(user.pk, signature)
+    if matches and action == 'reject' and not allow:
+        raise DuplicateRecipe(matches)
+    return matches
+
+
+def allow_duplicate(params):
+    return params.get('allow_duplicate', '').lower() in ('1', 'true', 'yes')
+
+
+def index_recipes(recipes, created=False):
+    """
+    Store signatures and band keys for the saved recipes. Recipes whose
+    ingredients and instructions didn't change cost a single read, and
+    just-inserted ones (``created``) none.
+    """
+    from .models import RecipeBand, RecipeSignature
+
+    recipes = [
+        recipe for recipe in recipes
+        if recipe.pk is not None and 'ingredients' in recipe.__dict__ and 'instructions' in recipe.__dict__
+    ]
+    if not recipes:
+        return
+
+    stored = {} if created else dict(
+        RecipeSignature.objects.filter(recipe_id__in=[recipe.pk for recipe in recipes])
+        .values_list('recipe_id', 'source_hash')
+    )
+    signatures = []
+    bands = []
+    changed = []
+    cleared = []
+    for recipe in recipes:
+        digest, signature = signature_for(recipe.ingredients, recipe.instructions)
+        if stored.get(recipe.pk) == digest:
+            continue
+        changed.append(recipe.pk)
+        if signature is None:
+            cleared.append(recipe.pk)
+            continue
+        signatures.append(RecipeSignature(
+            recipe_id=recipe.pk, source_hash=digest, signature=pack(signature),
+        ))
+        bands.extend(
+            RecipeBand(key=key, user_id=recipe.user_id, recipe_id=recipe.pk) for key in band_keys(signature)
+        )
+    if not changed:
+        return
+
+    with transaction.atomic(savepoint=False):
+        if not created:
+            # Signatures are overwritten in place below; only the emptied ones go
+            if cleared:
+                RecipeSignature.objects.filter(recipe_id__in=cleared).delete()
+            RecipeBand.objects.filter(recipe_id__in=changed).delete()
+        RecipeSignature.objects.bulk_create(
+            signatures, batch_size=500, update_conflicts=not created,
+            unique_fields=None if created else ['recipe'],
+            update_fields=None if created else ['source_hash', 'signature'],
+        )
+        RecipeBand.objects.bulk_create(bands, batch_size=500)
+
+
+def rebuild_index(batch_size=500, stdout=None):
+    """
+    Recompute every signature in primary-key batches. Returns the number indexed.
+    """
+    from .models import Recipe, RecipeBand, RecipeSignature
+
+    RecipeSignature.objects.all().delete()
+    RecipeBand.objects.all().delete()
+    indexed = 0
+    last_pk = 0
+    while True:
+        batch = list(
+            Recipe.objects.filter(pk__gt=last_pk).order_by('pk')
+            .only('id', 'user', 'ingredients', 'instructions')[:batch_size]
+        )
+        if not batch:
+            break
+        index_recipes(batch)
+        indexed += len(batch)
+        last_pk = batch[-1].pk
+        if stdout is not None:
+            stdout.write(f'Indexed {indexed} recipes (up to id {last_pk})')
+    return indexed
+
+
+class _DisjointSet:
+    """
+    Union-find over recipe ids. Iterative find with path halving and union
+    by size keep the trees shallow whatever order the ids arrive in.
+    """
+    def __init__(self):
+        self.parent = {}
+        self.size = {}
+
+    def find(self, item):
+        parent = self.parent.setdefault(item, item)
+        while parent != item:
+            grandparent = self.parent[parent]
+            self.parent[item] = grandparent
+            item, parent = grandparent, self.parent[grandparent]
+        return item
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return
+        if self.size.get(a, 1) < self.size.get(b, 1):
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] = self.size.get(a, 1) + self.size.pop(b, 1)
+
+
+def find_clusters(threshold=None, across_users=False, max_bucket=1000, batch_size=5000):
+    """
+    Group all indexed recipes into clusters of near-duplicates.
+
+    Streams the band index in key order with each recipe's signature, so
+    memory holds one bucket at a time plus the cluster membership. Pairs
+    are compared within their bucket only. Buckets larger than
+    ``max_bucket`` (e.g. hundreds of recipes with the same boilerplate
+    text) are skipped rather than compared pairwise. Returns
+    (clusters, skipped buckets): each cluster a sorted list of recipe ids,
+    largest cluster first.
+    """
+    from .models import RecipeBand
+
+    threshold = get_threshold() if threshold is None else threshold
+    clusters = _DisjointSet()
+    skipped = 0
+
+    def compare(bucket):
+        nonlocal skipped
+        if len(bucket) < 2:
+            return
+        if len(bucket) > max_bucket:
+            skipped += 1
+            return
+        bucket = [(pk, unpack(data)) for pk, data in bucket]
+        for i, (a, signature_a) in enumerate(bucket):
+            for b, signature_b in bucket[i + 1:]:
+                if clusters.find(a) != clusters.find(b) and similarity(signature_a, signature_b) >= threshold:
+                    clusters.union(a, b)
+
+    current = None
+    bucket = []
+    rows = (
+        RecipeBand.objects.order_by('key', 'user_id', 'recipe_id')
+        .values_list('key', 'user_id', 'recipe_id', 'recipe__minhash__signature')
+    )
+    for key, user_id, recipe_id, data in rows.iterator(chunk_size=batch_size):
+        group = key if across_users else (key, user_id)
+        if group != current:
+            compare(bucket)
+            current, bucket = group, []
+        bucket.append((recipe_id, data))
+    compare(bucket)
+
+    groups = defaultdict(list)
+    for pk in list(clusters.parent):
+        groups[clusters.find(pk)].append(pk)
+    result = [sorted(members) for members in groups.values() if len(members) > 1]
+    result.sort(key=lambda members: (-len(members), members[0]))
+    return result, skipped
@@ -0,0 +1,91 @@
+"""
+Streaming export of a user's recipes as NDJSON or CSV, optionally gzipped.
+
+Rows are read with ``QuerySet.iterator(chunk_size=...)`` and encoded one at
+a time into small buffers that are yielded to the server as they fill up,
+so memory use does not grow with the size of the collection.
+"""
+import csv
+import json
+import zlib
+
+from rest_framework.utils.encoders import JSONEncoder
+
+from .serializers import RecipeSerializer
+
+EXPORT_FIELDS = RecipeSerializer.Meta.fields
+CHUNK_SIZE = 500          # rows fetched from the database per round trip
+FLUSH_BYTES = 64 * 1024   # bytes buffered before a chunk is sent
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+
+class _Echo:
+    """
+    File-like object whose write() just hands back the line, for csv.writer.
+    """
+    def write(self, value):
+        return value
+
+
+def _rows(queryset, chunk_size):
+    serializer = RecipeSerializer()
+    for recipe in queryset.select_related('user').iterator(chunk_size=chunk_size):
+        yield serializer.to_representation(recipe)
+
+
+def _ndjson_lines(queryset, chunk_size):
+    encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    for row in _rows(queryset, chunk_size):
+        yield encoder.encode(row) + '\n'
+
+
+def _csv_lines(queryset, chunk_size):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in _rows(queryset, chunk_size):
+        yield writer.writerow(['' if row[field] is None else row[field] for field in EXPORT_FIELDS])
+
+
+def _buffered(lines):
+    """
+    Group encoded lines into chunks of roughly FLUSH_BYTES.
+    """
+    buffer = []
+    size = 0
+    for line in lines:
+        data = line.encode('utf-8')
+        buffer.append(data)
+        size += len(data)
+        if size >= FLUSH_BYTES:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def _gzipped(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: gzip container
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_stream(queryset, export_type, gzip=False, chunk_size=CHUNK_SIZE):
+    """
+    Return an iterator of bytes for ``queryset`` in the given export type.
+    """
+    if export_type == 'csv':
+        lines = _csv_lines(queryset, chunk_size)
+    else:
+        lines = _ndjson_lines(queryset, chunk_size)
+    chunks = _buffered(lines)
+    if gzip:
+        chunks = _gzipped(chunks)
+    return chunks
@@ -0,0 +1,158 @@
+"""
+Per-user cuisine facets and recipe totals, maintained incrementally.
+
+``CuisineFacet`` holds one row per (user, cuisine) with the number of
+recipes, and ``UserRecipeStats`` the user's total and when it last changed.
+The signal handlers in signals.py apply each create, update and delete as
+F() increments inside a transaction, so reading the facets is a small
+index scan instead of a GROUP BY over all of the user's recipes.
+
+Updates need the cuisine a recipe had before the save. ``Recipe.from_db``
+records it; when a recipe was saved without having been loaded (or with
+cuisine_type deferred), the user's facets are rebuilt from scratch instead.
+"""
+from collections import Counter, defaultdict
+
+from django.db import connection, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+
+def cuisine_key(cuisine_type):
+    return cuisine_type or ''
+
+
+def _add(model, lookup, field, delta, now):
+    """
+    Add ``delta`` to ``field`` of the row matching ``lookup``, creating the
+    row for a positive delta. Negative deltas never create rows, so
+    deleting a user (which cascades to the recipes) can't resurrect them.
+    """
+    if delta <= 0:
+        model.objects.filter(**lookup).update(**{field: F(field) + delta, 'updated_at': now})
+        return
+    # One upsert: bulk_create(update_conflicts=True) can only overwrite the
+    # count, not add to it. ``lookup`` must match a unique constraint.
+    opts = model._meta
+    qn = connection.ops.quote_name
+    fields = [opts.get_field(name) for name in [*lookup, field, 'updated_at']]
+    values = [*lookup.values(), delta, now]
+    table, column = qn(opts.db_table), qn(opts.get_field(field).column)
+    updated_at = qn(opts.get_field('updated_at').column)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({", ".join(qn(f.column) for f in fields)}) '
+            f'VALUES ({", ".join(["%s"] * len(fields))}) '
+            f'ON CONFLICT ({", ".join(qn(f.column) for f in fields[:len(lookup)])}) '
+            f'DO UPDATE SET {column} = {table}.{column} + excluded.{column}, {updated_at} = excluded.{updated_at}',
+            [f.get_db_prep_save(value, connection) for f, value in zip(fields, values)],
+        )
+
+
+def apply_changes(user_id, deltas):
+    """
+    Apply ``deltas`` ({cuisine: change in count}) to a user's facets and total.
+    """
+    from .models import CuisineFacet, UserRecipeStats
+
+    deltas = {cuisine: delta for cuisine, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    now = timezone.now()
+    with transaction.atomic(savepoint=False):
+        for cuisine, delta in deltas.items():
+            _add(CuisineFacet, {'user_id': user_id, 'cuisine': cuisine}, 'count', delta, now)
+        emptied = [cuisine for cuisine, delta in deltas.items() if delta < 0]
+        if emptied:
+            CuisineFacet.objects.filter(user_id=user_id, cuisine__in=emptied, count__lte=0).delete()
+        _add(UserRecipeStats, {'user_id': user_id}, 'recipe_count', sum(deltas.values()), now)
+
+
+def rebuild_user(user_id):
+    """
+    Recount a user's facets and total from their recipes.
+    """
+    from .models import CuisineFacet, Recipe, UserRecipeStats
+
+    counts = Counter()
+    for cuisine_type, count in (
+        Recipe.objects.filter(user_id=user_id).order_by()
+        .values_list('cuisine_type').annotate(count=Count('id'))
+    ):
+        counts[cuisine_key(cuisine_type)] += count
+
+    with transaction.atomic():
+        CuisineFacet.objects.filter(user_id=user_id).delete()
+        CuisineFacet.objects.bulk_create(
+            CuisineFacet(user_id=user_id, cuisine=cuisine, count=count) for cuisine, count in counts.items()
+        )
+        UserRecipeStats.objects.update_or_create(
+            user_id=user_id, defaults={'recipe_count': sum(counts.values())},
+        )
+
+
+def recipes_saved(recipes, created):
+    """
+    Count newly created recipes, or move updated ones between cuisines.
+    """
+    changes = defaultdict(Counter)
+    unknown = set()
+    for recipe in recipes:
+        new = cuisine_key(recipe.cuisine_type)
+        if created:
+            changes[recipe.user_id][new] += 1
+        elif not hasattr(recipe, '_stored_cuisine_type'):
+            unknown.add(recipe.user_id)
+        else:
+            old = cuisine_key(recipe._stored_cuisine_type)
+            if old != new:
+                changes[recipe.user_id][old] -= 1
+                changes[recipe.user_id][new] += 1
+        recipe._stored_cuisine_type = recipe.cuisine_type
+
+    for user_id, deltas in changes.items():
+        if user_id not in unknown:
+            apply_changes(user_id, deltas)
+    for user_id in unknown:
+        rebuild_user(user_id)
+
+
+def recipe_deleted(recipe):
+    recipes_deleted([recipe])
+
+
+def recipes_deleted(recipes):
+    """
+    Take deleted recipes off their cuisines, one set of updates per user.
+    """
+    changes = defaultdict(Counter)
+    unknown = set()
+    for recipe in recipes:
+        if 'cuisine_type' in recipe.__dict__:
+            cuisine = getattr(recipe, '_stored_cuisine_type', recipe.cuisine_type)
+            changes[recipe.user_id][cuisine_key(cuisine)] -= 1
+        else:
+            unknown.add(recipe.user_id)
+
+    for user_id, deltas in changes.items():
+        if user_id not in unknown:
+            apply_changes(user_id, deltas)
+    for user_id in unknown:
+        rebuild_user(user_id)
+
+
+def get_facets(user):
+    """
+    The user's cuisines with their recipe counts, most common first.
+    """
+    from .models import CuisineFacet, UserRecipeStats
+
+    stats = UserRecipeStats.objects.filter(user=user).first()
+    return {
+        'total': stats.recipe_count if stats else 0,
+        'updated_at': stats.updated_at if stats else None,
+        'cuisines': [
+            {'cuisine': cuisine or None, 'count': count}
+            for cuisine, count in CuisineFacet.objects.filter(user=user, count__gt=0).values_list('cuisine', 'count')
+        ],
+    }
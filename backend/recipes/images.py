@@ -0,0 +1,400 @@
+"""
+Local cache of recipe images, with resized and WebP variants.
+
+``Recipe.image_url`` points at arbitrary third-party hosts. The image proxy
+(``/api/images/?url=...&size=thumb``) fetches each URL once and keeps it in
+a content-addressed store under ``IMAGE_CACHE_DIR``:
+
+    originals/ab/abcdef...               image bytes, named by their SHA-256
+    urls/12/1234...                      "<digest> <content type>" per source URL
+    variants/ab/abcdef.../thumb.webp     resized copies, made on demand
+
+Identical images behind different URLs are stored once. Variants are
+rendered by thumbnails.py in a process pool, so decoding and resizing
+never runs on a request thread, and each one is rendered only once.
+
+Fetching goes through the pluggable ``IMAGE_FETCHER`` (any object with a
+``fetch(url)`` method returning ``(bytes, content_type)``), limited to
+``IMAGE_FETCH_CONCURRENCY`` fetches at a time, ``IMAGE_FETCH_TIMEOUT``
+seconds and ``IMAGE_MAX_BYTES`` bytes per image. Only the raster types in
+``IMAGE_TYPES`` are stored and served.
+"""
+import hashlib
+import http.client
+import ipaddress
+import multiprocessing
+import os
+import socket
+import ssl
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from urllib.parse import urljoin, urlsplit
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from backend import metrics
+from backend.lru import LRUCache
+from . import thumbnails
+
+CHUNK_SIZE = 64 * 1024
+MAX_REDIRECTS = 5
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+# Raster formats only: an SVG can carry script, and these are served from the API's origin
+IMAGE_TYPES = ('image/jpeg', 'image/png', 'image/gif', 'image/webp')
+
+
+class ImageError(Exception):
+    """
+    The image can't be served; ``status`` is the HTTP status to answer with.
+    """
+    status = 502
+
+
+class ImageNotFound(ImageError):
+    status = 404
+
+
+class ImageBusy(ImageError):
+    status = 503
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class _PinnedHTTPConnection(http.client.HTTPConnection):
+    """
+    Connects to an address resolved and checked beforehand, not to
+    whatever ``host`` resolves to by the time the socket is opened.
+    """
+    def __init__(self, host, address, **kwargs):
+        super().__init__(host, **kwargs)
+        self.address = address
+
+    def connect(self):
+        self.sock = socket.create_connection((self.address, self.port), self.timeout)
+
+
+class _PinnedHTTPSConnection(_PinnedHTTPConnection):
+    default_port = http.client.HTTPS_PORT
+
+    def __init__(self, host, address, **kwargs):
+        super().__init__(host, address, **kwargs)
+        self.context = ssl.create_default_context()
+
+    def connect(self):
+        super().connect()
+        # The certificate is still checked against the host name
+        self.sock = self.context.wrap_socket(self.sock, server_hostname=self.host)
+
+
+class UrllibFetcher:
+    """
+    Fetch images over HTTP(S) with the standard library.
+
+    Refuses hosts that resolve to private, loopback or link-local
+    addresses unless ``allow_private`` is set (e.g. for a local stand-in
+    server in tests), so the proxy can't be used to reach internal services.
+    Redirects are followed by hand, up to MAX_REDIRECTS, and every hop is
+    checked the same way. The connection goes to the address that was
+    checked, so a second DNS answer can't point it elsewhere.
+    """
+    def __init__(self, timeout=None, max_bytes=None, allow_private=None):
+        self.timeout = timeout if timeout is not None else _setting('IMAGE_FETCH_TIMEOUT', 10)
+        self.max_bytes = max_bytes if max_bytes is not None else _setting('IMAGE_MAX_BYTES', 10 * 1024 * 1024)
+        if allow_private is None:
+            allow_private = _setting('IMAGE_FETCH_ALLOW_PRIVATE', False)
+        self.allow_private = allow_private
+
+    def is_allowed(self, ip):
+        return self.allow_private or ip.is_global
+
+    def resolve(self, host, port):
+        """
+        The address to connect to for ``host``, once every address it
+        resolves to has been checked.
+        """
+        try:
+            infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        except socket.gaierror:
+            raise ImageError(f'Cannot resolve {host}.')
+        addresses = [info[4][0] for info in infos]
+        for address in addresses:
+            if not self.is_allowed(ipaddress.ip_address(address.split('%')[0])):
+                raise ImageNotFound('Image host is not allowed.')
+        return addresses[0]
+
+    def _open(self, url):
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise ImageNotFound('Only http(s) image URLs can be fetched.')
+        try:
+            port = parts.port
+        except ValueError:
+            raise ImageNotFound('Invalid port in image URL.')
+        connection_class = _PinnedHTTPSConnection if parts.scheme == 'https' else _PinnedHTTPConnection
+        port = port or connection_class.default_port
+        connection = connection_class(
+            parts.hostname, self.resolve(parts.hostname, port), port=port, timeout=self.timeout,
+        )
+        target = parts.path or '/'
+        if parts.query:
+            target += '?' + parts.query
+        connection.request('GET', target, headers={'User-Agent': 'recipes-image-proxy/1.0'})
+        return connection, connection.getresponse()
+
+    def _read(self, response):
+        length = response.getheader('Content-Length')
+        if length and length.isdigit() and int(length) > self.max_bytes:
+            raise ImageError('Image is too large.')
+        chunks = []
+        size = 0
+        while True:
+            chunk = response.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > self.max_bytes:
+                raise ImageError('Image is too large.')
+            chunks.append(chunk)
+        return b''.join(chunks)
+
+    def fetch(self, url):
+        for _ in range(MAX_REDIRECTS + 1):
+            try:
+                connection, response = self._open(url)
+                try:
+                    if response.status in REDIRECT_STATUSES:
+                        location = response.getheader('Location')
+                        if not location:
+                            raise ImageError(f'Upstream answered {response.status} without a Location.')
+                        url = urljoin(url, location)
+                        continue
+                    if response.status != 200:
+                        raise ImageError(f'Upstream answered {response.status}.')
+                    return self._read(response), response.headers.get_content_type()
+                finally:
+                    connection.close()
+            except (http.client.HTTPException, OSError) as e:
+                raise ImageError(f'Could not fetch image: {e}')
+        raise ImageError('Too many redirects.')
+
+
+def get_fetcher():
+    fetcher = _setting('IMAGE_FETCHER', 'recipes.images.UrllibFetcher')
+    if isinstance(fetcher, str):
+        fetcher = import_string(fetcher)
+    return fetcher() if isinstance(fetcher, type) else fetcher
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class ImageStore:
+    def __init__(self, root):
+        self.root = str(root)
+
+    def original_path(self, digest):
+        return os.path.join(self.root, 'originals', digest[:2], digest)
+
+    def variant_path(self, digest, size, fmt):
+        return os.path.join(self.root, 'variants', digest[:2], digest, f'{size}.{fmt}')
+
+    def _url_path(self, url):
+        key = _sha256(url.encode('utf-8'))
+        return os.path.join(self.root, 'urls', key[:2], key)
+
+    def lookup(self, url):
+        """
+        ``(digest, content_type)`` of the stored copy of ``url``, or None.
+        """
+        try:
+            with open(self._url_path(url)) as f:
+                digest, content_type = f.read().split()
+        except (FileNotFoundError, ValueError):
+            return None
+        if not os.path.exists(self.original_path(digest)):
+            return None
+        return digest, content_type
+
+    def put(self, url, data, content_type):
+        digest = _sha256(data)
+        path = self.original_path(digest)
+        if not os.path.exists(path):
+            _write_atomic(path, data)
+        _write_atomic(self._url_path(url), f'{digest} {content_type}'.encode('ascii'))
+        return digest
+
+
+def get_store():
+    return ImageStore(_setting('IMAGE_CACHE_DIR', settings.BASE_DIR / 'image_cache'))
+
+
+_fetch_slots = None
+_url_locks = {}
+_state_lock = threading.Lock()
+_failures = LRUCache(1000, ttl=_setting('IMAGE_FAILURE_TTL', 300))
+
+
+def _slots():
+    global _fetch_slots
+    with _state_lock:
+        if _fetch_slots is None:
+            _fetch_slots = threading.BoundedSemaphore(_setting('IMAGE_FETCH_CONCURRENCY', 4))
+        return _fetch_slots
+
+
+def _url_lock(url):
+    with _state_lock:
+        return _url_locks.setdefault(url, threading.Lock())
+
+
+def ensure_original(url, store=None, fetcher=None):
+    """
+    Return ``(digest, content_type)`` for ``url``, fetching it on first use.
+    Concurrent requests for the same URL share a single fetch, and a URL
+    that failed isn't retried for ``IMAGE_FAILURE_TTL`` seconds.
+    """
+    store = store or get_store()
+    found = store.lookup(url)
+    if found is not None:
+        return found
+    failure = _failures.get(url)
+    if failure is not None:
+        raise failure
+
+    lock = _url_lock(url)
+    try:
+        with lock:
+            found = store.lookup(url)
+            if found is None:
+                found = _fetch(url, store, fetcher or get_fetcher())
+    finally:
+        with _state_lock:
+            if _url_locks.get(url) is lock:
+                del _url_locks[url]
+    return found
+
+
+def _fetch(url, store, fetcher):
+    slots = _slots()
+    # Wait briefly for a slot, then shed load rather than queueing without bound
+    if not slots.acquire(timeout=_setting('IMAGE_FETCH_QUEUE_TIMEOUT', 2)):
+        metrics.incr('images.fetch_rejected')
+        raise ImageBusy('Too many image fetches in progress.')
+    try:
+        data, content_type = fetcher.fetch(url)
+        if content_type not in IMAGE_TYPES:
+            raise ImageError('URL did not return a JPEG, PNG, GIF or WebP image.')
+    except ImageError as e:
+        metrics.incr('images.fetch_failed')
+        _failures.set(url, e)
+        raise
+    finally:
+        slots.release()
+    metrics.incr('images.fetched')
+    digest = store.put(url, data, content_type)
+    if variant_formats():
+        prerender_variants(digest, store)
+    return digest, content_type
+
+
+_pool = None
+_pending = {}
+
+
+def _get_pool():
+    global _pool
+    with _state_lock:
+        if _pool is None:
+            # spawn: don't fork a process holding DB connections and threads
+            _pool = ProcessPoolExecutor(
+                max_workers=_setting('IMAGE_WORKERS', 2),
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _pool
+
+
+def variant_widths():
+    return _setting('IMAGE_VARIANT_WIDTHS', {'thumb': 320, 'medium': 800})
+
+
+def variant_formats():
+    if not thumbnails.AVAILABLE:
+        return ()
+    return ('webp', 'jpeg') if thumbnails.webp_supported() else ('jpeg',)
+
+
+def _render(digest, size, fmt, store):
+    """
+    Future for the variant, submitting it to the pool unless it is already
+    being rendered.
+    """
+    key = (digest, size, fmt)
+    with _state_lock:
+        future = _pending.get(key)
+        if future is not None:
+            return future
+    path = store.variant_path(digest, size, fmt)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pool = _get_pool()
+    with _state_lock:
+        future = _pending.get(key)
+        if future is None:
+            future = _pending[key] = pool.submit(
+                thumbnails.render_variant, store.original_path(digest), path, variant_widths()[size], fmt,
+            )
+            future.add_done_callback(lambda f: _forget(key))
+            metrics.incr('images.variants_rendered')
+    return future
+
+
+def _forget(key):
+    with _state_lock:
+        _pending.pop(key, None)
+
+
+def prerender_variants(digest, store=None):
+    """
+    Start rendering every variant of an original without waiting for them.
+    """
+    store = store or get_store()
+    for size in variant_widths():
+        for fmt in variant_formats():
+            if not os.path.exists(store.variant_path(digest, size, fmt)):
+                _render(digest, size, fmt, store)
+
+
+def ensure_variant(digest, size, fmt, store=None, wait=None):
+    """
+    Path of the ``size``/``fmt`` variant of an original, rendering it in the
+    process pool if needed. Returns None when it can't be made (Pillow
+    missing, unknown size, not ready within ``wait`` seconds, or the image
+    can't be decoded); the caller then serves the original.
+    """
+    if size not in variant_widths() or fmt not in variant_formats():
+        return None
+    store = store or get_store()
+    path = store.variant_path(digest, size, fmt)
+    if os.path.exists(path):
+        return path
+
+    future = _render(digest, size, fmt, store)
+    try:
+        return future.result(timeout=wait if wait is not None else _setting('IMAGE_RENDER_TIMEOUT', 10))
+    except FutureTimeout:
+        return None
+    except Exception:
+        # Undecodable or unsupported image: fall back to the original
+        metrics.incr('images.render_failed')
+        return None
@@ -0,0 +1,174 @@
+"""
+Streaming bulk import of recipes from NDJSON or CSV.
+
+The source is read one record at a time, every record is validated with
+RecipeSerializer, and valid records are inserted with bulk_create in
+batches. Records the user already has are skipped: a recipe matches an
+existing one by ``external_link`` when it has one, otherwise by content
+hash (see ``models.content_hash``), which makes re-running an import a
+no-op.
+
+``import_recipes`` is a generator of progress events (plain dicts), so the
+HTTP endpoint can stream them back as NDJSON and the management command can
+print them, without either holding the file or the error list in memory.
+"""
+import csv
+import gzip
+import io
+import json
+
+from django.db import transaction
+
+from .models import Recipe
+from .serializers import RecipeSerializer
+from .signals import recipes_bulk_saved
+
+BATCH_SIZE = 500
+IMPORT_TYPES = ('ndjson', 'csv')
+
+
+class ImportFormatError(Exception):
+    """
+    The upload can't be read as the requested import type.
+    """
+
+
+def guess_type(filename, default='ndjson'):
+    name = (filename or '').lower()
+    if name.endswith('.gz'):
+        name = name[:-3]
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.ndjson', '.jsonl', '.json')):
+        return 'ndjson'
+    return default
+
+
+def open_text(fileobj, filename=''):
+    """
+    Wrap a binary file object as text, transparently gunzipping *.gz uploads.
+    """
+    if (filename or '').lower().endswith('.gz'):
+        fileobj = gzip.GzipFile(fileobj=fileobj)
+    return io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+
+
+def read_records(text, import_type):
+    """
+    Yield ``(line_number, record)`` pairs; ``record`` is None for lines that
+    could not be decoded at all. Raises ImportFormatError if the stream
+    itself is unreadable (bad encoding, corrupt gzip, broken CSV quoting).
+    """
+    try:
+        yield from _read_records(text, import_type)
+    except (UnicodeDecodeError, OSError, EOFError, csv.Error) as e:
+        raise ImportFormatError(str(e))
+
+
+def _read_records(text, import_type):
+    if import_type == 'csv':
+        reader = csv.DictReader(text)
+        for record in reader:
+            # Exported CSVs write None as ''; let the serializer treat them as absent
+            yield reader.line_num, {key: value for key, value in record.items() if key and value != ''}
+        return
+
+    for line_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield line_number, None
+            continue
+        yield line_number, record if isinstance(record, dict) else None
+
+
+def _existing_keys(user, recipes):
+    links = {recipe.external_link for recipe in recipes if recipe.external_link}
+    hashes = {recipe.content_hash for recipe in recipes if not recipe.external_link}
+    existing_links = set()
+    existing_hashes = set()
+    if links:
+        existing_links = set(
+            Recipe.objects.filter(user=user, external_link__in=links).values_list('external_link', flat=True)
+        )
+    if hashes:
+        existing_hashes = set(
+            Recipe.objects.filter(user=user, content_hash__in=hashes).values_list('content_hash', flat=True)
+        )
+    return existing_links, existing_hashes
+
+
+def _insert_batch(user, pending):
+    """
+    Insert the recipes of ``pending`` the user doesn't have yet.
+    Returns ``(created, skipped)`` counts.
+    """
+    existing_links, existing_hashes = _existing_keys(user, pending)
+    seen_links, seen_hashes = set(), set()
+    new = []
+    for recipe in pending:
+        if recipe.external_link:
+            if recipe.external_link in existing_links or recipe.external_link in seen_links:
+                continue
+            seen_links.add(recipe.external_link)
+        else:
+            if recipe.content_hash in existing_hashes or recipe.content_hash in seen_hashes:
+                continue
+            seen_hashes.add(recipe.content_hash)
+        new.append(recipe)
+
+    if new:
+        with transaction.atomic():
+            created = Recipe.objects.bulk_create(new)
+            recipes_bulk_saved.send(sender=Recipe, recipes=created, created=True)
+    return len(new), len(pending) - len(new)
+
+
+def import_recipes(user, records, batch_size=BATCH_SIZE):
+    """
+    Import ``(line_number, record)`` pairs for ``user``.
+
+    Yields ``{'event': 'error', 'line': n, 'errors': {...}}`` for each
+    rejected record, ``{'event': 'progress', ...}`` after every batch and a
+    final ``{'event': 'done', ...}`` with the totals.
+    """
+    totals = {'processed': 0, 'created': 0, 'skipped': 0, 'failed': 0}
+    pending = []
+
+    try:
+        for line_number, record in records:
+            totals['processed'] += 1
+            if record is None:
+                totals['failed'] += 1
+                yield {'event': 'error', 'line': line_number, 'errors': {'non_field_errors': ['Not a JSON object.']}}
+                continue
+
+            serializer = RecipeSerializer(data=record)
+            if not serializer.is_valid():
+                totals['failed'] += 1
+                yield {'event': 'error', 'line': line_number, 'errors': serializer.errors}
+                continue
+
+            recipe = Recipe(user=user, **serializer.validated_data)
+            recipe.refresh_content_hash()
+            pending.append(recipe)
+
+            if len(pending) >= batch_size:
+                created, skipped = _insert_batch(user, pending)
+                totals['created'] += created
+                totals['skipped'] += skipped
+                pending = []
+                yield dict(totals, event='progress')
+    except ImportFormatError as e:
+        # Keep what was read before the damage; re-running the import is safe
+        yield {'event': 'error', 'line': None, 'errors': {'non_field_errors': [f'Unreadable file: {e}']}}
+
+    if pending:
+        created, skipped = _insert_batch(user, pending)
+        totals['created'] += created
+        totals['skipped'] += skipped
+        yield dict(totals, event='progress')
+
+    yield dict(totals, event='done')
@@ -0,0 +1,248 @@
+"""
+Ingredient parsing and the ingredient -> recipe inverted index.
+
+``Recipe.ingredients`` is free text ("one per line or separated by commas").
+``parse_ingredients`` reduces it to a set of normalized ingredient names
+("2 cups chopped fresh Tomatoes" -> "tomato"), which are stored once in the
+``Ingredient`` vocabulary. ``RecipeIngredient`` rows are the posting lists:
+for each (user, ingredient) the ids of the recipes that use it, so the
+pantry query only touches the postings of the ingredients the user has.
+"""
+import re
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count
+
+_SPLIT_RE = re.compile(r'[\n,;]+')
+_PARENS_RE = re.compile(r'\([^)]*\)|\[[^\]]*\]')
+_QUANTITY_RE = re.compile(r'\b\d+(?:[./]\d+)?(?:\s*-\s*\d+(?:[./]\d+)?)?\b|[¼½¾⅓⅔⅛]')
+_WORD_RE = re.compile(r"[a-zà-ÿ]+(?:'[a-z]+)?")
+
+UNITS = {
+    'cup', 'cups', 'c', 'tablespoon', 'tablespoons', 'tbsp', 'tbs', 'tbl', 'teaspoon',
+    'teaspoons', 'tsp', 'gram', 'grams', 'g', 'kg', 'kilogram', 'kilograms', 'mg',
+    'ml', 'l', 'liter', 'liters', 'litre', 'litres', 'oz', 'ounce', 'ounces', 'lb',
+    'lbs', 'pound', 'pounds', 'pinch', 'pinches', 'dash', 'dashes', 'clove', 'cloves',
+    'can', 'cans', 'jar', 'jars', 'package', 'packages', 'pkg', 'packet', 'packets',
+    'slice', 'slices', 'piece', 'pieces', 'stick', 'sticks', 'bunch', 'bunches',
+    'sprig', 'sprigs', 'handful', 'handfuls', 'pint', 'pints', 'quart', 'quarts',
+    'gallon', 'gallons', 'head', 'heads', 'stalk', 'stalks', 'fillet', 'fillets',
+    'leaf', 'leaves', 'large', 'medium', 'small', 'whole', 'half',
+}
+
+DESCRIPTORS = {
+    'a', 'an', 'the', 'of', 'and', 'or', 'to', 'for', 'with', 'about', 'taste',
+    'optional', 'fresh', 'freshly', 'dried', 'chopped', 'finely', 'roughly',
+    'coarsely', 'thinly', 'diced', 'minced', 'sliced', 'grated', 'shredded',
+    'crushed', 'ground', 'peeled', 'seeded', 'cubed', 'melted', 'softened',
+    'beaten', 'divided', 'packed', 'heaping', 'level', 'room', 'temperature',
+    'cooked', 'uncooked', 'raw', 'frozen', 'thawed', 'drained', 'rinsed',
+    'trimmed', 'halved', 'quartered', 'boneless', 'skinless', 'extra', 'more',
+    'plus', 'needed', 'serving', 'garnish', 'some', 'few', 'cut', 'into',
+    'inch', 'inches', 'cm', 'pieces', 'lightly', 'well', 'hot', 'cold', 'warm',
+}
+
+# Plurals that the suffix rules below would get wrong
+IRREGULAR_SINGULARS = {
+    'leaves': 'leaf', 'loaves': 'loaf', 'halves': 'half', 'knives': 'knife',
+    'potatoes': 'potato', 'tomatoes': 'tomato', 'mangoes': 'mango',
+    'molasses': 'molasses', 'asparagus': 'asparagus', 'couscous': 'couscous',
+    'hummus': 'hummus', 'swiss': 'swiss', 'grass': 'grass', 'lettuce': 'lettuce',
+    'cheeses': 'cheese', 'olives': 'olive', 'chives': 'chives', 'greens': 'greens',
+    'oats': 'oats', 'noodles': 'noodle', 'peas': 'pea', 'anchovies': 'anchovy',
+}
+
+MAX_NAME_LENGTH = 100
+
+
+def singularize(word):
+    if word in IRREGULAR_SINGULARS:
+        return IRREGULAR_SINGULARS[word]
+    if len(word) <= 3 or word.endswith(('ss', 'us', 'is')):
+        return word
+    if word.endswith('ies'):
+        return word[:-3] + 'y'
+    if word.endswith(('ches', 'shes', 'xes', 'zes')):
+        return word[:-2]
+    if word.endswith('s'):
+        return word[:-1]
+    return word
+
+
+def normalize_ingredient(text):
+    """
+    Reduce one ingredient line to its normalized name, or '' if nothing is left.
+    """
+    text = _PARENS_RE.sub(' ', text.lower())
+    text = _QUANTITY_RE.sub(' ', text)
+    words = [
+        word for word in _WORD_RE.findall(text)
+        if word not in UNITS and word not in DESCRIPTORS
+    ]
+    if not words:
+        return ''
+    words[-1] = singularize(words[-1])
+    return ' '.join(words)[:MAX_NAME_LENGTH]
+
+
+def parse_ingredients(text):
+    """
+    Split a free-text ingredient list into a set of normalized names.
+    """
+    names = set()
+    for part in _SPLIT_RE.split(text or ''):
+        name = normalize_ingredient(part)
+        if name:
+            names.add(name)
+    return names
+
+
+def _ingredient_ids(names):
+    """
+    Map names to Ingredient ids, adding unseen names to the vocabulary.
+    """
+    from .models import Ingredient
+
+    names = set(names)
+    if not names:
+        return {}
+    ids = dict(Ingredient.objects.filter(name__in=names).values_list('name', 'id'))
+    missing = names - ids.keys()
+    if missing:
+        Ingredient.objects.bulk_create(
+            [Ingredient(name=name) for name in missing], ignore_conflicts=True,
+        )
+        ids.update(Ingredient.objects.filter(name__in=missing).values_list('name', 'id'))
+    return ids
+
+
+def index_recipes(recipes, created=False):
+    """
+    Bring the posting lists of the given recipes in line with their text.
+
+    Only the difference between the stored and the parsed ingredients is
+    written, so re-saving a recipe without touching its ingredients costs a
+    single read. Pass ``created`` for just-inserted recipes, which have no
+    postings to read.
+    """
+    from .models import RecipeIngredient
+
+    recipes = [recipe for recipe in recipes if recipe.pk is not None]
+    if not recipes:
+        return
+
+    parsed = {recipe.pk: parse_ingredients(recipe.ingredients) for recipe in recipes}
+    ids = _ingredient_ids(set().union(*parsed.values()))
+
+    current = defaultdict(set)
+    if not created:
+        for recipe_id, ingredient_id in RecipeIngredient.objects.filter(
+            recipe_id__in=parsed.keys(),
+        ).values_list('recipe_id', 'ingredient_id'):
+            current[recipe_id].add(ingredient_id)
+
+    to_add = []
+    stale = {}
+    for recipe in recipes:
+        wanted = {ids[name] for name in parsed[recipe.pk]}
+        have = current[recipe.pk]
+        to_add.extend(
+            RecipeIngredient(recipe_id=recipe.pk, user_id=recipe.user_id, ingredient_id=ingredient_id)
+            for ingredient_id in wanted - have
+        )
+        if have - wanted:
+            stale[recipe.pk] = have - wanted
+
+    # Joins the caller's transaction without a savepoint; a failure here aborts the save anyway
+    with transaction.atomic(savepoint=False):
+        for recipe_id, ingredient_ids in stale.items():
+            RecipeIngredient.objects.filter(recipe_id=recipe_id, ingredient_id__in=ingredient_ids).delete()
+        if to_add:
+            RecipeIngredient.objects.bulk_create(to_add, ignore_conflicts=True)
+
+
+def rebuild_index(batch_size=500, stdout=None):
+    """
+    Re-parse every recipe in primary-key batches. Returns the number indexed.
+    """
+    from .models import Recipe
+
+    indexed = 0
+    last_pk = 0
+    while True:
+        batch = list(
+            Recipe.objects.filter(pk__gt=last_pk).order_by('pk')
+            .only('id', 'user', 'ingredients')[:batch_size]
+        )
+        if not batch:
+            break
+        index_recipes(batch)
+        indexed += len(batch)
+        last_pk = batch[-1].pk
+        if stdout is not None:
+            stdout.write(f'Indexed {indexed} recipes (up to id {last_pk})')
+    return indexed
+
+
+def recipes_for_pantry(user, pantry, limit=20):
+    """
+    Rank ``user``'s recipes by how much of each one the pantry covers.
+
+    Works purely from the posting lists: one grouped query counts, per
+    recipe, how many of the pantry's ingredients it uses, and a second one
+    fetches the ingredient totals of just those candidate recipes.
+    """
+    from .models import Ingredient, Recipe, RecipeIngredient
+
+    names = set()
+    for item in pantry:
+        names |= parse_ingredients(item)
+    if not names:
+        return []
+
+    pantry_ids = list(Ingredient.objects.filter(name__in=names).values_list('id', flat=True))
+    if not pantry_ids:
+        return []
+
+    matched = dict(
+        RecipeIngredient.objects.filter(user=user, ingredient_id__in=pantry_ids)
+        .values('recipe_id').annotate(matched=Count('id'))
+        .values_list('recipe_id', 'matched')
+    )
+    totals = dict(
+        RecipeIngredient.objects.filter(recipe_id__in=matched.keys())
+        .values('recipe_id').annotate(total=Count('id'))
+        .values_list('recipe_id', 'total')
+    )
+
+    ranked = sorted(
+        matched,
+        key=lambda pk: (-matched[pk] / totals[pk], -matched[pk], -pk),
+    )[:limit]
+    if not ranked:
+        return []
+
+    missing = defaultdict(list)
+    for recipe_id, name in (
+        RecipeIngredient.objects.filter(recipe_id__in=ranked)
+        .exclude(ingredient_id__in=pantry_ids)
+        .order_by('ingredient__name')
+        .values_list('recipe_id', 'ingredient__name')
+    ):
+        missing[recipe_id].append(name)
+
+    recipes = Recipe.objects.filter(pk__in=ranked).only('id', 'title', 'cuisine_type', 'image_url').in_bulk()
+    return [
+        {
+            'id': pk,
+            'title': recipes[pk].title,
+            'cuisine_type': recipes[pk].cuisine_type,
+            'image_url': recipes[pk].image_url,
+            'matched': matched[pk],
+            'total': totals[pk],
+            'coverage': round(matched[pk] / totals[pk], 4),
+            'missing': missing[pk],
+        }
+        for pk in ranked
+    ]
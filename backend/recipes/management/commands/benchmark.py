@@ -0,0 +1,77 @@
+import logging
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from backend import benchmark
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the API in-process (list, detail, create, login, me) and write '
+        'p50/p95/p99 latency and throughput to a JSON file. Seed data first with seed_recipes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', default='bench_user_0', help='User to run as (default: bench_user_0).')
+        parser.add_argument('--password', default='bench-password', help="That user's password.")
+        parser.add_argument('--iterations', type=int, default=200, help='Measured requests per scenario.')
+        parser.add_argument('--warmup', type=int, default=10, help='Unmeasured requests per scenario first.')
+        parser.add_argument('--concurrency', type=int, default=1, help='Threads issuing requests.')
+        parser.add_argument('--scenario', action='append', dest='scenarios',
+                            help='Only run this scenario (repeatable): list, detail, create, login, me.')
+        parser.add_argument('--no-cache', action='store_true', help='Disable the recipe response cache.')
+        parser.add_argument('--output', default='benchmark-results.json',
+                            help='Where to write the JSON report (default: benchmark-results.json).')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"User '{options['user']}' does not exist; run seed_recipes first.")
+        recipe_ids = list(Recipe.objects.filter(user=user).order_by('-id').values_list('id', flat=True)[:1000])
+        if not recipe_ids:
+            raise CommandError(f"User '{user.username}' has no recipes; run seed_recipes first.")
+
+        scenarios = benchmark.default_scenarios(recipe_ids)
+        if options['scenarios']:
+            unknown = set(options['scenarios']) - {scenario.name for scenario in scenarios}
+            if unknown:
+                raise CommandError(f"Unknown scenario(s): {', '.join(sorted(unknown))}")
+            scenarios = [scenario for scenario in scenarios if scenario.name in options['scenarios']]
+
+        # The login scenario logs in hundreds of times from one address
+        overrides = {'DEBUG': False, 'ALLOWED_HOSTS': ['testserver'], 'RATE_LIMITS': {}}
+        if options['no_cache']:
+            overrides['RECIPE_CACHE_ALIAS'] = None
+
+        runner = benchmark.Benchmark(
+            user.username, options['password'],
+            iterations=options['iterations'], warmup=options['warmup'], concurrency=options['concurrency'],
+        )
+        request_logger = logging.getLogger('backend.requests')
+        level = request_logger.level
+        request_logger.setLevel(logging.WARNING)
+        try:
+            with override_settings(**overrides):
+                results = runner.run(scenarios)
+        finally:
+            request_logger.setLevel(level)
+
+        report = benchmark.build_report(
+            results,
+            dataset={'users': User.objects.count(), 'recipes': Recipe.objects.count(),
+                     'user_recipes': Recipe.objects.filter(user=user).count()},
+            options={key: options[key] for key in ('iterations', 'warmup', 'concurrency', 'no_cache')},
+        )
+        benchmark.write_report(report, options['output'])
+
+        for name, stats in results.items():
+            self.stdout.write(
+                f"{name:>8}: p50 {stats['p50_ms']:8.2f}ms  p95 {stats['p95_ms']:8.2f}ms  "
+                f"p99 {stats['p99_ms']:8.2f}ms  {stats['throughput_rps']:8.1f} req/s  "
+                f"errors {stats['errors']}"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
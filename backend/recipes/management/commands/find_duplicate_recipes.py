@@ -0,0 +1,62 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes import duplicates
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Find clusters of near-duplicate recipes across the whole table from the MinHash/LSH '
+        'index. Pairs are only compared within the same user unless --across-users is given.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threshold', type=float, default=None,
+                            help='Minimum estimated similarity (default: DUPLICATE_RECIPE_THRESHOLD).')
+        parser.add_argument('--across-users', action='store_true',
+                            help="Also cluster recipes that belong to different users.")
+        parser.add_argument('--max-bucket', type=int, default=1000,
+                            help='Skip LSH buckets with more recipes than this (default: 1000).')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Index rows read per batch (default: 5000).')
+        parser.add_argument('--reindex', action='store_true',
+                            help='Recompute every signature first.')
+        parser.add_argument('--json', action='store_true',
+                            help='Print the clusters as one JSON object per line.')
+
+    def handle(self, *args, **options):
+        threshold = options['threshold']
+        if threshold is not None and not 0 < threshold <= 1:
+            raise CommandError('--threshold must be between 0 and 1.')
+
+        if options['reindex']:
+            indexed = duplicates.rebuild_index(stdout=self.stderr)
+            self.stderr.write(f'Reindexed {indexed} recipes.')
+
+        started = time.perf_counter()
+        clusters, skipped = duplicates.find_clusters(
+            threshold=threshold, across_users=options['across_users'],
+            max_bucket=options['max_bucket'], batch_size=options['batch_size'],
+        )
+        elapsed = time.perf_counter() - started
+
+        for members in clusters:
+            recipes = Recipe.objects.filter(pk__in=members).order_by('pk').values_list('id', 'user_id', 'title')
+            if options['json']:
+                self.stdout.write(json.dumps([
+                    {'id': pk, 'user': user_id, 'title': title} for pk, user_id, title in recipes
+                ]))
+            else:
+                self.stdout.write(f'{len(members)} recipes:')
+                for pk, user_id, title in recipes:
+                    self.stdout.write(f'  #{pk} (user {user_id}) {title}')
+
+        duplicate_count = sum(len(members) - 1 for members in clusters)
+        self.stderr.write(self.style.SUCCESS(
+            f'Found {len(clusters)} clusters ({duplicate_count} redundant recipes) in {elapsed:.2f}s.'
+        ))
+        if skipped:
+            self.stderr.write(self.style.WARNING(f'Skipped {skipped} buckets larger than --max-bucket.'))
@@ -0,0 +1,51 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes import importer
+
+
+class Command(BaseCommand):
+    help = (
+        'Import recipes for a user from an NDJSON or CSV file (optionally gzipped). '
+        'Recipes the user already has are skipped, so re-running is safe.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import (.ndjson, .jsonl, .csv, optionally .gz).')
+        parser.add_argument('--user', required=True, help='Username that will own the recipes.')
+        parser.add_argument('--type', choices=importer.IMPORT_TYPES,
+                            help='Input type (default: guessed from the file name, else ndjson).')
+        parser.add_argument('--batch-size', type=int, default=importer.BATCH_SIZE,
+                            help=f'Recipes inserted per batch (default: {importer.BATCH_SIZE}).')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"User '{options['user']}' does not exist.")
+
+        path = options['path']
+        import_type = options['type'] or importer.guess_type(path)
+        try:
+            fileobj = open(path, 'rb')
+        except OSError as e:
+            raise CommandError(str(e))
+
+        with fileobj:
+            records = importer.read_records(importer.open_text(fileobj, path), import_type)
+            for event in importer.import_recipes(user, records, batch_size=options['batch_size']):
+                if event['event'] == 'error':
+                    where = f"line {event['line']}" if event['line'] else 'file'
+                    self.stderr.write(f"{where}: {json.dumps(event['errors'])}")
+                elif event['event'] == 'progress':
+                    self.stdout.write(
+                        f"{event['processed']} processed, {event['created']} created, "
+                        f"{event['skipped']} skipped, {event['failed']} failed"
+                    )
+                else:
+                    self.stdout.write(self.style.SUCCESS(
+                        f"Done: {event['created']} created, {event['skipped']} already present, "
+                        f"{event['failed']} rejected out of {event['processed']}."
+                    ))
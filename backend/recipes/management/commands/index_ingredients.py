@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from recipes.ingredients import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the ingredient -> recipe index from Recipe.ingredients, in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of recipes parsed per batch (default: 500).')
+
+    def handle(self, *args, **options):
+        indexed = rebuild_index(batch_size=options['batch_size'], stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(f'Indexed ingredients of {indexed} recipes.'))
@@ -0,0 +1,38 @@
+import resource
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from recipes.similarity import rebuild_index
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the TF-IDF vectors and the precomputed "similar recipes" lists from scratch, '
+        'in batches, and report build time and memory use.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of recipes read or rows written per batch (default: 500).')
+
+    def handle(self, *args, **options):
+        tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            recipes, terms, pairs = rebuild_index(batch_size=options['batch_size'], stdout=self.stdout)
+            elapsed = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        # ru_maxrss is in kilobytes on Linux
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {recipes} recipes ({terms} terms, {pairs} neighbour pairs).'
+        ))
+        self.stdout.write(
+            f'Build time: {elapsed:.2f}s. Peak Python allocations: {peak / 1024 / 1024:.1f} MiB. '
+            f'Peak process RSS: {max_rss:.1f} MiB.'
+        )
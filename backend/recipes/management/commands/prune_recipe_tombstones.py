@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from recipes.sync import prune_tombstones
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete the records of deleted recipes kept for delta sync once they are older than '
+        'RECIPE_TOMBSTONE_TTL. Run it daily, e.g. from cron.'
+    )
+
+    def handle(self, *args, **options):
+        deleted = prune_tombstones()
+        self.stdout.write(self.style.SUCCESS(f'Pruned {deleted} tombstones.'))
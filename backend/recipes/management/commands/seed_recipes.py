@@ -0,0 +1,106 @@
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import Recipe
+from recipes.signals import recipes_bulk_saved
+
+CUISINES = [
+    'Italian', 'Mexican', 'Indian', 'Chinese', 'Japanese', 'Thai', 'French',
+    'Greek', 'Spanish', 'Korean', 'Vietnamese', 'American', 'Moroccan', '',
+]
+ADJECTIVES = [
+    'Spicy', 'Creamy', 'Crispy', 'Smoky', 'Quick', 'Classic', 'Roasted', 'Grilled',
+    'Braised', 'Lemony', 'Garlicky', 'Herby', 'Sticky', 'Slow-cooked', 'Rustic',
+]
+DISHES = [
+    'Chicken', 'Pasta', 'Curry', 'Tacos', 'Soup', 'Salad', 'Risotto', 'Stir-fry',
+    'Noodles', 'Stew', 'Pie', 'Burger', 'Dumplings', 'Tart', 'Flatbread', 'Casserole',
+]
+INGREDIENTS = [
+    'chicken thighs', 'olive oil', 'garlic', 'onion', 'tomatoes', 'basil', 'salt',
+    'black pepper', 'butter', 'flour', 'eggs', 'milk', 'rice', 'soy sauce', 'ginger',
+    'chili flakes', 'lemon', 'parsley', 'cumin', 'coriander', 'cream', 'parmesan',
+    'spinach', 'mushrooms', 'potatoes', 'carrots', 'celery', 'beef', 'pork', 'tofu',
+    'coconut milk', 'lime', 'cilantro', 'honey', 'mustard', 'vinegar', 'sugar',
+    'paprika', 'thyme', 'rosemary', 'bell pepper', 'zucchini', 'chickpeas', 'lentils',
+]
+STEPS = [
+    'Preheat the oven to 200C.', 'Chop the vegetables.', 'Heat the oil in a large pan.',
+    'Fry the onion until soft.', 'Add the garlic and cook for a minute.',
+    'Season generously with salt and pepper.', 'Simmer for 20 minutes.',
+    'Stir in the herbs.', 'Bake until golden.', 'Rest for 5 minutes before serving.',
+    'Whisk everything together.', 'Bring to the boil, then reduce the heat.',
+]
+
+
+def fake_recipe(rng, user_id):
+    ingredients = rng.sample(INGREDIENTS, rng.randint(4, 12))
+    return Recipe(
+        user_id=user_id,
+        title=f'{rng.choice(ADJECTIVES)} {rng.choice(DISHES)} #{rng.randint(1, 10 ** 6)}',
+        description=' '.join(rng.sample(STEPS, 2)),
+        cuisine_type=rng.choice(CUISINES) or None,
+        ingredients='\n'.join(f'{rng.randint(1, 4)} {name}' for name in ingredients),
+        instructions='\n'.join(rng.sample(STEPS, rng.randint(3, 8))),
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate synthetic users and recipes with bulk inserts, for benchmarks and load tests. '
+        'Users are named <prefix>_user_<n> and share one password.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10, help='Number of users to create (default: 10).')
+        parser.add_argument('--recipes', type=int, default=100, help='Recipes per user (default: 100).')
+        parser.add_argument('--prefix', default='bench', help='Username prefix (default: bench).')
+        parser.add_argument('--password', default='bench-password', help='Password for every seeded user.')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per bulk insert (default: 1000).')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed, for reproducible data (default: 0).')
+        parser.add_argument('--skip-indexes', action='store_true',
+                            help="Don't populate search/ingredient indexes (much faster; rebuild them later).")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        prefix = options['prefix']
+        batch_size = options['batch_size']
+        started = time.perf_counter()
+
+        # Hash once: PBKDF2 per user would dominate the run
+        password = make_password(options['password'])
+        usernames = [f'{prefix}_user_{n}' for n in range(options['users'])]
+        existing = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+        User.objects.bulk_create(
+            [
+                User(username=name, email=f'{name}@example.com', password=password)
+                for name in usernames if name not in existing
+            ],
+            batch_size=batch_size,
+        )
+        user_ids = list(User.objects.filter(username__in=usernames).order_by('id').values_list('id', flat=True))
+
+        total = 0
+        for user_id in user_ids:
+            pending = [fake_recipe(rng, user_id) for _ in range(options['recipes'])]
+            for start in range(0, len(pending), batch_size):
+                batch = pending[start:start + batch_size]
+                for recipe in batch:
+                    recipe.refresh_content_hash()
+                with transaction.atomic():
+                    created = Recipe.objects.bulk_create(batch)
+                    if not options['skip_indexes']:
+                        recipes_bulk_saved.send(sender=Recipe, recipes=created, created=True)
+                total += len(created)
+            self.stdout.write(f'{total} recipes inserted')
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {len(user_ids)} users and {total} recipes in {elapsed:.1f}s '
+            f'({total / elapsed if elapsed else 0:.0f} recipes/s).'
+        ))
@@ -0,0 +1,100 @@
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from backend import content_encoding
+from backend.renderers import FastJSONRenderer, orjson
+from recipes import rows
+from recipes.models import Recipe
+from recipes.serializers import RecipeSerializer, RecipeSummarySerializer
+from recipes.views import get_columns
+
+REPRESENTATIONS = {
+    'summary': RecipeSummarySerializer,
+    'full': RecipeSerializer,
+}
+
+
+def _median_time(func, iterations):
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the cost per row of rendering a recipe list page with RecipeSerializer and '
+        'JSONRenderer against the values_list() fast path and FastJSONRenderer, check that both '
+        'give the same bytes, and show the compressed size of the page.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', default='bench_user_0', help='User whose recipes to render (default: bench_user_0).')
+        parser.add_argument('--rows', type=int, default=100, help='Recipes per page (default: 100).')
+        parser.add_argument('--iterations', type=int, default=50, help='Timed runs per step; the median is shown.')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"User '{options['user']}' does not exist; run seed_recipes first.")
+        size, iterations = options['rows'], options['iterations']
+        self.stdout.write(f'JSON encoder: {"orjson" if orjson else "json (orjson not installed)"}')
+
+        for name, serializer_class in REPRESENTATIONS.items():
+            field_names = list(serializer_class.Meta.fields)
+            queryset = Recipe.objects.filter(user=user).order_by('-created_at', '-id')
+            instances = queryset.only(*get_columns(field_names))
+            if 'username' in field_names:
+                instances = instances.select_related('user')
+            row_renderer = rows.get_row_renderer(serializer_class, field_names)
+            row_queryset = row_renderer.rows(queryset)
+
+            page = list(instances[:size])
+            row_page = list(row_queryset[:size])
+            if not page:
+                raise CommandError(f"User '{user.username}' has no recipes.")
+            count = len(page)
+            data = serializer_class(page, many=True, fields=field_names).data
+            fast_data = row_renderer.render(row_page)
+            before = JSONRenderer().render(data)
+            after = FastJSONRenderer().render(fast_data)
+
+            steps = [
+                ('fetch', lambda: list(instances[:size]), lambda: list(row_queryset[:size])),
+                ('serialize', lambda: serializer_class(page, many=True, fields=field_names).data,
+                 lambda: row_renderer.render(row_page)),
+                ('render', lambda: JSONRenderer().render(data), lambda: FastJSONRenderer().render(fast_data)),
+            ]
+            self.stdout.write(f'\n{name} representation, {count} rows ({len(before)} bytes):')
+            totals = [0.0, 0.0]
+            for step, slow, fast in steps:
+                slow_time, fast_time = _median_time(slow, iterations), _median_time(fast, iterations)
+                totals[0] += slow_time
+                totals[1] += fast_time
+                self.stdout.write(
+                    f'  {step:<10} {slow_time / count * 1e6:8.1f} µs/row -> {fast_time / count * 1e6:8.1f} µs/row'
+                    f'  ({slow_time / fast_time:.1f}x)'
+                )
+            self.stdout.write(
+                f'  {"total":<10} {totals[0] / count * 1e6:8.1f} µs/row -> {totals[1] / count * 1e6:8.1f} µs/row'
+                f'  ({totals[0] / totals[1]:.1f}x)'
+            )
+            if before == after:
+                self.stdout.write(self.style.SUCCESS('  Output is byte-for-byte identical.'))
+            else:
+                self.stdout.write(self.style.ERROR('  Output differs!'))
+
+            for encoding in content_encoding.available_encodings():
+                compressed = content_encoding.compress(after, encoding)
+                compress_time = _median_time(lambda: content_encoding.compress(after, encoding), iterations)
+                self.stdout.write(
+                    f'  {encoding}: {len(compressed)} bytes ({len(compressed) / len(after):.0%}), '
+                    f'{compress_time * 1000:.2f} ms'
+                )
@@ -0,0 +1,137 @@
+import re
+
+from django.db import migrations
+
+BATCH_SIZE = 500
+
+# A frozen copy of recipes.ingredients.parse_ingredients as it was when this
+# migration was written: later changes to the parser must not change what
+# the backfill does, and the migration must not depend on the app module.
+
+_SPLIT_RE = re.compile(r'[\n,;]+')
+_PARENS_RE = re.compile(r'\([^)]*\)|\[[^\]]*\]')
+_QUANTITY_RE = re.compile(r'\b\d+(?:[./]\d+)?(?:\s*-\s*\d+(?:[./]\d+)?)?\b|[¼½¾⅓⅔⅛]')
+_WORD_RE = re.compile(r"[a-zà-ÿ]+(?:'[a-z]+)?")
+
+UNITS = {
+    'cup', 'cups', 'c', 'tablespoon', 'tablespoons', 'tbsp', 'tbs', 'tbl', 'teaspoon',
+    'teaspoons', 'tsp', 'gram', 'grams', 'g', 'kg', 'kilogram', 'kilograms', 'mg',
+    'ml', 'l', 'liter', 'liters', 'litre', 'litres', 'oz', 'ounce', 'ounces', 'lb',
+    'lbs', 'pound', 'pounds', 'pinch', 'pinches', 'dash', 'dashes', 'clove', 'cloves',
+    'can', 'cans', 'jar', 'jars', 'package', 'packages', 'pkg', 'packet', 'packets',
+    'slice', 'slices', 'piece', 'pieces', 'stick', 'sticks', 'bunch', 'bunches',
+    'sprig', 'sprigs', 'handful', 'handfuls', 'pint', 'pints', 'quart', 'quarts',
+    'gallon', 'gallons', 'head', 'heads', 'stalk', 'stalks', 'fillet', 'fillets',
+    'leaf', 'leaves', 'large', 'medium', 'small', 'whole', 'half',
+}
+
+DESCRIPTORS = {
+    'a', 'an', 'the', 'of', 'and', 'or', 'to', 'for', 'with', 'about', 'taste',
+    'optional', 'fresh', 'freshly', 'dried', 'chopped', 'finely', 'roughly',
+    'coarsely', 'thinly', 'diced', 'minced', 'sliced', 'grated', 'shredded',
+    'crushed', 'ground', 'peeled', 'seeded', 'cubed', 'melted', 'softened',
+    'beaten', 'divided', 'packed', 'heaping', 'level', 'room', 'temperature',
+    'cooked', 'uncooked', 'raw', 'frozen', 'thawed', 'drained', 'rinsed',
+    'trimmed', 'halved', 'quartered', 'boneless', 'skinless', 'extra', 'more',
+    'plus', 'needed', 'serving', 'garnish', 'some', 'few', 'cut', 'into',
+    'inch', 'inches', 'cm', 'pieces', 'lightly', 'well', 'hot', 'cold', 'warm',
+}
+
+# Plurals that the suffix rules below would get wrong
+IRREGULAR_SINGULARS = {
+    'leaves': 'leaf', 'loaves': 'loaf', 'halves': 'half', 'knives': 'knife',
+    'potatoes': 'potato', 'tomatoes': 'tomato', 'mangoes': 'mango',
+    'molasses': 'molasses', 'asparagus': 'asparagus', 'couscous': 'couscous',
+    'hummus': 'hummus', 'swiss': 'swiss', 'grass': 'grass', 'lettuce': 'lettuce',
+    'cheeses': 'cheese', 'olives': 'olive', 'chives': 'chives', 'greens': 'greens',
+    'oats': 'oats', 'noodles': 'noodle', 'peas': 'pea', 'anchovies': 'anchovy',
+}
+
+MAX_NAME_LENGTH = 100
+
+
+def singularize(word):
+    if word in IRREGULAR_SINGULARS:
+        return IRREGULAR_SINGULARS[word]
+    if len(word) <= 3 or word.endswith(('ss', 'us', 'is')):
+        return word
+    if word.endswith('ies'):
+        return word[:-3] + 'y'
+    if word.endswith(('ches', 'shes', 'xes', 'zes')):
+        return word[:-2]
+    if word.endswith('s'):
+        return word[:-1]
+    return word
+
+
+def normalize_ingredient(text):
+    """
+    Reduce one ingredient line to its normalized name, or '' if nothing is left.
+    """
+    text = _PARENS_RE.sub(' ', text.lower())
+    text = _QUANTITY_RE.sub(' ', text)
+    words = [
+        word for word in _WORD_RE.findall(text)
+        if word not in UNITS and word not in DESCRIPTORS
+    ]
+    if not words:
+        return ''
+    words[-1] = singularize(words[-1])
+    return ' '.join(words)[:MAX_NAME_LENGTH]
+
+
+def parse_ingredients(text):
+    """
+    Split a free-text ingredient list into a set of normalized names.
+    """
+    names = set()
+    for part in _SPLIT_RE.split(text or ''):
+        name = normalize_ingredient(part)
+        if name:
+            names.add(name)
+    return names
+
+
+
+def backfill_ingredient_index(apps, schema_editor):
+    """
+    Parse the ingredients of every existing recipe, in primary-key batches.
+    """
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+
+    last_pk = 0
+    while True:
+        batch = list(
+            Recipe.objects.filter(pk__gt=last_pk).order_by('pk')
+            .values_list('id', 'user_id', 'ingredients')[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+
+        parsed = {pk: parse_ingredients(text) for pk, _, text in batch}
+        names = set().union(*parsed.values())
+        Ingredient.objects.bulk_create([Ingredient(name=name) for name in names], ignore_conflicts=True)
+        ids = dict(Ingredient.objects.filter(name__in=names).values_list('name', 'id'))
+
+        RecipeIngredient.objects.bulk_create(
+            [
+                RecipeIngredient(recipe_id=pk, user_id=user_id, ingredient_id=ids[name])
+                for pk, user_id, _ in batch
+                for name in parsed[pk]
+            ],
+            ignore_conflicts=True,
+        )
+        last_pk = batch[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_ingredient_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_ingredient_index, migrations.RunPython.noop),
+    ]
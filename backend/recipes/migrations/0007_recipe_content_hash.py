@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+from recipes.models import content_hash
+
+BATCH_SIZE = 500
+
+
+def backfill_content_hash(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    last_pk = 0
+    while True:
+        batch = list(
+            Recipe.objects.filter(pk__gt=last_pk).order_by('pk')
+            .only('id', 'title', 'ingredients', 'instructions')[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        for recipe in batch:
+            recipe.content_hash = content_hash(recipe.title, recipe.ingredients, recipe.instructions)
+        Recipe.objects.bulk_update(batch, ['content_hash'])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_backfill_ingredient_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+        migrations.RunPython(backfill_content_hash, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['user', 'external_link'], name='recipe_user_link_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['user', 'content_hash'], name='recipe_user_hash_idx'),
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_facets(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    CuisineFacet = apps.get_model('recipes', 'CuisineFacet')
+    UserRecipeStats = apps.get_model('recipes', 'UserRecipeStats')
+
+    facets = {}
+    totals = {}
+    for user_id, cuisine_type, count in (
+        Recipe.objects.order_by().values_list('user_id', 'cuisine_type').annotate(count=Count('id'))
+    ):
+        key = (user_id, cuisine_type or '')
+        facets[key] = facets.get(key, 0) + count
+        totals[user_id] = totals.get(user_id, 0) + count
+
+    CuisineFacet.objects.bulk_create(
+        [CuisineFacet(user_id=user_id, cuisine=cuisine, count=count) for (user_id, cuisine), count in facets.items()],
+        batch_size=500,
+    )
+    UserRecipeStats.objects.bulk_create(
+        [UserRecipeStats(user_id=user_id, recipe_count=count) for user_id, count in totals.items()],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('recipes', '0007_recipe_content_hash'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CuisineFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cuisine', models.CharField(blank=True, max_length=100)),
+                ('count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-count', 'cuisine'],
+            },
+        ),
+        migrations.CreateModel(
+            name='UserRecipeStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='recipe_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('recipe_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['user', 'cuisine_type', 'created_at', 'id'], name='recipe_user_cuisine_idx'),
+        ),
+        migrations.AddField(
+            model_name='cuisinefacet',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='cuisinefacet',
+            constraint=models.UniqueConstraint(fields=('user', 'cuisine'), name='unique_user_cuisine_facet'),
+        ),
+        migrations.RunPython(backfill_facets, migrations.RunPython.noop),
+    ]
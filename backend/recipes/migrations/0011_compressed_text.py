@@ -0,0 +1,72 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:53
+
+import recipes.compression
+from django.db import migrations
+
+from recipes.compression import decode, encode, is_encoded
+
+BATCH_SIZE = 500
+
+
+def _convert(schema_editor, convert):
+    """
+    Rewrite ingredients and instructions of every recipe with ``convert``,
+    in primary-key batches. Raw SQL, so the historical model's field
+    doesn't get a say in how the values are read or written.
+    """
+    connection = schema_editor.connection
+    last_pk = 0
+    while True:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT id, ingredients, instructions FROM recipes_recipe WHERE id > %s ORDER BY id LIMIT %s',
+                [last_pk, BATCH_SIZE],
+            )
+            batch = cursor.fetchall()
+            if not batch:
+                break
+            rows = []
+            for pk, ingredients, instructions in batch:
+                converted = (convert(ingredients), convert(instructions))
+                if converted != (ingredients, instructions):
+                    rows.append((*converted, pk))
+            cursor.executemany(
+                'UPDATE recipes_recipe SET ingredients = %s, instructions = %s WHERE id = %s', rows,
+            )
+        last_pk = batch[-1][0]
+
+
+def compress_text(apps, schema_editor):
+    Binary = schema_editor.connection.Database.Binary
+
+    def convert(value):
+        if value is None or is_encoded(value):
+            return value
+        return Binary(encode(decode(value)))
+
+    _convert(schema_editor, convert)
+
+
+def decompress_text(apps, schema_editor):
+    _convert(schema_editor, lambda value: value if value is None else decode(value))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_recipe_minhash'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='ingredients',
+            field=recipes.compression.CompressedTextField(help_text='List ingredients, one per line or separated by commas.'),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='instructions',
+            field=recipes.compression.CompressedTextField(help_text='Detailed cooking instructions.'),
+        ),
+        migrations.RunPython(compress_text, decompress_text),
+    ]
@@ -1,14 +1,31 @@
+import hashlib
+
 from django.db import models
 from django.contrib.auth.models import User # Import Django's built-in User model
 
+from .compression import CompressedTextField, CompressedTextQuerySet
+
+# Fields whose content identifies a recipe for de-duplication on import
+CONTENT_HASH_FIELDS = ('title', 'ingredients', 'instructions')
+
+
+def content_hash(title, ingredients, instructions):
+    """
+    SHA-256 of the recipe text, ignoring case and whitespace differences.
+    """
+    parts = (' '.join((value or '').split()).lower() for value in (title, ingredients, instructions))
+    return hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()
+
+
 class Recipe(models.Model):
     # Link recipe to the User who created it
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recipes')
     
     title = models.CharField(max_length=255)
     description = models.TextField(blank=True, null=True)
-    ingredients = models.TextField(help_text="List ingredients, one per line or separated by commas.")
-    instructions = models.TextField(help_text="Detailed cooking instructions.")
+    # Stored compressed, decompressed on first access (see recipes/compression.py)
+    ingredients = CompressedTextField(help_text="List ingredients, one per line or separated by commas.")
+    instructions = CompressedTextField(help_text="Detailed cooking instructions.")
     
     # Optional fields
     image_url = models.URLField(max_length=500, blank=True, null=True, 
@@ -21,10 +38,205 @@ class Recipe(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Maintained by save(); lets imports skip recipes the user already has
+    content_hash = models.CharField(max_length=64, blank=True, default='', editable=False)
+
+    objects = CompressedTextQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created_at'] # Order by most recent first
         verbose_name = "Recipe"
         verbose_name_plural = "Recipes"
+        indexes = [
+            # Backs keyset pagination of a user's recipes, newest first
+            models.Index(fields=['user', 'created_at', 'id'], name='recipe_user_created_idx'),
+            # Idempotent imports look recipes up by source link or content hash
+            models.Index(fields=['user', 'external_link'], name='recipe_user_link_idx'),
+            models.Index(fields=['user', 'content_hash'], name='recipe_user_hash_idx'),
+            # Cuisine-filtered lists, still in keyset order
+            models.Index(fields=['user', 'cuisine_type', 'created_at', 'id'], name='recipe_user_cuisine_idx'),
+            # Delta sync: a user's recipes changed since a point in time, oldest change first
+            models.Index(fields=['user', 'updated_at', 'id'], name='recipe_user_updated_idx'),
+        ]
+
+    def __str__(self):
+        return self.title
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored cuisine, so the facet counts can tell what a save changed
+        if 'cuisine_type' in instance.__dict__:
+            instance._stored_cuisine_type = instance.cuisine_type
+        return instance
+
+    def refresh_content_hash(self):
+        self.content_hash = content_hash(self.title, self.ingredients, self.instructions)
+        return self.content_hash
+
+    def save(self, *args, **kwargs):
+        self.refresh_content_hash()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and set(update_fields) & set(CONTENT_HASH_FIELDS):
+            kwargs['update_fields'] = set(update_fields) | {'content_hash'}
+        super().save(*args, **kwargs)
+
+
+class Ingredient(models.Model):
+    """
+    Normalized ingredient vocabulary, parsed out of Recipe.ingredients.
+    """
+    name = models.CharField(max_length=100, unique=True)
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+
+class RecipeIngredient(models.Model):
+    """
+    One posting in the ingredient -> recipe inverted index.
+    The owning user is copied onto each row so a pantry lookup is a range
+    scan of (user, ingredient) instead of a join through Recipe.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name='ingredient_entries')
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE, related_name='recipe_entries')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['recipe', 'ingredient'], name='unique_recipe_ingredient'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'ingredient', 'recipe'], name='recipe_ingredient_posting_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.recipe_id}: {self.ingredient_id}"
+
+
+class CuisineFacet(models.Model):
+    """
+    Number of a user's recipes per cuisine, kept current by recipes/facets.py.
+    Recipes without a cuisine are counted under ''.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    cuisine = models.CharField(max_length=100, blank=True)
+    count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-count', 'cuisine']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'cuisine'], name='unique_user_cuisine_facet'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: {self.cuisine or '-'} ({self.count})"
+
+
+class UserRecipeStats(models.Model):
+    """
+    Per-user recipe totals, kept current by recipes/facets.py.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='recipe_stats')
+    recipe_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user_id}: {self.recipe_count} recipes"
+
+
+class RecipeTerm(models.Model):
+    """
+    One non-zero entry of a recipe's TF-IDF vector (see recipes/similarity.py).
+    Indexed by (user, term), the rows double as the term -> recipe postings.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name='terms')
+    term = models.CharField(max_length=100)
+    count = models.PositiveIntegerField()
+    weight = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['recipe', 'term'], name='unique_recipe_term'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'term'], name='recipe_term_posting_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.recipe_id}: {self.term} ({self.weight:.3f})"
+
+
+class SimilarRecipe(models.Model):
+    """
+    A precomputed nearest neighbour: ``similar`` is one of the
+    SIMILAR_RECIPES_K recipes most like ``recipe``.
+    """
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name='similar_entries')
+    similar = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['recipe', 'similar'], name='unique_similar_recipe'),
+        ]
+
+    def __str__(self):
+        return f"{self.recipe_id} ~ {self.similar_id} ({self.score:.3f})"
+
+
+class RecipeSignature(models.Model):
+    """
+    MinHash signature of a recipe's ingredients and instructions
+    (see recipes/duplicates.py). ``source_hash`` identifies the text it was
+    computed from, so unchanged recipes aren't re-hashed on save.
+    """
+    recipe = models.OneToOneField(Recipe, on_delete=models.CASCADE, primary_key=True, related_name='minhash')
+    source_hash = models.CharField(max_length=64)
+    signature = models.BinaryField()
+
+    def __str__(self):
+        return f"{self.recipe_id}: {self.source_hash[:12]}"
+
+
+class RecipeBand(models.Model):
+    """
+    One LSH bucket a recipe's signature falls into. Recipes sharing a
+    bucket are near-duplicate candidates.
+    """
+    key = models.BigIntegerField()
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        indexes = [
+            # Serves both the per-user lookup at create time and the key-ordered scan for clusters
+            models.Index(fields=['key', 'user', 'recipe'], name='recipe_band_lsh_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.recipe_id}: {self.key}"
+
+
+class RecipeTombstone(models.Model):
+    """
+    A deleted recipe, kept for RECIPE_TOMBSTONE_TTL so clients doing a delta
+    sync (see recipes/sync.py) learn to drop their copy.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    # Not a foreign key: the recipe is gone
+    recipe_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'deleted_at', 'id'], name='recipe_tombstone_user_idx'),
+        ]
 
     def __str__(self):
-        return self.title
\ No newline at end of file
+        return f"{self.user_id}: {self.recipe_id} deleted {self.deleted_at:%Y-%m-%d %H:%M}"
@@ -0,0 +1,204 @@
+"""
+Full-text search over a user's recipes.
+
+On SQLite the recipes are mirrored into an FTS5 virtual table
+(``recipes_recipe_fts``, created in migration 0004) whose rowid is the
+recipe id. Each row also carries an ``owner`` token (``u<user_id>``) so the
+per-user scope is resolved by the full-text index itself instead of by
+filtering every match afterwards.
+"""
+import html
+import re
+
+from django.db import connection, connections, router
+
+FTS_TABLE = 'recipes_recipe_fts'
+
+# bm25() weights, in FTS column order: title, description, ingredients,
+# instructions, owner. A hit in the title counts for the most.
+BM25_WEIGHTS = (10.0, 2.0, 4.0, 1.0, 0.0)
+
+HIGHLIGHT_OPEN = '<mark>'
+HIGHLIGHT_CLOSE = '</mark>'
+# FTS5 marks matches with these private-use characters; the text is escaped
+# before they become the HTML markers, so recipe text can't inject markup
+_MATCH_OPEN = '\ue000'
+_MATCH_CLOSE = '\ue001'
+SNIPPET_ELLIPSIS = '…'
+SNIPPET_TOKENS = 12
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def is_available(conn=None):
+    """
+    FTS5 is a SQLite feature; other backends fall back to a plain scan.
+    """
+    return (conn or connection).vendor == 'sqlite'
+
+
+def owner_token(user_id):
+    return f'u{user_id}'
+
+
+def to_html(marked):
+    """
+    FTS5 highlight()/snippet() output as HTML: the text escaped, and the
+    matches wrapped in HIGHLIGHT_OPEN/HIGHLIGHT_CLOSE.
+    """
+    if marked is None:
+        return None
+    return (
+        html.escape(marked)
+        .replace(_MATCH_OPEN, HIGHLIGHT_OPEN)
+        .replace(_MATCH_CLOSE, HIGHLIGHT_CLOSE)
+    )
+
+
+def build_match_query(text):
+    """
+    Turn free text from the search box into a safe FTS5 MATCH expression.
+
+    Every word is quoted (so FTS5 operators typed by the user are treated as
+    plain words) and ANDed together; the last word is a prefix match so
+    results show up while the user is still typing. Returns None when there
+    is nothing to search for.
+    """
+    tokens = _TOKEN_RE.findall(text or '')
+    if not tokens:
+        return None
+    terms = ['"%s"' % token for token in tokens]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def _row_for(recipe):
+    return (
+        recipe.pk,
+        recipe.title or '',
+        recipe.description or '',
+        recipe.ingredients or '',
+        recipe.instructions or '',
+        owner_token(recipe.user_id),
+    )
+
+
+def index_recipes(recipes, conn=None):
+    """
+    Insert or refresh the FTS rows for the given recipes. FTS5 honours
+    REPLACE on the rowid, so one statement swaps out any old row.
+    """
+    conn = conn or connection
+    if not is_available(conn):
+        return
+    rows = [_row_for(recipe) for recipe in recipes]
+    if not rows:
+        return
+    with conn.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT OR REPLACE INTO {FTS_TABLE} (rowid, title, description, ingredients, instructions, owner) '
+            'VALUES (%s, %s, %s, %s, %s, %s)',
+            rows,
+        )
+
+
+def unindex_recipes(recipe_ids, conn=None):
+    """
+    Drop the FTS rows of deleted recipes.
+    """
+    conn = conn or connection
+    if not is_available(conn):
+        return
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    with conn.cursor() as cursor:
+        placeholders = ', '.join(['%s'] * len(recipe_ids))
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', recipe_ids)
+
+
+def search_recipes(user, text, limit=20, conn=None):
+    """
+    Return up to ``limit`` of ``user``'s recipes matching ``text``, best first.
+
+    Each result is a dict with the recipe id, title, cuisine type and image,
+    its BM25 rank (lower is better), the title with matches highlighted and
+    a short snippet from whichever column matched best. Both of those are
+    HTML: escaped recipe text with <mark> around the matches.
+    """
+    if conn is None:
+        from .models import Recipe
+        # Reads go wherever the router sends recipe reads
+        conn = connections[router.db_for_read(Recipe)]
+    match = build_match_query(text)
+    if match is None:
+        return []
+    if not is_available(conn):
+        return _fallback_search(user, text, limit)
+
+    # Restrict to the owner's rows inside the MATCH so FTS5 intersects the
+    # posting lists instead of ranking every user's matches.
+    match = '{owner}: %s AND ({title description ingredients instructions}: %s)' % (
+        owner_token(user.pk), match,
+    )
+    weights = ', '.join(str(weight) for weight in BM25_WEIGHTS)
+    sql = (
+        f'SELECT r.id, r.title, r.cuisine_type, r.image_url, '
+        f'highlight({FTS_TABLE}, 0, %s, %s), '
+        f'snippet({FTS_TABLE}, -1, %s, %s, %s, %s), '
+        f'bm25({FTS_TABLE}, {weights}) AS rank '
+        f'FROM {FTS_TABLE} JOIN recipes_recipe r ON r.id = {FTS_TABLE}.rowid '
+        f'WHERE {FTS_TABLE} MATCH %s AND r.user_id = %s '
+        f'ORDER BY rank LIMIT %s'
+    )
+    params = [
+        _MATCH_OPEN, _MATCH_CLOSE,
+        _MATCH_OPEN, _MATCH_CLOSE, SNIPPET_ELLIPSIS, SNIPPET_TOKENS,
+        match, user.pk, limit,
+    ]
+    with conn.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    return [
+        {
+            'id': pk,
+            'title': title,
+            'cuisine_type': cuisine_type,
+            'image_url': image_url,
+            'title_highlighted': to_html(title_highlighted),
+            'snippet': to_html(snippet),
+            'rank': rank,
+        }
+        for pk, title, cuisine_type, image_url, title_highlighted, snippet, rank in rows
+    ]
+
+
+def _fallback_search(user, text, limit):
+    from .models import Recipe
+
+    # ingredients and instructions are stored compressed (compression.py), so
+    # they can't be matched in SQL; scan the user's recipes instead
+    tokens = [token.lower() for token in _TOKEN_RE.findall(text)]
+    results = []
+    recipes = Recipe.objects.filter(user=user).only(
+        'id', 'title', 'cuisine_type', 'image_url', 'description', 'ingredients', 'instructions',
+    )
+    for recipe in recipes.iterator(chunk_size=500):
+        haystack = '\n'.join(
+            value or '' for value in (recipe.title, recipe.description, recipe.ingredients, recipe.instructions)
+        ).lower()
+        if not all(token in haystack for token in tokens):
+            continue
+        results.append({
+            'id': recipe.pk,
+            'title': recipe.title,
+            'cuisine_type': recipe.cuisine_type,
+            'image_url': recipe.image_url,
+            'title_highlighted': html.escape(recipe.title),
+            'snippet': html.escape((recipe.description or '')[:200]),
+            'rank': 0.0,
+        })
+        if len(results) >= limit:
+            break
+    return results
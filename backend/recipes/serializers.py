@@ -1,7 +1,21 @@
 from rest_framework import serializers
 from .models import Recipe
 
-class RecipeSerializer(serializers.ModelSerializer):
+
+class DynamicFieldsMixin:
+    """
+    Lets the caller narrow a serializer down to a subset of its fields:
+    RecipeSerializer(recipe, fields=['id', 'title']).
+    """
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class RecipeSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     # Read-only field to display the username of the recipe creator
     username = serializers.ReadOnlyField(source='user.username')
 
@@ -13,4 +27,13 @@ class RecipeSerializer(serializers.ModelSerializer):
             'external_link', 'created_at', 'updated_at'
         ]
         # 'user' is read-only because it's set by perform_create, not sent by the client
-        read_only_fields = ['user', 'created_at', 'updated_at'] 
\ No newline at end of file
+        read_only_fields = ['user', 'created_at', 'updated_at'] 
+
+
+class RecipeSummarySerializer(RecipeSerializer):
+    """
+    Compact representation used by default for list responses: everything a
+    recipe tile needs, without the large ingredients/instructions columns.
+    """
+    class Meta(RecipeSerializer.Meta):
+        fields = ['id', 'user', 'title', 'cuisine_type', 'image_url', 'created_at', 'updated_at']
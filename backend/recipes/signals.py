@@ -0,0 +1,94 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import Signal, receiver
+
+from .models import Recipe
+from . import autocomplete, cache, duplicates, facets, ingredients, search, similarity, sync
+from .tasks import refill_similar_lists, update_similar_recipes
+
+# Sent after bulk_create()/bulk_update() of recipes, which skip post_save.
+# Arguments: recipes (list of saved Recipe instances), created (bool).
+recipes_bulk_saved = Signal()
+
+# Sent after bulk.delete_recipes() removed recipes without pre/post_delete.
+# Arguments: recipes (list of the deleted Recipe instances, loaded with at
+# least id, user and cuisine_type, and with _similar_referrers noted).
+recipes_bulk_deleted = Signal()
+
+
+def _queue_similarity(recipes):
+    # Only saves that loaded the title and ingredients can change the terms
+    recipe_ids = [
+        recipe.pk for recipe in recipes
+        if recipe.pk is not None and 'title' in recipe.__dict__ and 'ingredients' in recipe.__dict__
+    ]
+    if recipe_ids:
+        update_similar_recipes.delay(recipe_ids)
+
+
+@receiver(post_save, sender=Recipe)
+def index_saved_recipe(sender, instance, created, **kwargs):
+    """
+    Keep the search, ingredient and duplicate indexes, the cuisine facets
+    and the response cache in step with every recipe create and update,
+    and queue the similarity update.
+    """
+    # One transaction for all of them (joining the caller's, if any), not one each
+    with transaction.atomic(savepoint=False):
+        search.index_recipes([instance])
+        ingredients.index_recipes([instance], created)
+        facets.recipes_saved([instance], created)
+        _queue_similarity([instance])
+        duplicates.index_recipes([instance], created)
+        cache.invalidate_user(instance.user_id)
+        autocomplete.recipes_saved([instance])
+
+
+@receiver(pre_delete, sender=Recipe)
+def note_similar_referrers(sender, instance, **kwargs):
+    # The neighbour rows pointing at the recipe are cascaded away with it
+    similarity.note_referrers([instance])
+
+
+@receiver(post_delete, sender=Recipe)
+def unindex_deleted_recipe(sender, instance, origin=None, **kwargs):
+    search.unindex_recipes([instance.pk])
+    sync.recipe_deleted(instance, origin)
+    facets.recipe_deleted(instance)
+    referrers = getattr(instance, '_similar_referrers', ())
+    if referrers:
+        refill_similar_lists.delay(instance.user_id, referrers)
+    cache.invalidate_user(instance.user_id)
+    autocomplete.recipe_deleted(instance)
+
+
+@receiver(recipes_bulk_saved, sender=Recipe)
+def index_bulk_saved_recipes(sender, recipes, created, **kwargs):
+    with transaction.atomic(savepoint=False):
+        search.index_recipes(recipes)
+        ingredients.index_recipes(recipes, created)
+        facets.recipes_saved(recipes, created)
+        _queue_similarity(recipes)
+        duplicates.index_recipes(recipes, created)
+        for user_id in {recipe.user_id for recipe in recipes}:
+            cache.invalidate_user(user_id)
+        autocomplete.recipes_saved(recipes)
+
+
+@receiver(recipes_bulk_deleted, sender=Recipe)
+def unindex_bulk_deleted_recipes(sender, recipes, **kwargs):
+    with transaction.atomic(savepoint=False):
+        search.unindex_recipes([recipe.pk for recipe in recipes])
+        sync.recipes_deleted(recipes)
+        facets.recipes_deleted(recipes)
+        referrers = defaultdict(set)
+        for recipe in recipes:
+            referrers[recipe.user_id].update(getattr(recipe, '_similar_referrers', ()))
+        for user_id, recipe_ids in referrers.items():
+            if recipe_ids:
+                refill_similar_lists.delay(user_id, sorted(recipe_ids))
+        for user_id in {recipe.user_id for recipe in recipes}:
+            cache.invalidate_user(user_id)
+        autocomplete.recipes_deleted(recipes)
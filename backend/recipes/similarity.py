@@ -0,0 +1,416 @@
+"""
+"Similar recipes": TF-IDF vectors over each recipe's title and ingredients,
+with every recipe's nearest neighbours precomputed.
+
+A recipe's terms are the words of its title (counted ``TITLE_WEIGHT``
+times) and the normalized ingredient names from ingredients.py, both as
+single words and, for "olive oil" and the like, as the whole name. Weights
+are (1 + log tf) * idf, with the smoothed idf ``log((1 + n) / (1 + df)) + 1``
+over the owner's recipes, and each vector is L2-normalized so that the dot
+product of two vectors is their cosine similarity.
+
+The sparse matrix lives in ``RecipeTerm``: one row per non-zero entry,
+indexed by (user, term) so that the rows are also the posting lists. Scoring
+one recipe against all the others is a single postings query for its terms,
+never a scan of every vector. ``SimilarRecipe`` holds the top
+``SIMILAR_RECIPES_K`` neighbours of each recipe, so the endpoint only reads.
+
+Saves queue ``index_recipes`` in the task worker (tasks.py). It re-weights the
+saved recipes, rebuilds their own neighbour lists and patches the lists of
+the recipes they enter or leave. Vectors of other recipes keep the idf from
+when they were written, and deletes don't lower document frequencies; the
+``index_similar_recipes`` command recomputes everything from scratch.
+"""
+import heapq
+import math
+import re
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+
+from .ingredients import DESCRIPTORS, parse_ingredients, singularize
+
+# A word in the title counts as much as this many ingredient mentions
+TITLE_WEIGHT = 2
+
+# Title words that say nothing about what is in the dish
+TITLE_STOP_WORDS = DESCRIPTORS | {
+    'easy', 'quick', 'simple', 'best', 'classic', 'homemade', 'recipe', 'style',
+    'my', 'mom', 'perfect', 'ultimate', 'healthy', 'delicious', 'on', 'in',
+}
+
+MAX_TERM_LENGTH = 100
+
+# Largest IN (...) list sent in one query
+CHUNK_SIZE = 500
+
+_WORD_RE = re.compile(r"[a-zà-ÿ]+")
+
+
+def get_k():
+    return getattr(settings, 'SIMILAR_RECIPES_K', 10)
+
+
+def _chunks(values, size=CHUNK_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def recipe_terms(title, ingredients_text):
+    """
+    Term counts of one recipe.
+    """
+    counts = Counter()
+    for word in _WORD_RE.findall((title or '').lower()):
+        if len(word) > 1 and word not in TITLE_STOP_WORDS:
+            counts[singularize(word)] += TITLE_WEIGHT
+    for name in parse_ingredients(ingredients_text):
+        words = name.split()
+        for word in words:
+            counts[word] += 1
+        if len(words) > 1:
+            counts[name[:MAX_TERM_LENGTH]] += 1
+    return counts
+
+
+def idf(df, n):
+    return math.log((1 + n) / (1 + df)) + 1
+
+
+def weigh(counts, df, n):
+    """
+    Normalized TF-IDF vector ({term: weight}) for term counts.
+    """
+    vector = {term: (1 + math.log(count)) * idf(df.get(term, 0), n) for term, count in counts.items()}
+    norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+    if not norm:
+        return {}
+    return {term: weight / norm for term, weight in vector.items()}
+
+
+def top_k(scores, k):
+    """
+    The ``k`` best (recipe_id, score) pairs, highest score first; newer
+    recipes win ties.
+    """
+    return heapq.nlargest(k, ((pk, score) for pk, score in scores.items() if score > 0),
+                          key=lambda item: (item[1], item[0]))
+
+
+def _score(user_id, vectors):
+    """
+    Cosine similarity of each vector in ``vectors`` ({recipe_id: vector})
+    to every other recipe of the user that shares a term with it.
+    """
+    from .models import RecipeTerm
+
+    by_term = defaultdict(list)
+    for pk, vector in vectors.items():
+        for term, weight in vector.items():
+            by_term[term].append((pk, weight))
+
+    scores = {pk: defaultdict(float) for pk in vectors}
+    for terms in _chunks(by_term):
+        for recipe_id, term, weight in RecipeTerm.objects.filter(
+            user_id=user_id, term__in=terms,
+        ).values_list('recipe_id', 'term', 'weight'):
+            for pk, own_weight in by_term[term]:
+                if recipe_id != pk:
+                    scores[pk][recipe_id] += own_weight * weight
+    return scores
+
+
+def _load_vectors(recipe_ids):
+    from .models import RecipeTerm
+
+    vectors = defaultdict(dict)
+    for ids in _chunks(recipe_ids):
+        for recipe_id, term, weight in RecipeTerm.objects.filter(
+            recipe_id__in=ids,
+        ).values_list('recipe_id', 'term', 'weight'):
+            vectors[recipe_id][term] = weight
+    return vectors
+
+
+def _load_lists(recipe_ids):
+    from .models import SimilarRecipe
+
+    lists = {pk: {} for pk in recipe_ids}
+    for ids in _chunks(recipe_ids):
+        for recipe_id, similar_id, score in SimilarRecipe.objects.filter(
+            recipe_id__in=ids,
+        ).values_list('recipe_id', 'similar_id', 'score'):
+            lists[recipe_id][similar_id] = score
+    return lists
+
+
+def _write_lists(lists):
+    """
+    Replace the neighbour lists of the recipes in ``lists``
+    ({recipe_id: {similar_id: score}}).
+    """
+    from .models import SimilarRecipe
+
+    for ids in _chunks(lists):
+        SimilarRecipe.objects.filter(recipe_id__in=ids).delete()
+    SimilarRecipe.objects.bulk_create(
+        [
+            SimilarRecipe(recipe_id=pk, similar_id=similar_id, score=score)
+            for pk, entries in lists.items()
+            for similar_id, score in entries.items()
+        ],
+        batch_size=CHUNK_SIZE,
+    )
+
+
+def recompute_lists(user_id, recipe_ids):
+    """
+    Neighbour lists of ``recipe_ids`` from their stored vectors.
+    Recipes without a vector (deleted meanwhile, or with no terms) get none.
+    """
+    vectors = _load_vectors(recipe_ids)
+    k = get_k()
+    return {pk: dict(top_k(scores, k)) for pk, scores in _score(user_id, vectors).items()}
+
+
+def _patch_lists(user_id, changed_scores):
+    """
+    Update the lists of other recipes after the recipes in
+    ``changed_scores`` ({recipe_id: {other_id: score}}) were re-weighted.
+
+    A recipe enters a list when it beats the list's weakest entry. A recipe
+    whose score dropped may now rank below one that isn't listed, so a full
+    list it was on is recomputed instead.
+    """
+    from .models import SimilarRecipe
+
+    changed = set(changed_scores)
+    candidates = set()
+    for scores in changed_scores.values():
+        candidates.update(scores)
+    referrers = set()
+    for ids in _chunks(changed):
+        referrers.update(
+            SimilarRecipe.objects.filter(similar_id__in=ids).values_list('recipe_id', flat=True)
+        )
+    affected = (candidates | referrers) - changed
+    if not affected:
+        return {}
+
+    k = get_k()
+    lists = _load_lists(affected)
+    dirty = set()
+    refill = set()
+    for pk, entries in lists.items():
+        for other in changed:
+            score = changed_scores[other].get(pk, 0.0)
+            old = entries.get(other)
+            if old is not None:
+                dirty.add(pk)
+                if score < old and len(entries) >= k:
+                    # An unlisted recipe may now rank above it
+                    refill.add(pk)
+                elif score > 0:
+                    entries[other] = score
+                else:
+                    del entries[other]
+            elif score > 0:
+                if len(entries) < k:
+                    entries[other] = score
+                    dirty.add(pk)
+                else:
+                    weakest = min(entries, key=lambda similar_id: (entries[similar_id], similar_id))
+                    if (score, other) > (entries[weakest], weakest):
+                        del entries[weakest]
+                        entries[other] = score
+                        dirty.add(pk)
+
+    patched = {pk: lists[pk] for pk in dirty - refill}
+    if refill:
+        patched.update(recompute_lists(user_id, refill))
+    return patched
+
+
+def index_recipes(recipes):
+    """
+    Bring the vectors and neighbour lists in line with the saved recipes.
+    Recipes whose terms didn't change cost a single read.
+    """
+    recipes = [
+        recipe for recipe in recipes
+        if recipe.pk is not None and 'title' in recipe.__dict__ and 'ingredients' in recipe.__dict__
+    ]
+    by_user = defaultdict(list)
+    for recipe in recipes:
+        by_user[recipe.user_id].append(recipe)
+    for user_id, user_recipes in by_user.items():
+        _index_user_recipes(user_id, user_recipes)
+
+
+def _index_user_recipes(user_id, recipes):
+    from django.db.models import Count
+    from .models import Recipe, RecipeTerm
+
+    counts = {recipe.pk: recipe_terms(recipe.title, recipe.ingredients) for recipe in recipes}
+    stored = defaultdict(dict)
+    for ids in _chunks(counts):
+        for recipe_id, term, count in RecipeTerm.objects.filter(
+            recipe_id__in=ids,
+        ).values_list('recipe_id', 'term', 'count'):
+            stored[recipe_id][term] = count
+    changed = [pk for pk, terms in counts.items() if terms != stored.get(pk, {})]
+    if not changed:
+        return
+
+    n = Recipe.objects.filter(user_id=user_id).count()
+    terms = set().union(*(counts[pk] for pk in changed))
+    df = Counter()
+    for chunk in _chunks(terms):
+        df.update(dict(
+            RecipeTerm.objects.filter(user_id=user_id, term__in=chunk).exclude(recipe_id__in=changed)
+            .values('term').annotate(df=Count('id')).values_list('term', 'df')
+        ))
+    for pk in changed:
+        df.update(counts[pk].keys())
+    vectors = {pk: weigh(counts[pk], df, n) for pk in changed}
+
+    with transaction.atomic():
+        for ids in _chunks(changed):
+            RecipeTerm.objects.filter(recipe_id__in=ids).delete()
+        RecipeTerm.objects.bulk_create(
+            [
+                RecipeTerm(user_id=user_id, recipe_id=pk, term=term, count=counts[pk][term], weight=weight)
+                for pk, vector in vectors.items()
+                for term, weight in vector.items()
+            ],
+            batch_size=CHUNK_SIZE,
+        )
+        scores = _score(user_id, vectors)
+        k = get_k()
+        lists = {pk: dict(top_k(scores[pk], k)) for pk in changed}
+        lists.update(_patch_lists(user_id, scores))
+        _write_lists(lists)
+
+
+def note_referrers(recipes):
+    """
+    Record on each of ``recipes``, as ``_similar_referrers``, the recipes
+    that list it as a neighbour. Read before they are deleted, in one query.
+    """
+    from .models import SimilarRecipe
+
+    referrers = defaultdict(list)
+    for similar_id, recipe_id in SimilarRecipe.objects.filter(
+        similar_id__in=[recipe.pk for recipe in recipes],
+    ).values_list('similar_id', 'recipe_id'):
+        referrers[similar_id].append(recipe_id)
+    for recipe in recipes:
+        recipe._similar_referrers = referrers[recipe.pk]
+
+
+def refill_lists(user_id, recipe_ids):
+    """
+    Recompute the neighbour lists of ``recipe_ids``, e.g. the lists a
+    deleted recipe was on. Its own rows are gone with it (ON DELETE CASCADE).
+    """
+    if recipe_ids:
+        with transaction.atomic():
+            _write_lists(recompute_lists(user_id, recipe_ids))
+
+
+def similar_recipes(recipe, limit=10):
+    """
+    The precomputed neighbours of ``recipe``, most similar first.
+    """
+    from .models import SimilarRecipe
+
+    return [
+        {
+            'id': similar_id,
+            'title': title,
+            'cuisine_type': cuisine_type,
+            'image_url': image_url,
+            'score': round(score, 4),
+        }
+        for similar_id, title, cuisine_type, image_url, score in (
+            SimilarRecipe.objects.filter(recipe=recipe).order_by('-score', '-similar_id')
+            .values_list('similar_id', 'similar__title', 'similar__cuisine_type', 'similar__image_url', 'score')
+            [:limit]
+        )
+    ]
+
+
+def rebuild_index(batch_size=500, stdout=None):
+    """
+    Recompute every vector and neighbour list, one user at a time, reading
+    and writing in batches of ``batch_size``. Returns (recipes, terms, pairs).
+    """
+    from .models import Recipe, RecipeTerm, SimilarRecipe
+
+    k = get_k()
+    totals = [0, 0, 0]
+    user_ids = Recipe.objects.order_by('user_id').values_list('user_id', flat=True).distinct()
+    for user_id in list(user_ids):
+        counts = {}
+        last_pk = 0
+        while True:
+            batch = list(
+                Recipe.objects.filter(user_id=user_id, pk__gt=last_pk).order_by('pk')
+                .values_list('id', 'title', 'ingredients')[:batch_size]
+            )
+            if not batch:
+                break
+            for pk, title, ingredients_text in batch:
+                counts[pk] = recipe_terms(title, ingredients_text)
+            last_pk = batch[-1][0]
+
+        n = len(counts)
+        df = Counter()
+        for terms in counts.values():
+            df.update(terms.keys())
+        vectors = {pk: weigh(terms, df, n) for pk, terms in counts.items()}
+
+        # The user's whole matrix as in-memory posting lists
+        postings = defaultdict(list)
+        for pk, vector in vectors.items():
+            for term, weight in vector.items():
+                postings[term].append((pk, weight))
+
+        lists = {}
+        for pk, vector in vectors.items():
+            scores = defaultdict(float)
+            for term, weight in vector.items():
+                for other, other_weight in postings[term]:
+                    if other != pk:
+                        scores[other] += weight * other_weight
+            lists[pk] = top_k(scores, k)
+
+        with transaction.atomic():
+            RecipeTerm.objects.filter(user_id=user_id).delete()
+            SimilarRecipe.objects.filter(recipe__user_id=user_id).delete()
+            RecipeTerm.objects.bulk_create(
+                (
+                    RecipeTerm(user_id=user_id, recipe_id=pk, term=term, count=counts[pk][term], weight=weight)
+                    for pk, vector in vectors.items()
+                    for term, weight in vector.items()
+                ),
+                batch_size=batch_size,
+            )
+            SimilarRecipe.objects.bulk_create(
+                (
+                    SimilarRecipe(recipe_id=pk, similar_id=similar_id, score=score)
+                    for pk, entries in lists.items()
+                    for similar_id, score in entries
+                ),
+                batch_size=batch_size,
+            )
+
+        pairs = sum(len(entries) for entries in lists.values())
+        totals[0] += n
+        totals[1] += len(postings)
+        totals[2] += pairs
+        if stdout is not None:
+            stdout.write(f'User {user_id}: {n} recipes, {len(postings)} terms, {pairs} neighbour pairs')
+    return tuple(totals)
@@ -0,0 +1,172 @@
+"""
+Delta sync of a user's recipes: /api/recipes/changes/?since=<cursor>
+
+A client keeps a copy of its recipes and the ``cursor`` from its last
+sync. Each response holds the recipes created or updated since that
+cursor (``results``, oldest change first) and the ids of the recipes
+deleted since (``deleted``), read from the ``RecipeTombstone`` rows the
+post_delete signal writes. Without ``since`` every recipe is returned,
+which is also how a client starts over.
+
+The cursor encodes a position in each of the two streams: the
+(updated_at, id) of the last recipe sent, served by the (user, updated_at,
+id) index, and the (deleted_at, id) of the last tombstone. While
+``has_more`` is true the client asks again with the new cursor straight
+away.
+
+A write's timestamp is taken a little before it commits, so a change can
+become visible after a sync has already read past its timestamp. Once a
+stream has been read to the end, its position is therefore set
+RECIPE_SYNC_OVERLAP seconds back from now rather than to the last change,
+and the next sync sends the latest changes again. Clients apply results as
+upserts and deletions by id, so repeats are harmless.
+
+Tombstones are pruned after RECIPE_TOMBSTONE_TTL seconds (manage.py
+prune_recipe_tombstones). A cursor older than that could miss deletions,
+so it is refused with 410 and the client starts over.
+"""
+import base64
+from datetime import timedelta
+from urllib import parse
+
+from django.conf import settings
+from django.db.models import Q, QuerySet
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+# The lowest position: before every row
+START = (None, 0)
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class CursorExpired(Exception):
+    pass
+
+
+def get_overlap():
+    return timedelta(seconds=getattr(settings, 'RECIPE_SYNC_OVERLAP', 10))
+
+
+def get_tombstone_ttl():
+    return timedelta(seconds=getattr(settings, 'RECIPE_TOMBSTONE_TTL', 30 * 24 * 3600))
+
+
+def encode_cursor(recipes_position, deleted_position):
+    tokens = {}
+    for prefix, (timestamp, pk) in (('r', recipes_position), ('d', deleted_position)):
+        if timestamp is not None:
+            tokens[f'{prefix}t'] = timestamp.isoformat()
+            tokens[f'{prefix}i'] = pk
+    querystring = parse.urlencode(tokens)
+    return base64.urlsafe_b64encode(querystring.encode('ascii')).decode('ascii')
+
+
+def decode_cursor(encoded):
+    """
+    The (recipes position, deletions position) in a cursor from encode_cursor().
+    """
+    try:
+        querystring = base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii')
+        tokens = parse.parse_qs(querystring, strict_parsing=True)
+        positions = []
+        for prefix in ('r', 'd'):
+            if f'{prefix}t' not in tokens:
+                positions.append(START)
+                continue
+            timestamp = parse_datetime(tokens[f'{prefix}t'][0])
+            if timestamp is None or timezone.is_naive(timestamp):
+                raise ValueError
+            positions.append((timestamp, int(tokens[f'{prefix}i'][0])))
+    except (TypeError, ValueError, KeyError, IndexError, UnicodeError):
+        raise InvalidCursor('Invalid cursor.')
+    return tuple(positions)
+
+
+def _after(queryset, field, position):
+    """
+    ``queryset`` rows after ``position`` in (field, id) order, as a range
+    scan on the index plus a trim of ties on the boundary timestamp.
+    """
+    timestamp, pk = position
+    queryset = queryset.order_by(field, 'id')
+    if timestamp is None:
+        return queryset
+    return queryset.filter(**{f'{field}__gte': timestamp}).exclude(Q(**{field: timestamp}) & Q(id__lte=pk))
+
+
+def get_changes(user, queryset, cursor=None, limit=100):
+    """
+    Up to ``limit`` changed recipes from ``queryset`` (the user's, with
+    whatever columns the response needs) and up to ``limit`` deleted ids
+    since ``cursor``. Returns (recipes, deleted ids, next cursor, has_more).
+    """
+    from .models import RecipeTombstone
+
+    now = timezone.now()
+    recipes_position, deleted_position = decode_cursor(cursor) if cursor else (START, START)
+    if cursor and (deleted_position[0] is None or deleted_position[0] < now - get_tombstone_ttl()):
+        raise CursorExpired('The cursor is too old; sync again without it.')
+
+    recipes = list(_after(queryset, 'updated_at', recipes_position)[:limit + 1])
+    deleted = []
+    if cursor:
+        # A full sync starts after every deletion so far
+        deleted = list(
+            _after(RecipeTombstone.objects.filter(user=user), 'deleted_at', deleted_position)
+            .values_list('deleted_at', 'id', 'recipe_id')[:limit + 1]
+        )
+
+    settled = (now - get_overlap(), 0)
+    has_more = False
+    if len(recipes) > limit:
+        recipes = recipes[:limit]
+        recipes_position = (recipes[-1].updated_at, recipes[-1].pk)
+        has_more = True
+    else:
+        recipes_position = settled
+    if len(deleted) > limit:
+        deleted = deleted[:limit]
+        deleted_position = deleted[-1][:2]
+        has_more = True
+    else:
+        deleted_position = settled
+
+    next_cursor = encode_cursor(recipes_position, deleted_position)
+    return recipes, [recipe_id for _, _, recipe_id in deleted], next_cursor, has_more
+
+
+def recipe_deleted(recipe, origin=None):
+    """
+    Leave a tombstone for the clients holding a copy of ``recipe``. Not when
+    the recipe goes with its user: there is no one left to sync.
+    """
+    from .models import Recipe, RecipeTombstone
+
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if origin is not None and not issubclass(origin_model, Recipe):
+        return
+    RecipeTombstone.objects.create(user_id=recipe.user_id, recipe_id=recipe.pk)
+
+
+def recipes_deleted(recipes):
+    """
+    Tombstones for recipes deleted together, in one insert.
+    """
+    from .models import RecipeTombstone
+
+    RecipeTombstone.objects.bulk_create(
+        [RecipeTombstone(user_id=recipe.user_id, recipe_id=recipe.pk) for recipe in recipes], batch_size=500,
+    )
+
+
+def prune_tombstones():
+    """
+    Delete tombstones past RECIPE_TOMBSTONE_TTL; cursors that old are refused anyway.
+    """
+    from .models import RecipeTombstone
+
+    deleted, _ = RecipeTombstone.objects.filter(deleted_at__lt=timezone.now() - get_tombstone_ttl()).delete()
+    return deleted
@@ -0,0 +1,52 @@
+"""
+Index maintenance that runs in the task worker instead of the request.
+
+Rebuilding a recipe's neighbour list scores it against all of the owner's
+recipes, so saves and deletes queue it (see signals.py) and return without
+waiting. Tasks read the recipes when they run, so a task that runs late
+indexes the latest version, and one for a recipe deleted in the meantime
+does nothing.
+"""
+from backend.tasks.queue import is_eager, task
+
+from . import cache, similarity
+
+
+def _invalidate(user_ids):
+    # Cached "similar" responses predate the new lists. Run eagerly, the
+    # task is part of the write, whose own invalidation covers it.
+    if not is_eager():
+        for user_id in user_ids:
+            cache.invalidate_user(user_id)
+
+
+@task
+def update_similar_recipes(recipe_ids):
+    from .models import Recipe
+
+    recipes = []
+    for start in range(0, len(recipe_ids), similarity.CHUNK_SIZE):
+        recipes.extend(
+            Recipe.objects.filter(pk__in=recipe_ids[start:start + similarity.CHUNK_SIZE])
+            .only('id', 'user', 'title', 'ingredients')
+        )
+    similarity.index_recipes(recipes)
+    _invalidate({recipe.user_id for recipe in recipes})
+
+
+@task
+def refill_similar_lists(user_id, recipe_ids):
+    """
+    Refill the neighbour lists a deleted recipe was on.
+    """
+    from .models import Recipe
+
+    remaining = []
+    for start in range(0, len(recipe_ids), similarity.CHUNK_SIZE):
+        remaining.extend(
+            Recipe.objects.filter(pk__in=recipe_ids[start:start + similarity.CHUNK_SIZE], user_id=user_id)
+            .values_list('pk', flat=True)
+        )
+    similarity.refill_lists(user_id, remaining)
+    if remaining:
+        _invalidate([user_id])
@@ -1,3 +1,1059 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import shutil
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import FieldError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from backend import metrics
+from backend.tasks.models import Task
+from backend.tasks.queue import get_task
+from backend.testing import QueryBudgetMixin
+
+from . import autocomplete, cache, compression, duplicates, images, ingredients, rows, similarity, sync
+from .models import Recipe, RecipeTombstone
+from .serializers import RecipeSerializer, RecipeSummarySerializer
+
+PNG = bytes.fromhex(
+    '89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+    '1f15c4890000000d49444154789c6360000002000001e221bc330000000049454e44ae426082'
+)
+
+
+def make_recipe(user, **fields):
+    fields.setdefault('title', 'Tomato soup')
+    fields.setdefault('ingredients', '4 tomatoes\n1 onion\n2 cups stock')
+    fields.setdefault('instructions', 'Chop the onion. Simmer everything for 20 minutes, then blend.')
+    return Recipe.objects.create(user=user, **fields)
+
+
+class SignedInMixin:
+    """
+    A signed-in user with a client, for the API tests.
+    """
+    def setUp(self):
+        # User ids repeat across tests; don't serve one test another's cached responses,
+        # and start every user on a fresh generation so no autocomplete index lines up
+        response_cache = cache.get_cache()
+        if response_cache is not None:
+            response_cache.clear()
+            cache.get_generation_cache().clear()
+        self.user = User.objects.create_user('cook', password='a-long-test-password')
+        self.client = APIClient()
+        # A session, not force_authenticate(): the async views authenticate from it
+        self.client.force_login(self.user)
+
+
+class RecipeAPITestCase(SignedInMixin, TestCase):
+    pass
+
+
+class AsyncMiddlewareTests(TestCase):
+    @override_settings(DEBUG=True)
+    def test_middleware_runs_natively_under_asgi(self):
+        # Django logs "Asynchronous handler adapted for middleware ..." for each sync-only one
+        with self.assertNoLogs('django.request', 'DEBUG'):
+            ASGIHandler().load_middleware(is_async=True)
+
+    async def test_async_request_is_instrumented_and_compressed(self):
+        user = await User.objects.acreate(username='cook')
+        for i in range(10):
+            await Recipe.objects.acreate(user=user, title=f'Soup {i}', ingredients='water', instructions='Boil.')
+        await self.async_client.aforce_login(user)
+        response = await self.async_client.get(
+            '/api/recipes/', headers={'Accept-Encoding': 'gzip', 'X-Request-ID': 'abc-123'},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Request-ID'], 'abc-123')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="[1-9]\d* queries"')
+
+
+class PaginationTests(RecipeAPITestCase):
+    url = '/api/recipes/'
+
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        # Three share a created_at, so a page boundary falls inside the tie
+        self.recipes = [make_recipe(self.user, title=f'Soup {i}') for i in range(5)]
+        for recipe, minutes in zip(self.recipes, (0, 1, 1, 1, 2)):
+            Recipe.objects.filter(pk=recipe.pk).update(created_at=now + timezone.timedelta(minutes=minutes))
+        self.newest_first = [recipe.pk for recipe in reversed(self.recipes)]
+
+    def get(self, url, data=None):
+        response = self.client.get(url, data)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_walks_forward_and_back_without_gaps_or_repeats(self):
+        page = self.get(self.url, {'page_size': 2})
+        self.assertIsNone(page['previous'])
+        seen = [recipe['id'] for recipe in page['results']]
+        while page['next']:
+            page = self.get(page['next'])
+            seen.extend(recipe['id'] for recipe in page['results'])
+        self.assertEqual(seen, self.newest_first)
+
+        back = []
+        while page['previous']:
+            page = self.get(page['previous'])
+            back[:0] = [recipe['id'] for recipe in page['results']]
+        self.assertEqual(back, self.newest_first[:4])
+
+    def test_new_recipes_do_not_shift_later_pages(self):
+        page = self.get(self.url, {'page_size': 2})
+        make_recipe(self.user, title='Newer soup')
+        page = self.get(page['next'])
+        self.assertEqual([recipe['id'] for recipe in page['results']], self.newest_first[2:4])
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get(self.url, {'cursor': 'garbage'}).status_code, 404)
+
+
+class QueryBudgetTests(QueryBudgetMixin, SignedInMixin, TransactionTestCase):
+    """
+    Each endpoint's worst case against its view's query_budget. Not TestCase:
+    its wrapping transaction would turn each BEGIN a request pays into a
+    savepoint, or hide it.
+    """
+    def assertRequestsWithinBudget(self, method, url, data=None, budget=None):
+        response = getattr(self.client, method)(url, data, format='json')
+        self.assertLess(response.status_code, 300, response.content)
+        self.assertWithinQueryBudget(response, budget)
+        return response
+
+    def test_create(self):
+        # First recipe of the user: new facet, stats and ingredient rows
+        recipe = self.assertRequestsWithinBudget('post', '/api/recipes/', {
+            'title': 'Tomato soup', 'cuisine_type': 'Italian',
+            'ingredients': '4 tomatoes\n1 onion\n2 cups stock',
+            'instructions': 'Chop the onion. Simmer everything for 20 minutes, then blend.',
+        }).json()
+        # A near duplicate of it
+        response = self.assertRequestsWithinBudget('post', '/api/recipes/', {
+            'title': 'Tomato soup again', 'cuisine_type': 'French',
+            'ingredients': recipe['ingredients'], 'instructions': recipe['instructions'],
+        })
+        self.assertIn('possible_duplicates', response.json())
+
+    def test_update(self):
+        recipe = make_recipe(self.user, cuisine_type='Italian')
+        make_recipe(self.user, cuisine_type='Italian')
+        for method in ('put', 'patch'):
+            # Moves to a new cuisine, adds and drops ingredients, changes the signature
+            self.assertRequestsWithinBudget(method, f'/api/recipes/{recipe.pk}/', {
+                'title': f'Soup {method}', 'cuisine_type': f'Cuisine {method}',
+                'ingredients': f'3 {method}s\n1 leek\n2 cups stock',
+                'instructions': f'Sweat the leek, add the {method}s and stock, simmer.',
+            })
+
+    def test_update_without_index_changes(self):
+        # Each index notices nothing changed: one read apiece, no writes
+        recipe = make_recipe(self.user, cuisine_type='Italian')
+        self.assertRequestsWithinBudget(
+            'patch', f'/api/recipes/{recipe.pk}/', {'image_url': 'https://example.com/soup.png'}, budget=9,
+        )
+
+    def test_destroy(self):
+        from .models import SimilarRecipe
+
+        recipe = make_recipe(self.user, cuisine_type='Italian')
+        other = make_recipe(self.user)
+        SimilarRecipe.objects.create(recipe=other, similar=recipe, score=0.5)
+        self.assertRequestsWithinBudget('delete', f'/api/recipes/{recipe.pk}/')
+
+    def test_reads(self):
+        recipe = make_recipe(self.user, cuisine_type='Italian')
+        make_recipe(self.user, title='Tomato salad')
+        for url, data in (
+            ('/api/recipes/', None),
+            ('/api/recipes/', {'page_size': 1}),
+            (f'/api/recipes/{recipe.pk}/', None),
+            ('/api/recipes/search/', {'q': 'tomato'}),
+            ('/api/recipes/pantry/', {'have': 'tomato,onion'}),
+            ('/api/recipes/facets/', None),
+            (f'/api/recipes/{recipe.pk}/similar/', None),
+            ('/api/recipes/autocomplete/', {'q': 'tom'}),
+            ('/api/recipes/changes/', None),
+        ):
+            with self.subTest(url=url, data=data):
+                self.assertRequestsWithinBudget('get', url, data)
+
+    def test_bulk_delete(self):
+        from .models import SimilarRecipe
+
+        recipes = [make_recipe(self.user, cuisine_type=('Italian', 'Thai', None)[i % 3]) for i in range(101)]
+        kept = recipes.pop()
+        SimilarRecipe.objects.create(recipe=kept, similar=recipes[0], score=0.5)
+        ids = ','.join(str(recipe.pk) for recipe in recipes)
+        # One statement per table and index however many recipes go, not one set per recipe
+        with self.assertMaxQueries(20):
+            response = self.client.delete(f'/api/recipes/bulk/?ids={ids}')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(len(response.json()['deleted']), 100)
+        self.assertEqual(list(Recipe.objects.values_list('pk', flat=True)), [kept.pk])
+        self.assertEqual(RecipeTombstone.objects.count(), 100)
+        self.assertEqual(self.client.get('/api/recipes/facets/').json()['total'], 1)
+        self.assertEqual(self.client.get('/api/recipes/search/', {'q': 'soup'}).json()['count'], 1)
+        # The list the kept recipe was on is refilled
+        self.assertEqual(
+            list(Task.objects.filter(name='recipes.tasks.refill_similar_lists').values_list('args', flat=True)),
+            [[self.user.pk, [kept.pk]]],
+        )
+
+
+class RowRendererTests(RecipeAPITestCase):
+    # The rows.py fast path has to answer exactly what the serializers would
+    def setUp(self):
+        super().setUp()
+        make_recipe(
+            self.user, title='Hot & sour soup', description='Hot, "sour"\nand salty', cuisine_type='Thai',
+            image_url='https://example.com/soup.png', external_link='https://example.com/soup',
+        )
+        make_recipe(self.user)
+
+    def serialized(self, serializer_class, field_names):
+        recipes = Recipe.objects.filter(user=self.user).order_by('-created_at', '-pk')
+        return [serializer_class(recipe, fields=field_names).data for recipe in recipes]
+
+    def assertSameItems(self, actual, expected):
+        # Key order too: clients see the JSON as written
+        self.assertEqual([list(item.items()) for item in actual], [list(item.items()) for item in expected])
+
+    def test_matches_the_serializers(self):
+        for serializer_class, field_names in (
+            (RecipeSummarySerializer, RecipeSummarySerializer.Meta.fields),
+            (RecipeSerializer, RecipeSerializer.Meta.fields),
+            (RecipeSerializer, ['username', 'title', 'updated_at']),
+        ):
+            renderer = rows.get_row_renderer(serializer_class, field_names)
+            self.assertIsNotNone(renderer)
+            queryset = Recipe.objects.filter(user=self.user).order_by('-created_at', '-pk')
+            for zone in ('UTC', 'Asia/Kolkata'):
+                with self.subTest(serializer=serializer_class.__name__, fields=field_names, zone=zone):
+                    with timezone.override(zone):
+                        self.assertSameItems(
+                            renderer.render(renderer.rows(queryset)), self.serialized(serializer_class, field_names),
+                        )
+
+    def test_list_and_detail_responses(self):
+        recipe = Recipe.objects.filter(user=self.user).earliest('created_at')
+        for params, serializer_class, field_names in (
+            ({}, RecipeSummarySerializer, RecipeSummarySerializer.Meta.fields),
+            ({'view': 'full'}, RecipeSerializer, RecipeSerializer.Meta.fields),
+            ({'fields': 'updated_at,title,username'}, RecipeSerializer, ['username', 'title', 'updated_at']),
+        ):
+            with self.subTest(params=params):
+                response = self.client.get('/api/recipes/', params)
+                self.assertEqual(response.status_code, 200)
+                self.assertSameItems(response.json()['results'], self.serialized(serializer_class, field_names))
+        for params, field_names in (({}, RecipeSerializer.Meta.fields), ({'fields': 'title,username'}, ['username', 'title'])):
+            with self.subTest(params=params):
+                response = self.client.get(f'/api/recipes/{recipe.pk}/', params)
+                self.assertEqual(response.status_code, 200)
+                self.assertSameItems([response.json()], [RecipeSerializer(recipe, fields=field_names).data])
+
+
+class FieldSelectionTests(RecipeAPITestCase):
+    summary_fields = ['id', 'user', 'title', 'cuisine_type', 'image_url', 'created_at', 'updated_at']
+
+    def setUp(self):
+        super().setUp()
+        self.recipe = make_recipe(self.user, cuisine_type='Thai')
+
+    def keys(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        return list((data['results'][0] if 'results' in data else data).keys())
+
+    def test_lists_default_to_the_summary(self):
+        self.assertEqual(self.keys('/api/recipes/'), self.summary_fields)
+        self.assertEqual(self.keys('/api/recipes/', {'view': 'full'}), RecipeSerializer.Meta.fields)
+        self.assertEqual(self.keys('/api/recipes/', {'omit': 'image_url,user'}), [
+            'id', 'title', 'cuisine_type', 'created_at', 'updated_at',
+        ])
+        # The detail is always the full recipe
+        self.assertEqual(self.keys(f'/api/recipes/{self.recipe.pk}/'), RecipeSerializer.Meta.fields)
+
+    def test_picked_fields(self):
+        # Any full-recipe field, in the serializer's order whatever the order asked for
+        for url in ('/api/recipes/', f'/api/recipes/{self.recipe.pk}/'):
+            with self.subTest(url=url):
+                self.assertEqual(self.keys(url, {'fields': 'username, title,id'}), ['id', 'username', 'title'])
+                self.assertEqual(self.keys(url, {'fields': 'title,ingredients', 'omit': 'ingredients'}), ['title'])
+        response = self.client.get('/api/recipes/', {'fields': 'title,username'})
+        self.assertEqual(response.json()['results'], [{'username': 'cook', 'title': 'Tomato soup'}])
+
+    def test_unknown_fields_are_refused(self):
+        for url in ('/api/recipes/', f'/api/recipes/{self.recipe.pk}/'):
+            for params, unknown in (({'fields': 'title,password'}, 'password'), ({'omit': 'content_hash'}, 'content_hash')):
+                with self.subTest(url=url, params=params):
+                    response = self.client.get(url, params)
+                    self.assertEqual(response.status_code, 400)
+                    self.assertEqual(response.json(), {'fields': [f'Unknown field(s): {unknown}.']})
+
+
+class BulkTests(RecipeAPITestCase):
+    url = '/api/recipes/bulk/'
+
+    def test_create_reports_invalid_items_and_writes_the_rest(self):
+        response = self.client.post(self.url, [
+            {'title': 'Soup', 'ingredients': 'water', 'instructions': 'Boil.'},
+            {'title': '', 'ingredients': 'water', 'instructions': 'Boil.'},
+        ], format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([recipe['title'] for recipe in response.data['results']], ['Soup'])
+        self.assertEqual([error['index'] for error in response.data['errors']], [1])
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 1)
+
+    def test_create_with_no_valid_item_writes_nothing(self):
+        response = self.client.post(self.url, [{'title': ''}, {'ingredients': 'water'}], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['index'] for error in response.data['errors']], [0, 1])
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_create_all_or_nothing(self):
+        response = self.client.post(f'{self.url}?all_or_nothing=true', [
+            {'title': 'Soup', 'ingredients': 'water', 'instructions': 'Boil.'},
+            {'title': ''},
+        ], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_update_rejects_an_id_listed_twice(self):
+        recipe = make_recipe(self.user, title='A')
+        response = self.client.patch(self.url, [
+            {'id': recipe.pk, 'title': 'A2'},
+            {'id': recipe.pk, 'title': 'A3'},
+        ], format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.data['errors'], [{'index': 1, 'errors': {'id': ['Listed more than once.']}}])
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, 'A2')
+
+    def test_update_of_other_users_recipe_is_not_found(self):
+        other = User.objects.create_user('other', password='a-long-test-password')
+        recipe = make_recipe(other)
+        response = self.client.patch(self.url, [{'id': recipe.pk, 'title': 'Mine now'}], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['errors'][0]['errors'], {'id': ['Not found.']})
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, 'Tomato soup')
+
+    def test_delete_reports_missing_ids(self):
+        recipe = make_recipe(self.user)
+        response = self.client.delete(f'{self.url}?ids={recipe.pk},{recipe.pk + 100}')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.data['deleted'], [recipe.pk])
+        self.assertFalse(Recipe.objects.exists())
+
+
+@override_settings(RECIPE_SYNC_OVERLAP=0)
+class SyncTests(RecipeAPITestCase):
+    url = '/api/recipes/changes/'
+
+    def sync(self, since=None, **params):
+        if since is not None:
+            params['since'] = since
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_deltas_and_tombstones(self):
+        kept, edited, deleted, bulk_deleted = (make_recipe(self.user, title=f'Soup {i}') for i in range(4))
+        page = self.sync()
+        self.assertEqual({recipe['id'] for recipe in page['results']}, {kept.pk, edited.pk, deleted.pk, bulk_deleted.pk})
+        # A full sync starts after every deletion so far
+        self.assertEqual(page['deleted'], [])
+
+        self.client.patch(f'/api/recipes/{edited.pk}/', {'title': 'Pea soup'}, format='json')
+        self.client.delete(f'/api/recipes/{deleted.pk}/')
+        self.client.delete(f'/api/recipes/bulk/?ids={bulk_deleted.pk}')
+        page = self.sync(page['cursor'])
+        self.assertEqual([recipe['title'] for recipe in page['results']], ['Pea soup'])
+        self.assertEqual(page['deleted'], [deleted.pk, bulk_deleted.pk])
+        self.assertFalse(page['has_more'])
+
+        page = self.sync(page['cursor'])
+        self.assertEqual((page['results'], page['deleted']), ([], []))
+
+    def test_pages_through_both_streams(self):
+        recipes = [make_recipe(self.user, title=f'Soup {i}') for i in range(3)]
+        cursor = self.sync()['cursor']
+        deleted_ids = [recipe.pk for recipe in recipes[:2]]
+        for recipe in recipes[:2]:
+            recipe.delete()
+        make_recipe(self.user, title='New soup')
+
+        results, deleted = [], []
+        page = {'cursor': cursor, 'has_more': True}
+        while page['has_more']:
+            page = self.sync(page['cursor'], limit=1)
+            results.extend(recipe['title'] for recipe in page['results'])
+            deleted.extend(page['deleted'])
+        self.assertEqual(results, ['New soup'])
+        self.assertEqual(deleted, deleted_ids)
+
+    def test_deleting_the_user_leaves_no_tombstones(self):
+        make_recipe(self.user)
+        self.user.delete()
+        self.assertFalse(RecipeTombstone.objects.exists())
+
+    def test_bad_and_expired_cursors(self):
+        self.assertEqual(self.client.get(self.url, {'since': 'garbage'}).status_code, 400)
+        cursor = self.sync()['cursor']
+        with override_settings(RECIPE_SYNC_OVERLAP=10, RECIPE_TOMBSTONE_TTL=5):
+            # Its deletions position is 10 seconds back, older than the tombstones kept
+            self.assertEqual(self.client.get(self.url, {'since': self.sync()['cursor']}).status_code, 410)
+        self.assertEqual(self.client.get(self.url, {'since': cursor}).status_code, 200)
+
+    def test_prune(self):
+        make_recipe(self.user).delete()
+        RecipeTombstone.objects.update(deleted_at=timezone.now() - timezone.timedelta(days=31))
+        make_recipe(self.user).delete()
+        self.assertEqual(sync.prune_tombstones(), 1)
+        self.assertEqual(RecipeTombstone.objects.count(), 1)
+
+
+class FacetTests(SignedInMixin, TransactionTestCase):
+    # The cached facets are invalidated on commit, which TestCase never reaches
+
+    def assertFacets(self, total, cuisines):
+        response = self.client.get('/api/recipes/facets/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total'], total)
+        self.assertEqual({facet['cuisine']: facet['count'] for facet in response.data['cuisines']}, cuisines)
+
+    def test_follow_creates_updates_and_deletes(self):
+        italian = make_recipe(self.user, cuisine_type='Italian')
+        make_recipe(self.user, cuisine_type='Italian')
+        thai = make_recipe(self.user, cuisine_type='Thai')
+        make_recipe(self.user)
+        self.assertFacets(4, {'Italian': 2, 'Thai': 1, None: 1})
+
+        self.client.patch(f'/api/recipes/{italian.pk}/', {'cuisine_type': 'Thai'}, format='json')
+        self.assertFacets(4, {'Italian': 1, 'Thai': 2, None: 1})
+
+        self.client.patch('/api/recipes/bulk/', [{'id': thai.pk, 'cuisine_type': 'Mexican'}], format='json')
+        self.assertFacets(4, {'Italian': 1, 'Thai': 1, 'Mexican': 1, None: 1})
+
+        self.client.delete(f'/api/recipes/{thai.pk}/')
+        self.assertFacets(3, {'Italian': 1, 'Thai': 1, None: 1})
+
+        self.client.delete(f'/api/recipes/bulk/?ids={italian.pk}')
+        self.assertFacets(2, {'Italian': 1, None: 1})
+
+    def test_saves_without_the_old_cuisine_rebuild(self):
+        make_recipe(self.user, cuisine_type='Italian')
+        # Deferred cuisine_type: the handler can't tell what it was, so it recounts
+        recipe = Recipe.objects.only('id', 'user').get()
+        recipe.cuisine_type = 'Thai'
+        recipe.save(update_fields=['cuisine_type'])
+        self.assertFacets(1, {'Thai': 1})
+        Recipe.objects.only('id', 'user').get().delete()
+        self.assertFacets(0, {})
+
+
+class ResponseCacheTests(SignedInMixin, TransactionTestCase):
+    # Generations are bumped on commit, which TestCase never reaches
+
+    def setUp(self):
+        super().setUp()
+        metrics.reset()
+        self.recipe = make_recipe(self.user)
+        self.list_url, self.detail_url = '/api/recipes/', f'/api/recipes/{self.recipe.pk}/'
+
+    def get(self, url, x_cache):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Cache'], x_cache)
+        return response.json()
+
+    def assertServes(self, title, x_cache):
+        self.assertEqual(self.get(self.detail_url, x_cache)['title'], title)
+        self.assertEqual([recipe['title'] for recipe in self.get(self.list_url, x_cache)['results']], [title])
+
+    def test_no_stale_read_after_a_write(self):
+        self.assertServes('Tomato soup', 'MISS')
+        self.assertServes('Tomato soup', 'HIT')
+
+        self.client.patch(self.detail_url, {'title': 'Pea soup'}, format='json')
+        self.assertServes('Pea soup', 'MISS')
+        self.assertServes('Pea soup', 'HIT')
+
+        self.client.patch('/api/recipes/bulk/', [{'id': self.recipe.pk, 'title': 'Lentil soup'}], format='json')
+        self.assertServes('Lentil soup', 'MISS')
+
+        self.assertEqual(metrics.get('recipe_cache.hits'), 4)
+        self.assertEqual(metrics.get('recipe_cache.misses'), 6)
+
+    def test_no_stale_read_after_a_delete(self):
+        other = make_recipe(self.user, title='Pea soup')
+        self.get(self.list_url, 'MISS')
+        self.get(f'/api/recipes/{other.pk}/', 'MISS')
+
+        self.client.delete(f'/api/recipes/{other.pk}/')
+        self.assertEqual(self.client.get(f'/api/recipes/{other.pk}/').status_code, 404)
+        self.assertServes('Tomato soup', 'MISS')
+
+        self.client.delete(f'/api/recipes/bulk/?ids={self.recipe.pk}')
+        self.assertEqual(self.client.get(self.detail_url).status_code, 404)
+        self.assertEqual(self.get(self.list_url, 'MISS')['results'], [])
+        self.assertEqual(metrics.get('recipe_cache.hits'), 0)
+
+    @override_settings(CACHES={
+        **settings.CACHES, 'local': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    }, RECIPE_CACHE_GENERATION_ALIAS='local')
+    def test_off_without_a_shared_generation_cache(self):
+        # Another process's write would never retire this process's entries
+        for _ in range(2):
+            response = self.client.get(self.list_url)
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(response.has_header('X-Cache'))
+        self.assertEqual(metrics.get('recipe_cache.misses'), 0)
+
+
+class ExportTests(RecipeAPITestCase):
+    text_fields = ('title', 'description', 'cuisine_type', 'ingredients', 'instructions', 'image_url', 'external_link')
+
+    def setUp(self):
+        super().setUp()
+        make_recipe(
+            self.user, title='Soup, "hot", and sour', description='First line\nsecond, with a comma\u2028and more',
+            ingredients='1,5 kg tomatoes\r\n"fresh" basil', instructions='Blend.\n\nServe; or don\'t.',
+            cuisine_type='Thaï',
+        )
+        make_recipe(self.user, title='Plain')
+        make_recipe(User.objects.create_user('other', password='a-long-test-password'), title='Not mine')
+
+    def export(self, **params):
+        response = self.client.get('/api/recipes/export/', params)
+        self.assertEqual(response.status_code, 200)
+        content = b''.join(response.streaming_content)
+        return gzip.decompress(content) if params.get('gzip') else content
+
+    def expected(self):
+        recipes = Recipe.objects.filter(user=self.user).select_related('user').order_by('id')
+        return json.loads(json.dumps([RecipeSerializer(recipe).data for recipe in recipes]))
+
+    def test_ndjson(self):
+        for params in ({}, {'gzip': '1'}):
+            with self.subTest(**params):
+                # Only \n ends a record; str.splitlines() would also split at the raw U+2028
+                lines = self.export(type='ndjson', **params).decode('utf-8').split('\n')
+                self.assertEqual(lines[-1], '')
+                self.assertEqual([json.loads(line) for line in lines[:-1]], self.expected())
+
+    def test_csv(self):
+        for params in ({}, {'gzip': '1'}):
+            with self.subTest(**params):
+                reader = csv.DictReader(io.StringIO(self.export(type='csv', **params).decode('utf-8'), newline=''))
+                self.assertEqual(reader.fieldnames, RecipeSerializer.Meta.fields)
+                self.assertEqual(list(reader), [
+                    {name: '' if value is None else str(value) for name, value in row.items()}
+                    for row in self.expected()
+                ])
+
+    def test_round_trip(self):
+        exported = list(Recipe.objects.filter(user=self.user).order_by('id').values_list(*self.text_fields))
+        for export_type in ('ndjson', 'csv'):
+            with self.subTest(type=export_type):
+                content = self.export(type=export_type)
+                client = APIClient()
+                client.force_login(User.objects.create_user(f'importer-{export_type}', password='a-long-test-password'))
+                response = client.post('/api/recipes/import/', {
+                    'file': SimpleUploadedFile(f'recipes.{export_type}', content),
+                }, format='multipart')
+                events = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+                self.assertEqual(events[-1]['created'], 2)
+                imported = Recipe.objects.filter(user__username=f'importer-{export_type}').order_by('id')
+                self.assertEqual(list(imported.values_list(*self.text_fields)), exported)
+
+    def test_unknown_type(self):
+        self.assertEqual(self.client.get('/api/recipes/export/', {'type': 'xml'}).status_code, 400)
+
+
+class ImportTests(RecipeAPITestCase):
+    def import_file(self, name, content):
+        response = self.client.post(
+            '/api/recipes/import/', {'file': SimpleUploadedFile(name, content)}, format='multipart',
+        )
+        self.assertEqual(response.status_code, 200)
+        events = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(events[-1]['event'], 'done')
+        return events
+
+    def test_reimport_is_a_no_op(self):
+        rows = [
+            {'title': 'Soup', 'ingredients': 'water', 'instructions': 'Boil.', 'external_link': 'https://example.com/soup'},
+            # Same link: the same recipe, whatever else changed
+            {'title': 'Soup v2', 'ingredients': 'water', 'instructions': 'Boil.', 'external_link': 'https://example.com/soup'},
+            {'title': 'Bread', 'ingredients': 'flour', 'instructions': 'Bake.'},
+            {'title': ''},
+        ]
+        content = '\n'.join(json.dumps(row) for row in rows).encode()
+
+        done = self.import_file('recipes.ndjson', content)[-1]
+        self.assertEqual((done['created'], done['skipped'], done['failed']), (2, 1, 1))
+        done = self.import_file('recipes.ndjson', content)[-1]
+        self.assertEqual((done['created'], done['skipped'], done['failed']), (0, 3, 1))
+        self.assertEqual(
+            sorted(Recipe.objects.filter(user=self.user).values_list('title', flat=True)), ['Bread', 'Soup'],
+        )
+
+    def test_own_export_imports_as_a_no_op(self):
+        make_recipe(self.user)
+        make_recipe(self.user, title='Bread', ingredients='flour', external_link='https://example.com/bread')
+        for query, name in (('type=csv', 'recipes.csv'), ('type=ndjson&gzip=1', 'recipes.ndjson.gz')):
+            with self.subTest(name=name):
+                export = self.client.get(f'/api/recipes/export/?{query}')
+                events = self.import_file(name, b''.join(export.streaming_content))
+                self.assertEqual(events[-1], {
+                    'event': 'done', 'processed': 2, 'created': 0, 'skipped': 2, 'failed': 0,
+                })
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 2)
+
+
+class SearchTests(RecipeAPITestCase):
+    url = '/api/recipes/search/'
+
+    def search(self, q):
+        response = self.client.get(self.url, {'q': q})
+        self.assertEqual(response.status_code, 200)
+        return response.data['results']
+
+    def test_index_follows_creates_updates_and_deletes(self):
+        recipe = make_recipe(self.user, title='Lentil soup')
+        make_recipe(User.objects.create_user('other', password='a-long-test-password'), title='Lentil stew')
+        self.assertEqual([result['id'] for result in self.search('lentil')], [recipe.pk])
+
+        recipe.title = 'Bean soup'
+        recipe.save()
+        self.assertEqual(self.search('lentil'), [])
+        self.assertEqual([result['id'] for result in self.search('bea')], [recipe.pk])
+
+        self.client.patch('/api/recipes/bulk/', [{'id': recipe.pk, 'title': 'Pea soup'}], format='json')
+        self.assertEqual([result['id'] for result in self.search('pea')], [recipe.pk])
+
+        recipe.delete()
+        self.assertEqual(self.search('soup'), [])
+
+    def test_title_ranks_above_instructions(self):
+        in_title = make_recipe(self.user, title='Garlic bread', instructions='Toast it.')
+        in_text = make_recipe(self.user, title='Pasta', instructions='Add the garlic and stir.')
+        self.assertEqual([result['id'] for result in self.search('garlic')], [in_title.pk, in_text.pk])
+
+    def test_highlights_are_escaped(self):
+        make_recipe(self.user, title='<img src=x onerror=alert(1)> Soup', description='<b>Hot</b> & crusty')
+        [result] = self.search('soup')
+        self.assertEqual(result['title_highlighted'], '&lt;img src=x onerror=alert(1)&gt; <mark>Soup</mark>')
+        [result] = self.search('crusty')
+        self.assertEqual(result['snippet'], '&lt;b&gt;Hot&lt;/b&gt; &amp; <mark>crusty</mark>')
+
+
+class AutocompleteTests(SignedInMixin, TransactionTestCase):
+    # Changes reach the indexes on commit, which TestCase never reaches
+    url = '/api/recipes/autocomplete/'
+
+    def setUp(self):
+        super().setUp()
+        autocomplete._vocabulary.clear()
+        metrics.reset()
+        for title in ('Tomato soup', 'Green tomato chutney', 'Tom yum', 'Crème brûlée', 'Pea soup'):
+            make_recipe(self.user, title=title, cuisine_type='Thai' if title == 'Tom yum' else None)
+        make_recipe(User.objects.create_user('other', password='a-long-test-password'), title='Tomato tart')
+
+    def titles(self, q, **params):
+        response = self.client.get(self.url, {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return [suggestion['title'] for suggestion in response.json()['titles']]
+
+    def test_prefixes(self):
+        # Titles starting with the prefix first, then titles with a later word starting with it
+        self.assertEqual(self.titles('tom'), ['Tom yum', 'Tomato soup', 'Green tomato chutney'])
+        self.assertEqual(self.titles('TOMA'), ['Tomato soup', 'Green tomato chutney'])
+        self.assertEqual(self.titles('tomato s'), ['Tomato soup'])
+        self.assertEqual(self.titles('creme'), ['Crème brûlée'])
+        self.assertEqual(self.titles('tom', limit=1), ['Tom yum'])
+        self.assertEqual(self.titles('tart'), [])
+        response = self.client.get(self.url, {'q': 'th'})
+        self.assertEqual(response.json()['cuisines'], [{'cuisine': 'Thai', 'count': 1}])
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+
+    def test_follows_renames_and_deletes(self):
+        self.assertEqual(self.titles('pea'), ['Pea soup'])
+        pea = Recipe.objects.get(user=self.user, title='Pea soup')
+
+        self.client.patch(f'/api/recipes/{pea.pk}/', {'title': 'Lentil soup'}, format='json')
+        self.assertEqual(self.titles('pea'), [])
+        self.assertEqual(self.titles('lent'), ['Lentil soup'])
+
+        self.client.patch('/api/recipes/bulk/', [{'id': pea.pk, 'title': 'Split pea soup'}], format='json')
+        self.assertEqual(self.titles('lent'), [])
+        self.assertEqual(self.titles('pea'), ['Split pea soup'])
+
+        self.client.delete(f'/api/recipes/{pea.pk}/')
+        self.assertEqual(self.titles('pea'), [])
+        # Every change was applied to the index in place
+        self.assertEqual(metrics.get('autocomplete.builds'), 1)
+
+
+class PantryTests(RecipeAPITestCase):
+    url = '/api/recipes/pantry/'
+
+    def pantry(self, have):
+        response = self.client.get(self.url, {'have': have})
+        self.assertEqual(response.status_code, 200)
+        return response.data['results']
+
+    def test_parsing_drops_quantities_units_and_plurals(self):
+        self.assertEqual(
+            ingredients.parse_ingredients('2 cups chopped fresh Tomatoes, 3 large eggs (beaten)\n1 tbsp olive oil; ½ tsp salt'),
+            {'tomato', 'egg', 'olive oil', 'salt'},
+        )
+
+    def test_ranks_by_coverage(self):
+        omelette = make_recipe(self.user, title='Omelette', ingredients='3 eggs\n2 tbsp milk\n1 tsp butter')
+        pancakes = make_recipe(self.user, title='Pancakes', ingredients='2 cups flour, 2 eggs, 1 cup milk, 1 tbsp sugar')
+        make_recipe(self.user, title='Soup', ingredients='4 tomatoes\n1 onion')
+        make_recipe(User.objects.create_user('other', password='a-long-test-password'), ingredients='1 egg')
+
+        results = self.pantry('Eggs,milk,100 g Butter')
+        self.assertEqual([result['id'] for result in results], [omelette.pk, pancakes.pk])
+        self.assertEqual(
+            [(result['matched'], result['total'], result['coverage']) for result in results],
+            [(3, 3, 1.0), (2, 4, 0.5)],
+        )
+        self.assertEqual(results[1]['missing'], ['flour', 'sugar'])
+        self.assertEqual(self.pantry('saffron'), [])
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+
+    def test_follows_edits(self):
+        recipe = make_recipe(self.user, ingredients='2 leeks\n1 potato')
+        self.assertEqual([result['id'] for result in self.pantry('leek')], [recipe.pk])
+        self.client.patch(f'/api/recipes/{recipe.pk}/', {'ingredients': '2 onions, 1 potato'}, format='json')
+        self.assertEqual(self.pantry('leek'), [])
+        self.assertEqual([result['matched'] for result in self.pantry('onion,potatoes')], [2])
+        recipe.delete()
+        self.assertEqual(self.pantry('onion'), [])
+
+
+class SimilarTests(SignedInMixin, TransactionTestCase):
+    # The lists are rebuilt by queued tasks, and their cached responses retired on commit
+
+    def setUp(self):
+        super().setUp()
+        self.soup = make_recipe(self.user)
+        self.basil_soup = make_recipe(self.user, title='Tomato basil soup', ingredients='5 tomatoes\n1 onion\nbasil')
+        self.tart = make_recipe(self.user, title='Onion tart', ingredients='3 onions\n200 g flour\nbutter')
+        self.cake = make_recipe(self.user, title='Banana bread', ingredients='3 bananas\nsugar')
+        make_recipe(User.objects.create_user('other', password='a-long-test-password'))
+        self.run_tasks()
+
+    def run_tasks(self):
+        # What the task worker would do, in queue order
+        for task in Task.objects.filter(status=Task.PENDING).order_by('run_at', 'id'):
+            get_task(task.name)(*task.args, **task.kwargs)
+        Task.objects.all().delete()
+
+    def similar(self, recipe, **params):
+        response = self.client.get(f'/api/recipes/{recipe.pk}/similar/', params)
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        scores = [result['score'] for result in results]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        return [result['id'] for result in results]
+
+    def test_nearest_first(self):
+        # Nothing shared with the cake, and never another user's recipes
+        self.assertEqual(self.similar(self.soup), [self.basil_soup.pk, self.tart.pk])
+        self.assertEqual(self.similar(self.soup, limit=1), [self.basil_soup.pk])
+        self.assertEqual(self.similar(self.cake), [])
+
+    def test_follows_edits(self):
+        self.similar(self.soup)
+        self.client.patch(f'/api/recipes/{self.tart.pk}/', {
+            'title': 'Tomato and onion soup', 'ingredients': '4 tomatoes\n2 onions\n2 cups stock',
+        }, format='json')
+        # Until the task runs the old list is served, and cached; the task retires it
+        self.assertEqual(self.similar(self.soup), [self.basil_soup.pk, self.tart.pk])
+        self.run_tasks()
+        self.assertEqual(self.similar(self.soup), [self.tart.pk, self.basil_soup.pk])
+
+        self.client.patch(f'/api/recipes/{self.cake.pk}/', {'ingredients': '3 bananas\n2 tomatoes'}, format='json')
+        self.run_tasks()
+        self.assertEqual(self.similar(self.soup), [self.tart.pk, self.basil_soup.pk, self.cake.pk])
+
+    @override_settings(SIMILAR_RECIPES_K=1)
+    def test_deletes_refill_the_lists(self):
+        # setUp built the lists with the default k
+        similarity.rebuild_index()
+        self.assertEqual(self.similar(self.soup), [self.basil_soup.pk])
+        self.client.delete(f'/api/recipes/{self.basil_soup.pk}/')
+        self.assertEqual(self.similar(self.soup), [])
+        self.run_tasks()
+        self.assertEqual(self.similar(self.soup), [self.tart.pk])
+
+        self.client.delete(f'/api/recipes/bulk/?ids={self.tart.pk}')
+        self.run_tasks()
+        self.assertEqual(self.similar(self.soup), [])
+
+
+class DuplicateTests(RecipeAPITestCase):
+    url = '/api/recipes/'
+
+    def setUp(self):
+        super().setUp()
+        self.original = make_recipe(self.user, instructions=(
+            'Chop the onion and soften it in butter for ten minutes. Add the tomatoes and the stock, '
+            'season with salt and pepper, and simmer everything for twenty minutes. Blend until smooth, '
+            'then stir in the cream and warm through without letting it boil.'
+        ))
+        # The same text plus a sentence, under another title
+        self.copy = {
+            'title': 'Blended tomato soup', 'ingredients': self.original.ingredients,
+            'instructions': self.original.instructions + ' Serve with bread.',
+        }
+
+    def test_near_copy_is_flagged(self):
+        response = self.client.post(self.url, self.copy, format='json')
+        self.assertEqual(response.status_code, 201)
+        [match] = response.json()['possible_duplicates']
+        self.assertEqual((match['id'], match['title']), (self.original.pk, 'Tomato soup'))
+        self.assertGreaterEqual(match['similarity'], duplicates.get_threshold())
+
+        different = {**self.copy, 'ingredients': '2 leeks\n3 potatoes', 'instructions': 'Sweat the leeks, add potatoes.'}
+        response = self.client.post(self.url, different, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('possible_duplicates', response.json())
+
+    @override_settings(DUPLICATE_RECIPE_ACTION='reject')
+    def test_near_copy_is_rejected_unless_allowed(self):
+        response = self.client.post(self.url, self.copy, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual([match['id'] for match in response.json()['possible_duplicates']], [self.original.pk])
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 1)
+
+        response = self.client.post(f'{self.url}?allow_duplicate=true', self.copy, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([match['id'] for match in response.json()['possible_duplicates']], [self.original.pk])
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 2)
+
+    @override_settings(DUPLICATE_RECIPE_ACTION='reject')
+    def test_other_users_recipes_are_not_duplicates(self):
+        other = APIClient()
+        other.force_login(User.objects.create_user('other', password='a-long-test-password'))
+        self.assertEqual(other.post(self.url, self.copy, format='json').status_code, 201)
+
+    def test_clusters_survive_long_chains(self):
+        clusters = duplicates._DisjointSet()
+        # Descending ids once built one linear chain, deeper than the recursion limit
+        for pk in range(5000, 0, -1):
+            clusters.union(pk, pk - 1)
+        self.assertEqual({clusters.find(pk) for pk in range(5001)}, {clusters.find(0)})
+        clusters.union(10000, 10001)
+        self.assertNotEqual(clusters.find(10000), clusters.find(0))
+
+
+class CompressedTextTests(RecipeAPITestCase):
+    instructions = (
+        'Préchauffez le four à 200°C. Heat the olive oil in a large pan and fry the onion until soft.\n'
+        'Add the garlic and cook for a minute, then stir in the tomatoes and simmer for 20 minutes. 🍅'
+    )
+
+    def stored(self, recipe, column):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT {column} FROM recipes_recipe WHERE id = %s', [recipe.pk])
+            return bytes(cursor.fetchone()[0])
+
+    def test_round_trip(self):
+        response = self.client.post('/api/recipes/', {
+            'title': 'Tomato soup', 'ingredients': '4 tomatoes', 'instructions': self.instructions,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        recipe = Recipe.objects.get(pk=response.json()['id'])
+
+        frame = self.stored(recipe, 'instructions')
+        self.assertEqual(frame[0], compression.DEFLATE)
+        # Plain deflate until a dictionary trained on real recipes ships
+        self.assertEqual(frame[1:3], b'\x00\x00')
+        self.assertLess(len(frame), len(self.instructions.encode('utf-8')))
+        # Too short to be worth compressing
+        self.assertEqual(self.stored(recipe, 'ingredients'), b'\x004 tomatoes')
+
+        self.assertEqual(recipe.instructions, self.instructions)
+        self.assertEqual(self.client.get(f'/api/recipes/{recipe.pk}/').json()['instructions'], self.instructions)
+        self.assertEqual(Recipe.objects.values_list('instructions', flat=True).get(), self.instructions)
+        self.assertEqual(Recipe.objects.values('ingredients').get(), {'ingredients': '4 tomatoes'})
+
+    def test_unchanged_text_keeps_its_frame(self):
+        recipe = make_recipe(self.user, instructions=self.instructions)
+        frame = self.stored(recipe, 'instructions')
+        recipe = Recipe.objects.get(pk=recipe.pk)
+        recipe.title = 'Renamed'
+        with override_settings(TEXT_COMPRESSION_DICTIONARY=1):
+            recipe.save()
+            self.assertEqual(self.stored(recipe, 'instructions'), frame)
+            # New writes use the new dictionary; the old frame still reads back
+            other = make_recipe(self.user, instructions=self.instructions)
+            self.assertEqual(self.stored(other, 'instructions')[1:3], b'\x01\x00')
+        self.assertEqual(Recipe.objects.get(pk=recipe.pk).instructions, self.instructions)
+        self.assertEqual(Recipe.objects.get(pk=other.pk).instructions, self.instructions)
+
+    def test_plain_text_rows_read_back(self):
+        recipe = make_recipe(self.user)
+        with connection.cursor() as cursor:
+            # As left by a row the data migration hasn't converted
+            cursor.execute('UPDATE recipes_recipe SET instructions = %s WHERE id = %s', ['Boil.', recipe.pk])
+        self.assertEqual(Recipe.objects.get(pk=recipe.pk).instructions, 'Boil.')
+
+    def test_only_isnull_lookups(self):
+        with self.assertRaises(FieldError):
+            Recipe.objects.filter(instructions__icontains='boil').exists()
+        self.assertFalse(Recipe.objects.filter(instructions__isnull=True).exists())
+
+    def test_training_reports_held_out_ratios(self):
+        for i in range(10):
+            make_recipe(self.user, instructions=f'{self.instructions}\nServe with bread #{i}.')
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir)
+        out = io.StringIO()
+        call_command('train_text_dictionary', output_dir=output_dir, holdout=0.2, stdout=out)
+        self.assertIn('from 16 texts', out.getvalue())
+        self.assertIn('Held out 4 texts', out.getvalue())
+
+
+class StubFetcher:
+    """
+    Stands in for the network: ``responses`` maps a URL to (bytes, content type).
+    """
+    def __init__(self, responses):
+        self.responses = responses
+        self.fetched = []
+
+    def fetch(self, url):
+        self.fetched.append(url)
+        if url not in self.responses:
+            raise images.ImageError('Upstream answered 404.')
+        return self.responses[url]
+
+
+class ImageProxyTests(TestCase):
+    url = '/api/images/'
+
+    def setUp(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        self.fetcher = StubFetcher({
+            'https://img.example.com/soup.png': (PNG, 'image/png'),
+            'https://img.example.com/logo.svg': (b'<svg><script>alert(1)</script></svg>', 'image/svg+xml'),
+        })
+        settings_override = override_settings(IMAGE_CACHE_DIR=cache_dir, IMAGE_FETCHER=self.fetcher)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        user = User.objects.create_user('cook', password='a-long-test-password')
+        make_recipe(user, image_url='https://img.example.com/soup.png')
+        make_recipe(user, image_url='https://img.example.com/logo.svg')
+
+    def test_fetches_once_and_serves_from_the_cache(self):
+        for _ in range(2):
+            response = self.client.get(self.url, {'url': 'https://img.example.com/soup.png'})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'image/png')
+            self.assertEqual(b''.join(response.streaming_content), PNG)
+            self.assertIn('sandbox', response['Content-Security-Policy'])
+        self.assertEqual(self.fetcher.fetched, ['https://img.example.com/soup.png'])
+
+        etag = response['ETag']
+        response = self.client.get(self.url, {'url': 'https://img.example.com/soup.png'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_refuses_urls_no_recipe_uses(self):
+        response = self.client.get(self.url, {'url': 'https://img.example.com/other.png'})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.fetcher.fetched, [])
+
+    def test_refuses_svg(self):
+        response = self.client.get(self.url, {'url': 'https://img.example.com/logo.svg'})
+        self.assertEqual(response.status_code, 502)
+
+    def test_does_not_serve_svg_stored_earlier(self):
+        images.get_store().put('https://img.example.com/logo.svg', b'<svg></svg>', 'image/svg+xml')
+        response = self.client.get(self.url, {'url': 'https://img.example.com/logo.svg'})
+        self.assertEqual(response.status_code, 404)
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == '/soup.png':
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/png')
+            self.send_header('Content-Length', str(len(PNG)))
+            self.end_headers()
+            self.wfile.write(PNG)
+        elif self.path.startswith('/redirect?to='):
+            self.send_response(302)
+            self.send_header('Location', self.path[len('/redirect?to='):])
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        else:
+            self.send_error(404)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _LoopbackFetcher(images.UrllibFetcher):
+    # The stand-in server runs on 127.0.0.1; every other address counts as private
+    def is_allowed(self, ip):
+        return str(ip) == '127.0.0.1'
+
+
+class UrllibFetcherTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), _StandInHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = f'http://127.0.0.1:{cls.server.server_port}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def test_fetch(self):
+        fetcher = _LoopbackFetcher(timeout=5)
+        self.assertEqual(fetcher.fetch(f'{self.base}/soup.png'), (PNG, 'image/png'))
+        self.assertEqual(fetcher.fetch(f'{self.base}/redirect?to=/soup.png'), (PNG, 'image/png'))
+
+    def test_private_hosts_are_refused(self):
+        with self.assertRaises(images.ImageNotFound):
+            images.UrllibFetcher(timeout=5, allow_private=False).fetch(f'{self.base}/soup.png')
+
+    def test_redirects_to_private_hosts_are_refused(self):
+        fetcher = _LoopbackFetcher(timeout=5)
+        port = self.server.server_port
+        for target in (f'http://127.0.0.2:{port}/soup.png', 'http://169.254.169.254/latest/meta-data/'):
+            with self.assertRaises(images.ImageNotFound):
+                fetcher.fetch(f'{self.base}/redirect?to={target}')
+
+    def test_upstream_errors(self):
+        with self.assertRaisesMessage(images.ImageError, 'Upstream answered 404.'):
+            _LoopbackFetcher(timeout=5).fetch(f'{self.base}/missing.png')
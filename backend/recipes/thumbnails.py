@@ -0,0 +1,55 @@
+"""
+Image resizing, run in worker processes by recipes/images.py.
+
+Kept free of Django imports so the process pool can start its workers
+cheaply. Needs Pillow (``pip install Pillow``); without it ``AVAILABLE``
+is False and the image proxy serves originals only.
+"""
+import os
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional
+    Image = None
+
+AVAILABLE = Image is not None
+
+# Format name -> Pillow encoder and options
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+
+
+def webp_supported():
+    if not AVAILABLE:
+        return False
+    from PIL import features
+    return features.check('webp')
+
+
+def render_variant(source_path, dest_path, width, fmt):
+    """
+    Write ``source_path`` scaled down to at most ``width`` pixels wide as
+    ``fmt`` to ``dest_path``. Images are never scaled up.
+    """
+    encoder, options = FORMATS[fmt]
+    with Image.open(source_path) as image:
+        image.draft('RGB', (width, width))  # lets JPEG decode at a reduced scale
+        image = ImageOps.exif_transpose(image)
+        if image.width > width:
+            height = max(1, round(image.height * width / image.width))
+            image = image.resize((width, height), Image.LANCZOS)
+        if encoder == 'JPEG' and image.mode != 'RGB':
+            # Flatten transparency onto white; JPEG has no alpha channel
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            if image.mode in ('RGBA', 'LA', 'P'):
+                image = image.convert('RGBA')
+                background.paste(image, mask=image.getchannel('A'))
+            else:
+                background.paste(image.convert('RGB'))
+            image = background
+        tmp_path = f'{dest_path}.{os.getpid()}.tmp'
+        image.save(tmp_path, encoder, **options)
+    os.replace(tmp_path, dest_path)
+    return dest_path
@@ -2,21 +2,33 @@ import React, { useState, useEffect, useRef, useCallback } from 'react';
 import axios from 'axios';
 import { useNavigate, useLocation } from 'react-router-dom';
 
+// Tiles per request; "Load more" follows the list's cursor for the next page
+const PAGE_SIZE = 24;
+// Select value for recipes without a cuisine, sent to the API as an empty ?cuisine=
+const UNCATEGORIZED = '__uncategorized__';
+
 function Dashboard({ apiBaseUrl, username, onLogout }) {
   const location = useLocation();
   const initialFocusRecipeIdRef = useRef(location.state?.focusRecipeId); 
+  // Bumped on every new search or filter so responses for an older one are dropped
+  const requestRef = useRef(0);
   
-  const [recipes, setRecipes] = useState([]);
+  const [recipes, setRecipes] = useState([]); // The pages loaded so far for the current search and filter
+  const [nextUrl, setNextUrl] = useState(null); // Cursor link to the next page, null on the last one
+  const [loadingMore, setLoadingMore] = useState(false);
   const [message, setMessage] = useState('');
   const [loading, setLoading] = useState(true);
   const [searchTerm, setSearchTerm] = useState('');
   const [debouncedSearchTerm, setDebouncedSearchTerm] = useState(''); 
-  const [filteredRecipes, setFilteredRecipes] = useState([]);
   const [cuisineFilter, setCuisineFilter] = useState(''); // New state for cuisine filter
-  const [uniqueCuisines, setUniqueCuisines] = useState([]); // New state for unique cuisines
+  const [cuisineFacets, setCuisineFacets] = useState([]); // Per-cuisine recipe counts from /recipes/facets/
   const [randomRecipeDisplay, setRandomRecipeDisplay] = useState(null); // New state for single random recipe display
+  const [suggestions, setSuggestions] = useState([]); // Typeahead titles and cuisines for the search box
   const navigate = useNavigate();
 
+  // Serve recipe images from the backend's image cache instead of hotlinking them
+  const imageSrc = (url, size) => `${apiBaseUrl}/images/?url=${encodeURIComponent(url)}&size=${size}`;
+
   // Effect for debouncing the search term
   useEffect(() => {
     const handler = setTimeout(() => {
@@ -28,95 +40,160 @@ function Dashboard({ apiBaseUrl, username, onLogout }) {
     };
   }, [searchTerm]);
 
-  // Search and Cuisine filtering logic
+  // Fetch typeahead suggestions for the debounced search term
   useEffect(() => {
-    let currentFiltered = recipes;
-
-    // Apply search term filter
-    if (debouncedSearchTerm.trim()) {
-      const searchLower = debouncedSearchTerm.toLowerCase();
-      currentFiltered = currentFiltered.filter(recipe => 
-        recipe.title?.toLowerCase().includes(searchLower) ||
-        recipe.cuisine_type?.toLowerCase().includes(searchLower) ||
-        recipe.description?.toLowerCase().includes(searchLower) ||
-        recipe.ingredients?.toLowerCase().includes(searchLower)
-      );
+    const query = debouncedSearchTerm.trim();
+    if (!query) {
+      setSuggestions([]);
+      return;
     }
+    let cancelled = false;
+    axios.get(`${apiBaseUrl}/recipes/autocomplete/`, { params: { q: query } })
+      .then(response => {
+        if (!cancelled) {
+          const titles = (response.data?.titles || []).map(item => item.title);
+          const cuisines = (response.data?.cuisines || []).map(item => item.cuisine);
+          setSuggestions([...new Set([...titles, ...cuisines])]);
+        }
+      })
+      .catch(() => {
+        if (!cancelled) {
+          setSuggestions([]);
+        }
+      });
+    return () => {
+      cancelled = true;
+    };
+  }, [debouncedSearchTerm, apiBaseUrl]);
 
-    // Apply cuisine filter
-    if (cuisineFilter) {
-      currentFiltered = currentFiltered.filter(recipe => 
-        (recipe.cuisine_type || 'Uncategorized') === cuisineFilter
-      );
+  // Earlier versions kept a full copy of the user's recipes in localStorage; free it
+  useEffect(() => {
+    try {
+      localStorage.removeItem(`recipes-sync:${username}`);
+    } catch {
+      // Storage disabled: nothing was stored either
     }
-    
-    setFilteredRecipes(currentFiltered);
-  }, [debouncedSearchTerm, cuisineFilter, recipes]); // Re-run when debouncedSearchTerm, cuisineFilter, or recipes change
+  }, [username]);
 
   // Function to focus on a specific recipe (now just navigates)
   const focusOnRecipe = useCallback((recipeId) => {
-    if (!recipes.length) {
-      return;
-    }
-
+    // The recipe may be on a page that isn't loaded yet; the detail page fetches it either way
     const targetRecipe = recipes.find(recipe => recipe.id === recipeId);
-    if (!targetRecipe) {
-      return;
-    }
+    if (targetRecipe) {
+      // Show a message about the focused recipe
+      const cuisineText = targetRecipe.cuisine_type ? ` in ${targetRecipe.cuisine_type} cuisine` : '';
+      setMessage(`📍 Showing "${targetRecipe.title}"${cuisineText}`);
 
-    // Show a message about the focused recipe
-    const cuisineText = targetRecipe.cuisine_type ? ` in ${targetRecipe.cuisine_type} cuisine` : '';
-    setMessage(`📍 Showing "${targetRecipe.title}"${cuisineText}`);
-
-    // Clear the message after 4 seconds
-    setTimeout(() => {
-      setMessage('');
-    }, 4000);
+      // Clear the message after 4 seconds
+      setTimeout(() => {
+        setMessage('');
+      }, 4000);
+    }
 
     // Navigate to the recipe's detail page
     navigate(`/recipes/${recipeId}`);
   }, [recipes, navigate]);
 
+  // The cuisine dropdown comes from the facet counters rather than from the loaded recipes,
+  // so it lists every cuisine without fetching every page
+  const fetchCuisines = useCallback(async () => {
+    try {
+      const response = await axios.get(`${apiBaseUrl}/recipes/facets/`);
+      const facets = (response.data?.cuisines || []).map(facet => ({
+        value: facet.cuisine ?? UNCATEGORIZED,
+        label: facet.cuisine ?? 'Uncategorized',
+        count: facet.count,
+      }));
+      setCuisineFacets(facets.sort((a, b) => a.label.localeCompare(b.label)));
+    } catch {
+      setCuisineFacets([]);
+    }
+  }, [apiBaseUrl]);
+
+  useEffect(() => {
+    fetchCuisines();
+  }, [fetchCuisines]);
+
+  // Load the first page for the current search and cuisine filter. Searches go to the
+  // full-text endpoint, which returns the best matches in one response; browsing asks the
+  // list endpoint for one page at a time and keeps its `next` link for "Load more".
   const fetchRecipes = useCallback(async () => {
-    setLoading(true);
+    const requestId = ++requestRef.current;
     setMessage('');
     try {
-      const response = await axios.get(`${apiBaseUrl}/recipes/`);
-      if (Array.isArray(response.data)) {
-        setRecipes(response.data);
-        // Extract unique cuisine types
-        const cuisines = [...new Set(response.data.map(r => r.cuisine_type || 'Uncategorized'))].sort();
-        setUniqueCuisines(cuisines);
+      const query = debouncedSearchTerm.trim();
+      let results;
+      let next = null;
+      if (query) {
+        const response = await axios.get(`${apiBaseUrl}/recipes/search/`, { params: { q: query, limit: 100 } });
+        results = (response.data?.results || []).filter(recipe =>
+          !cuisineFilter || (recipe.cuisine_type || UNCATEGORIZED) === cuisineFilter
+        );
       } else {
-        setRecipes([]);
-        setUniqueCuisines([]);
+        const params = { page_size: PAGE_SIZE };
+        if (cuisineFilter) {
+          params.cuisine = cuisineFilter === UNCATEGORIZED ? '' : cuisineFilter;
+        }
+        const response = await axios.get(`${apiBaseUrl}/recipes/`, { params });
+        results = response.data?.results || [];
+        next = response.data?.next || null;
+      }
+      if (requestId === requestRef.current) {
+        setRecipes(results);
+        setNextUrl(next);
       }
     } catch (error) {
+      if (requestId !== requestRef.current) {
+        return;
+      }
       setMessage('Failed to load recipes. Please ensure your backend is running and you are logged in.');
       if (error.response?.status === 403) {
         onLogout();
       }
       setRecipes([]);
-      setUniqueCuisines([]);
+      setNextUrl(null);
     } finally {
       setLoading(false);
     }
-  }, [apiBaseUrl, onLogout, setLoading]);
+  }, [apiBaseUrl, debouncedSearchTerm, cuisineFilter, onLogout]);
 
   useEffect(() => {
     fetchRecipes();
   }, [fetchRecipes]);
 
-  // Effect to handle focusing on a recipe after recipes are loaded
+  // Append the next page of the current listing
+  const handleLoadMore = async () => {
+    if (!nextUrl || loadingMore) {
+      return;
+    }
+    const requestId = requestRef.current;
+    setLoadingMore(true);
+    try {
+      const response = await axios.get(nextUrl);
+      if (requestId === requestRef.current) {
+        setRecipes(current => [...current, ...(response.data?.results || [])]);
+        setNextUrl(response.data?.next || null);
+      }
+    } catch (error) {
+      setMessage('Failed to load more recipes. Please try again.');
+      if (error.response?.status === 403) {
+        onLogout();
+      }
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
+  // Effect to handle focusing on a recipe after the first page is loaded
   useEffect(() => {
-    if (recipes.length > 0 && initialFocusRecipeIdRef.current) {
+    if (!loading && initialFocusRecipeIdRef.current) {
       const recipeToFocus = initialFocusRecipeIdRef.current;
       focusOnRecipe(recipeToFocus);
       initialFocusRecipeIdRef.current = null; // Clear the ref after use
       // Clear location state immediately after use
       navigate(location.pathname, { replace: true });
     }
-  }, [recipes, focusOnRecipe, navigate, location.pathname]);
+  }, [loading, focusOnRecipe, navigate, location.pathname]);
 
   const handleAddRecipeClick = () => {
     navigate('/recipes/new');
@@ -124,7 +201,7 @@ function Dashboard({ apiBaseUrl, username, onLogout }) {
 
   // Random recipe selection function
   const handleRandomRecipe = () => {
-    if (recipes.length === 0) { // Use full recipes list for random selection
+    if (recipes.length === 0) { // Picks from the recipes loaded so far
       setMessage('No recipes available for random selection!');
       return;
     }
@@ -141,6 +218,10 @@ function Dashboard({ apiBaseUrl, username, onLogout }) {
     }, 4000);
   };
 
+  // Browsing a single cuisine shows its full count even before every page is loaded
+  const selectedFacet = cuisineFacets.find(facet => facet.value === cuisineFilter);
+  const matchCount = !debouncedSearchTerm.trim() && selectedFacet ? selectedFacet.count : recipes.length;
+
   const handleCardClick = (recipeId) => {
     navigate(`/recipes/${recipeId}`);
   };
@@ -223,6 +304,7 @@ function Dashboard({ apiBaseUrl, username, onLogout }) {
             <input
               type="text"
               placeholder="Search by name, description..."
+              list="recipe-suggestions"
               value={searchTerm}
               onChange={(e) => {
                 setSearchTerm(e.target.value);
@@ -242,6 +324,11 @@ function Dashboard({ apiBaseUrl, username, onLogout }) {
               onFocus={(e) => e.target.style.borderColor = '#60A5FA'}
               onBlur={(e) => e.target.style.borderColor = '#4B5563'}
             />
+            <datalist id="recipe-suggestions">
+              {suggestions.map(suggestion => (
+                <option key={suggestion} value={suggestion} />
+              ))}
+            </datalist>
             <select
               value={cuisineFilter}
               onChange={(e) => {
@@ -262,9 +349,9 @@ function Dashboard({ apiBaseUrl, username, onLogout }) {
               }}
             >
               <option value="">All Cuisines</option>
-              {uniqueCuisines.map((cuisine, index) => (
-                <option key={index} value={cuisine}>
-                  {cuisine}
+              {cuisineFacets.map(facet => (
+                <option key={facet.value} value={facet.value}>
+                  {facet.label} ({facet.count})
                 </option>
               ))}
             </select>
@@ -276,8 +363,8 @@ function Dashboard({ apiBaseUrl, username, onLogout }) {
               minHeight: '18px'
             }}>
               {searchTerm || cuisineFilter
-                ? (filteredRecipes.length > 0 
-                  ? `Found ${filteredRecipes.length} recipe${filteredRecipes.length === 1 ? '' : 's'}`
+                ? (matchCount > 0 
+                  ? `Found ${matchCount} recipe${matchCount === 1 ? '' : 's'}`
                   : 'No recipes found')
                 : '\u00A0'
               }
@@ -453,7 +540,7 @@ function Dashboard({ apiBaseUrl, username, onLogout }) {
               }}>
                 {randomRecipeDisplay.image_url ? (
                   <img 
-                    src={randomRecipeDisplay.image_url} 
+                    src={imageSrc(randomRecipeDisplay.image_url, 'medium')} 
                     alt={randomRecipeDisplay.title} 
                     style={{ 
                       width: '100%', 
@@ -488,7 +575,7 @@ function Dashboard({ apiBaseUrl, username, onLogout }) {
               </div>
             </div>
           </div>
-        ) : filteredRecipes.length === 0 && (!searchTerm && !cuisineFilter) ? (
+        ) : recipes.length === 0 && (!searchTerm && !cuisineFilter) ? (
           <div style={{
             flex: 1,
             width: '100%',
@@ -508,7 +595,7 @@ function Dashboard({ apiBaseUrl, username, onLogout }) {
               </p>
             </div>
           </div>
-        ) : filteredRecipes.length === 0 && (searchTerm || cuisineFilter) ? (
+        ) : recipes.length === 0 && (searchTerm || cuisineFilter) ? (
           <div style={{
             flex: 1,
             display: 'flex',
@@ -540,7 +627,7 @@ function Dashboard({ apiBaseUrl, username, onLogout }) {
               alignContent: 'start' // Align content to the start when there are fewer items
             }} 
           >
-            {filteredRecipes.map(recipe => (
+            {recipes.map(recipe => (
               <div 
                 key={recipe.id} 
                 onClick={() => handleCardClick(recipe.id)}
@@ -575,7 +662,7 @@ function Dashboard({ apiBaseUrl, username, onLogout }) {
                 }}>
                   {recipe.image_url ? (
                     <img 
-                      src={recipe.image_url} 
+                      src={imageSrc(recipe.image_url, 'thumb')} 
                       alt={recipe.title} 
                       style={{ 
                         width: '100%', 
@@ -612,6 +699,32 @@ function Dashboard({ apiBaseUrl, username, onLogout }) {
             ))}
           </div>
         )}
+
+        {/* Only the first page is loaded up front; fetch the rest on demand */}
+        {!randomRecipeDisplay && nextUrl && (
+          <button 
+            onClick={handleLoadMore} 
+            disabled={loadingMore}
+            style={{
+              alignSelf: 'center',
+              marginTop: '20px',
+              padding: '12px 24px',
+              backgroundColor: '#3B82F6',
+              color: 'white',
+              border: 'none',
+              borderRadius: '8px',
+              cursor: loadingMore ? 'default' : 'pointer',
+              fontSize: '14px',
+              fontWeight: '500',
+              opacity: loadingMore ? 0.7 : 1,
+              transition: 'background-color 0.2s'
+            }}
+            onMouseOver={(e) => e.target.style.backgroundColor = '#2563EB'}
+            onMouseOut={(e) => e.target.style.backgroundColor = '#3B82F6'}
+          >
+            {loadingMore ? 'Loading...' : 'Load More Recipes'}
+          </button>
+        )}
       </div>
     </div>
   );
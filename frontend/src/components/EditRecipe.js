@@ -36,9 +36,9 @@ function EditRecipe({ apiBaseUrl }) {
         setExternalLink(recipeData.external_link || '');
         setCuisineType(recipeData.cuisine_type || ''); // Set the current recipe's cuisine type
 
-        // Fetch all recipes to get unique cuisine types
-        const allRecipesResponse = await axios.get(`${apiBaseUrl}/recipes/`);
-        const uniqueCuisines = [...new Set(allRecipesResponse.data.map(r => r.cuisine_type).filter(Boolean))];
+        // The user's cuisine types come from the facet counters, not from paging through every recipe
+        const facetsResponse = await axios.get(`${apiBaseUrl}/recipes/facets/`);
+        const uniqueCuisines = (facetsResponse.data?.cuisines || []).map(facet => facet.cuisine).filter(Boolean);
         setAllCuisines(uniqueCuisines);
 
         setFetchError('');